@@ -1,195 +1,295 @@
 import os
 import uuid
+import base64
+import hashlib
+import shutil
 import logging
-import ssl
+import json
+import threading
 import time
-import os
+from datetime import datetime, date, timedelta
+from urllib.parse import urlparse, unquote, urlunparse, quote
+from zoneinfo import ZoneInfo
 import requests
-import logging
-from datetime import datetime, date
-from flask import Flask, render_template, jsonify, request
+from flask import Flask, render_template, jsonify, request, flash, redirect, url_for, g
+from flask_socketio import SocketIO, emit, join_room
 from werkzeug.utils import secure_filename
+# Pillow, icalendar and dateutil are only imported by the code that needs them
+from calendar_feed import CalendarAggregator, CalendarFeedCache
+from recurrence import RecurrenceExpander
+from state_snapshot import load_snapshot, save_snapshot
+from ttl_cache import TTLCache
+from upstream_status import UpstreamStatus
+from unifi_session import ControllerSession
+from unifi_devices import DeviceRegistry
+from unifi_events import DoorbellEventFeed
+from snapshot_store import SnapshotStore, valid_snapshot_id
+from image_derivatives import choose_variant, remove_derivatives
+from image_index import ORDERS as IMAGE_ORDERS, ImageIndex
+from image_jobs import ImageJobQueue, process_image
+from upload_stream import stream_uploads
+from mjpeg_relay import BOUNDARY, FfmpegSource, SnapshotSource, StreamRelay
+from static_assets import StaticAssets
+from dashboard_state import DashboardState
+from background_lock import BackgroundLock
+from log_config import configure_logging, parse_logger_settings
+from metrics import (Collected, HTTP_REQUEST_SECONDS, HTTP_RESPONSES, SOCKETIO_EMIT_SECONDS,
+                     render as render_metrics, track_upstream)
 
-# Configure logging
-logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-# Weather API configuration
-WEATHER_API_KEY = os.environ.get('OPENWEATHERMAP_API_KEY')
-WEATHER_API_URL = 'https://api.openweathermap.org/data/2.5/weather'
-LAT = '37.7749'  # San Francisco latitude
-LON = '-122.4194'  # San Francisco longitude
-from datetime import datetime, date
-from functools import wraps
-from urllib.parse import urlparse, unquote, urlunparse, quote
-from werkzeug.utils import secure_filename
-from PIL import Image
-import certifi
-import requests
-import pytz
-from icalendar import Calendar, Event, vDDDTypes
-from flask import Flask, render_template, jsonify, request, flash, redirect, url_for
-from flask_socketio import SocketIO, emit
-import json
-import threading
-import time
-from requests.exceptions import SSLError, RequestException, ConnectionError
+# Logging, set up by create_app: written by a background thread to stdout and a rotating file
+LOG_LEVEL = os.environ.get('LOG_LEVEL', 'INFO')
+LOG_LEVELS = parse_logger_settings(os.environ.get('LOG_LEVELS', 'werkzeug=WARNING'))  # per logger
+LOG_SAMPLE = parse_logger_settings(os.environ.get('LOG_SAMPLE', ''))  # keep one in N records below WARNING
+LOG_FILE = os.environ.get('LOG_FILE', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'logs', 'dashboard.log'))
+LOG_FILE_MAX_MB = int(os.environ.get('LOG_FILE_MAX_MB', 5))
+LOG_FILE_BACKUPS = int(os.environ.get('LOG_FILE_BACKUPS', 3))
+LOG_REPEAT_LIMIT = int(os.environ.get('LOG_REPEAT_LIMIT', 5))  # identical warnings/errors per interval
+LOG_REPEAT_INTERVAL = int(os.environ.get('LOG_REPEAT_INTERVAL', 60))  # seconds
 
-logger = logging.getLogger(__name__)
-# Configure logging
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    handlers=[logging.StreamHandler()]
-)
-
-# Initialize Flask app with static folder
+# Static and images folders, created by create_app with proper permissions for Raspberry Pi
 static_folder = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'static')
-if not os.path.exists(static_folder):
-    os.makedirs(static_folder)
-
-# Create images folder with proper permissions for Raspberry Pi
 images_folder = os.path.join(static_folder, 'images')
-try:
-    if not os.path.exists(images_folder):
-        os.makedirs(images_folder, mode=0o755, exist_ok=True)
-    # Ensure proper permissions even if directory already exists
-    os.chmod(images_folder, 0o755)
-    logger.info(f"Successfully created/verified images folder: {images_folder}")
-except Exception as e:
-    logger.error(f"Error setting up images folder: {str(e)}")
-    raise
+
+# Display-size copies of the carousel photos, made in the background after upload
+derived_folder = os.path.join(images_folder, 'derived')
+IMAGE_WORKERS = int(os.environ.get('IMAGE_WORKERS', 2))  # processes for image work
+IMAGE_RESCAN_INTERVAL = int(os.environ.get('IMAGE_RESCAN_INTERVAL', 60))  # seconds
+IMAGE_PAGE_SIZE = 100
+IMAGE_MAX_PAGE_SIZE = 500
+
+# Snapshot of parsed upstream data for warm starts, plus state shared between worker processes
+DATA_FOLDER = os.environ.get('DASHBOARD_DATA_DIR', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data'))
+SNAPSHOT_PATH = os.path.join(DATA_FOLDER, 'snapshot.json')
 
 # Initialize Flask app
 app = Flask(__name__, static_folder=static_folder)
-app.config['MAX_CONTENT_LENGTH'] = 50 * 1024 * 1024  # 50MB max request size
+# Uploads are streamed to disk, so a batch can be much larger than memory
+UPLOAD_MAX_FILE_MB = int(os.environ.get('UPLOAD_MAX_FILE_MB', 25))
+UPLOAD_MAX_BATCH_MB = int(os.environ.get('UPLOAD_MAX_BATCH_MB', 1024))
+UPLOAD_MAX_FILE_SIZE = UPLOAD_MAX_FILE_MB * 1024 * 1024
+app.config['MAX_CONTENT_LENGTH'] = UPLOAD_MAX_BATCH_MB * 1024 * 1024  # max request size
 app.secret_key = os.urandom(24)
 
-# Initialize SocketIO
-socketio = SocketIO(app, cors_allowed_origins="*", async_mode='eventlet')
+# Static files: fingerprinted URLs, long-lived caching and precompressed text assets
+static_assets = StaticAssets(static_folder)
+app.view_functions['static'] = static_assets.send
+
+@app.url_defaults
+def fingerprint_static_url(endpoint, values):
+    """Add the content hash to url_for('static', ...) so the file can be cached for good"""
+    if endpoint == 'static' and 'v' not in values:
+        fingerprint = static_assets.fingerprint(values.get('filename', ''))
+        if fingerprint:
+            values['v'] = fingerprint
+
+def precompress_static_assets():
+    try:
+        static_assets.precompress()
+    except Exception as e:
+        logger.error("Error precompressing static assets: %s", e)
+
+# SocketIO is bound to the app by create_app; DASHBOARD_WORKER has to match the monkey
+# patching done by main.py. With several worker processes a message queue (e.g.
+# redis://127.0.0.1:6379/0) carries each broadcast to the panels connected to the other workers
+DASHBOARD_WORKER = os.environ.get('DASHBOARD_WORKER', 'eventlet')
+SOCKETIO_MESSAGE_QUEUE = os.environ.get('SOCKETIO_MESSAGE_QUEUE', '').strip() or None
+socketio = SocketIO()
+
+def broadcast(event, data, **kwargs):
+    """socketio.emit, timing how long the fan-out to the clients takes"""
+    with SOCKETIO_EMIT_SECONDS.time(event):
+        socketio.emit(event, data, **kwargs)
+
+# Only one worker process runs the background pollers
+background_lock = BackgroundLock(os.path.join(DATA_FOLDER, 'background.lock'))
 
 # Store active WebSocket connections
 ws_connections = set()
 
+# Latest weather, calendar window, image catalog version and doorbell status,
+# sent to each panel on connect and then as versioned diffs to the room
+DASHBOARD_ROOM = 'dashboard'
+dashboard_state = DashboardState(
+    lambda diff: broadcast('dashboard_diff', diff, to=DASHBOARD_ROOM),
+    mirror_path=os.path.join(DATA_FOLDER, 'dashboard_state.json') if SOCKETIO_MESSAGE_QUEUE else None,
+    leader=False  # until start_background_services takes the background lock
+)
+
+# Last refresh outcome of each upstream, reported by /health/ready
+weather_status = UpstreamStatus('weather')
+unifi_status = UpstreamStatus('unifi')
+# Written by the worker running the pollers, read by the others for their readiness report
+UPSTREAM_STATUS_PATH = os.path.join(DATA_FOLDER, 'upstreams.json')
+UPSTREAM_STATUS_INTERVAL = 15  # seconds
+
+# Shared UniFi controller session, created on first use
+unifi_session = None
+unifi_session_lock = threading.Lock()
+
 def get_protect_api():
-    """Get UniFi API connection"""
-    try:
-        from pyunifi.controller import Controller
-        controller = Controller(
-            host=os.environ['UNIFI_HOST'],
-            username=os.environ['UNIFI_USERNAME'],
-            password=os.environ['UNIFI_PASSWORD'],
-            version='UDMP-unifiOS',
-            port=int(os.environ['UNIFI_PORT']),
-            ssl_verify=False
-        )
-        return controller
-    except Exception as e:
-        logger.error(f"Error connecting to UniFi API: {str(e)}")
+    """Get the shared UniFi controller session"""
+    global unifi_session
+    with unifi_session_lock:
+        if unifi_session is None:
+            try:
+                unifi_session = ControllerSession(
+                    host=os.environ['UNIFI_HOST'],
+                    username=os.environ['UNIFI_USERNAME'],
+                    password=os.environ['UNIFI_PASSWORD'],
+                    version='UDMP-unifiOS',
+                    port=int(os.environ['UNIFI_PORT']),
+                    ssl_verify=False,
+                    status=unifi_status
+                )
+            except Exception as e:
+                logger.error("Error connecting to UniFi API: %s", e)
+                return None
+        return unifi_session
+
+# Device inventory indexed by MAC and model, refreshed on a slow interval
+UNIFI_DEVICE_REFRESH_INTERVAL = int(os.environ.get('UNIFI_DEVICE_REFRESH_INTERVAL', 300))  # seconds
+device_registry = None
+
+# Doorbell events arrive over the controller's websocket; polling is the fallback
+UNIFI_EVENT_STREAM = os.environ.get('UNIFI_EVENT_STREAM', 'true').lower() not in ('0', 'false', 'no')
+UNIFI_EVENT_MAX_POLL_INTERVAL = int(os.environ.get('UNIFI_EVENT_MAX_POLL_INTERVAL', 10))  # seconds
+doorbell_events = None
+
+# Doorbell snapshots, kept as JPEG bytes and served by URL rather than inlined in events
+DOORBELL_SNAPSHOT_CACHE_SIZE = int(os.environ.get('DOORBELL_SNAPSHOT_CACHE_SIZE', 50))
+# On disk too, so every worker can serve the snapshot the leader just announced
+DOORBELL_SNAPSHOT_DIR = os.environ.get('DOORBELL_SNAPSHOT_DIR', '').strip() or os.path.join(DATA_FOLDER, 'snapshots')
+DOORBELL_SNAPSHOT_REUSE = 1  # seconds a snapshot is shared between events
+snapshot_store = SnapshotStore(max_items=DOORBELL_SNAPSHOT_CACHE_SIZE, directory=DOORBELL_SNAPSHOT_DIR)
+snapshot_fetches = TTLCache(ttl=DOORBELL_SNAPSHOT_REUSE)
+
+# Live view: one upstream connection per camera, relayed to every viewer
+DOORBELL_STREAM_SOURCE = os.environ.get('DOORBELL_STREAM_SOURCE', 'auto').lower()  # auto, ffmpeg or snapshot
+DOORBELL_STREAM_FPS = int(os.environ.get('DOORBELL_STREAM_FPS', 5))
+stream_relays = {}
+stream_relays_lock = threading.Lock()
+
+def get_device_registry():
+    """Get the shared UniFi device registry"""
+    global device_registry
+    controller = get_protect_api()
+    if not controller:
         return None
+    with unifi_session_lock:
+        if device_registry is None:
+            device_registry = DeviceRegistry(controller, refresh_interval=UNIFI_DEVICE_REFRESH_INTERVAL)
+            device_registry.listeners.append(publish_doorbells)
+        return device_registry
+
+def publish_doorbells(registry):
+    """Give the dashboards the doorbell list each time the device registry is refreshed"""
+    dashboard_state.patch('doorbell', {
+        'doorbells': [{'mac': d['mac'], 'name': d.get('name', 'Doorbell')} for d in registry.doorbells()]
+    })
+
+def load_doorbell_snapshot(mac):
+    """Download the doorbell's current view as JPEG bytes"""
+    snapshot_response = get_protect_api().post('snapshots', {'mac': mac})
+    if not snapshot_response or 'data' not in snapshot_response:
+        raise ValueError('No snapshot data received')
+    return base64.b64decode(snapshot_response['data'])
+
+def fetch_doorbell_snapshot(mac):
+    """Snapshot for a new event; events from the same camera within a second share one fetch"""
+    entry = snapshot_fetches.peek(mac)
+    if entry is None or time.time() - entry[1] >= DOORBELL_SNAPSHOT_REUSE:
+        snapshot_fetches.misses += 1
+        entry = snapshot_fetches.refresh(mac, lambda: load_doorbell_snapshot(mac))
+    else:
+        snapshot_fetches.hits += 1
+    return entry[0]
+
+def deliver_doorbell_snapshot(snapshot_id, mac):
+    """Store the snapshot for an event and tell the dashboards where to find it"""
+    try:
+        snapshot_store.put(snapshot_id, fetch_doorbell_snapshot(mac))
+        snapshot = {
+            'id': snapshot_id,
+            'thumbnail': f"/api/doorbell/snapshot/{snapshot_id}"
+        }
+        broadcast('doorbell_snapshot', snapshot)
+        dashboard_state.patch('doorbell', {'last_snapshot': snapshot})
+    except Exception as snap_err:
+        logger.error("Error getting snapshot: %s", snap_err)
+
+def handle_doorbell_event(doorbell, event):
+    """Push a doorbell event to the dashboards, then follow up with its snapshot"""
+    mac = doorbell['mac']
+    event_id = event.get('_id') if valid_snapshot_id(event.get('_id')) else uuid.uuid4().hex
+    event_data = {
+        'id': event_id,
+        'type': event.get('eventType', '').lower(),
+        'timestamp': datetime.fromtimestamp(event.get('time', 0) / 1000).isoformat(),
+        'thumbnail': None,
+        'camera_name': doorbell.get('name', 'Doorbell'),
+        'mac': mac
+    }
+    broadcast('doorbell_event', event_data)
+    dashboard_state.patch('doorbell', {'last_event': event_data})
+    logger.info("Doorbell event emitted: %s from %s", event_data['type'], event_data['camera_name'])
+
+    # Fetched off the event thread so the snapshot never delays the next ring
+    threading.Thread(target=deliver_doorbell_snapshot, args=(event_id, mac), daemon=True).start()
 
 def doorbell_event_monitor():
     """Monitor doorbell events in background thread"""
-    last_event_time = datetime.now()
+    global doorbell_events
     retry_interval = 1
     max_retry_interval = 30
     
+    # Wait for the controller, then hand over to the event feed for good
     while True:
-        try:
-            controller = get_protect_api()
-            if not controller:
-                logger.error("Failed to connect to UniFi controller")
-                time.sleep(retry_interval)
-                continue
-            
-            # Get all devices
-            devices = controller.get_devices()
-            if not devices:
-                logger.warning("No devices found")
-                time.sleep(retry_interval)
-                continue
-            
-            # Find the doorbell camera
-            doorbell = next((dev for dev in devices if 'G4 Doorbell' in dev.get('model', '')), None)
-            
-            if doorbell:
-                # Get device events using API
-                try:
-                    events = controller._api_post('stat/event', {'_limit': 10, 'mac': doorbell['mac']})
-                    current_time = datetime.now()
-                    
-                    if events:
-                        for event in events:
-                            event_time = datetime.fromtimestamp(event.get('time', 0) / 1000)
-                            if event_time > last_event_time:
-                                event_type = event.get('eventType', '').lower()
-                                if event_type in ['ring', 'motion']:
-                                    # Get snapshot using API
-                                    snapshot_url = None
-                                    try:
-                                        snapshot_response = controller._api_post(
-                                            'snapshots',
-                                            {'mac': doorbell['mac']}
-                                        )
-                                        if snapshot_response and 'data' in snapshot_response:
-                                            snapshot_url = f"data:image/jpeg;base64,{snapshot_response['data']}"
-                                    except Exception as snap_err:
-                                        logger.error(f"Error getting snapshot: {snap_err}")
-                                
-                                event_data = {
-                                    'type': event_type,
-                                    'timestamp': event_time.isoformat(),
-                                    'thumbnail': snapshot_url,
-                                    'camera_name': doorbell.get('name', 'Doorbell')
-                                }
-                                
-                                if ws_connections:
-                                    socketio.emit('doorbell_event', event_data, broadcast=True)
-                                    logger.info(f"Doorbell event emitted: {event_type} from {event_data['camera_name']}")
-                    
-                    last_event_time = current_time
-                    retry_interval = 1  # Reset retry interval on success
-                
-                event_data = {
-                                        'type': event_type,
-                                        'timestamp': event_time.isoformat(),
-                                        'thumbnail': snapshot_url,
-                                        'camera_name': doorbell.get('name', 'Doorbell')
-                                    }
-                                    
-                                    if ws_connections:
-                                        socketio.emit('doorbell_event', event_data, broadcast=True)
-                                        logger.info(f"Doorbell event emitted: {event_type} from {event_data['camera_name']}")
-                        
-                        last_event_time = current_time
-                        retry_interval = 1  # Reset retry interval on success
-            
-            time.sleep(1)  # Check for events every second
-            
-        except Exception as e:
-            logger.error(f"Error in doorbell event monitor: {str(e)}")
-            retry_interval = min(retry_interval * 2, max_retry_interval)  # Exponential backoff
-            time.sleep(retry_interval)
+        registry = get_device_registry()
+        if registry:
+            break
+        logger.error("Failed to connect to UniFi controller")
+        time.sleep(retry_interval)
+        retry_interval = min(retry_interval * 2, max_retry_interval)  # Exponential backoff
+    
+    # The registry loads on the feed's first (guarded) poll and publishes the doorbell list itself
+    doorbell_events = DoorbellEventFeed(
+        get_protect_api(),
+        registry,
+        handle_doorbell_event,
+        use_stream=UNIFI_EVENT_STREAM,
+        max_poll_interval=UNIFI_EVENT_MAX_POLL_INTERVAL
+    )
+    doorbell_events.run()
 
 @socketio.on('connect')
-def handle_connect():
+def handle_connect(auth=None):
     """Handle new WebSocket connections"""
     ws_connections.add(request.sid)
-    logger.info(f"New WebSocket connection: {request.sid}")
+    join_room(DASHBOARD_ROOM)
+    # A panel that reconnects says what it has and only gets what it missed
+    auth = auth if isinstance(auth, dict) else {}
+    dashboard_state.catch_up(auth.get('epoch'), auth.get('version'), emit)
+    logger.debug("New WebSocket connection: %s", request.sid)
+
+@socketio.on('dashboard_sync')
+def handle_dashboard_sync(have=None):
+    """Resend what a panel is missing after it saw a gap in the diffs"""
+    have = have if isinstance(have, dict) else {}
+    dashboard_state.catch_up(have.get('epoch'), have.get('version'), emit)
 
 @socketio.on('disconnect')
 def handle_disconnect():
     """Handle WebSocket disconnections"""
     if request.sid in ws_connections:
         ws_connections.remove(request.sid)
-    logger.info(f"WebSocket disconnected: {request.sid}")
-
-# Start doorbell event monitor in background thread
-doorbell_thread = threading.Thread(target=doorbell_event_monitor, daemon=True)
-doorbell_thread.start()
+    logger.debug("WebSocket disconnected: %s", request.sid)
 
-# Set default umask for new files
-os.umask(0o022)
+@socketio.on('watch_upload_batch')
+def handle_watch_upload_batch(batch_id):
+    """Subscribe the upload page to progress of its batch"""
+    join_room(f"upload:{batch_id}")
 
 # Ensure static directory exists with proper permissions
 def ensure_static_directory():
@@ -198,13 +298,13 @@ def ensure_static_directory():
         # Create base static directory if it doesn't exist
         if not os.path.exists(static_folder):
             os.makedirs(static_folder, mode=0o755)
-            logger.info(f"Created static folder: {static_folder}")
+            logger.info("Created static folder: %s", static_folder)
         
         # Create images directory if it doesn't exist
         images_dir = os.path.join(static_folder, 'images')
         if not os.path.exists(images_dir):
             os.makedirs(images_dir, mode=0o775)
-            logger.info(f"Created images folder: {images_dir}")
+            logger.info("Created images folder: %s", images_dir)
         
         # Set proper permissions
         os.chmod(static_folder, 0o755)
@@ -212,65 +312,118 @@ def ensure_static_directory():
         
         logger.info("Static directory permissions verified")
     except Exception as e:
-        logger.error(f"Error setting up static directory: {str(e)}")
+        logger.error("Error setting up static directory: %s", e)
         raise
 
-# Initialize static directory
-ensure_static_directory()
 @app.errorhandler(413)
 def request_entity_too_large(error):
-    flash('File too large! Maximum total upload size is 50MB', 'danger')
+    flash(f"File too large! Maximum total upload size is {UPLOAD_MAX_BATCH_MB}MB", 'danger')
     return redirect(url_for('upload_photo'))
 
-logger.info(f"Initialized Flask app with static folder: {static_folder}")
-
-# Configure default SSL context
-default_ssl_context = ssl.create_default_context(cafile=certifi.where())
+# Catalog of the stored images: content hashes (to reject duplicate uploads) and metadata
+image_index = ImageIndex(os.path.join(DATA_FOLDER, 'images.db'))
 
 # Weather API configuration
 WEATHER_API_KEY = os.environ.get('OPENWEATHERMAP_API_KEY', '').strip()
-WEATHER_API_URL = "https://api.openweathermap.org/data/2.5/weather"
+WEATHER_API_URL = os.environ.get('OPENWEATHERMAP_API_URL', 'https://api.openweathermap.org/data/2.5/weather')
+WEATHER_CACHE_TTL = int(os.environ.get('WEATHER_CACHE_TTL', 600))  # seconds
 # Coordinates for Minden, NV 89423
 LAT = 39.050621476386205
 LON = -119.7448038956499
 
 # iCal Feed configuration
 ICAL_FEED_URL = os.environ.get('ICAL_FEED_URL', '').strip()
+# Several feeds as JSON: [{"url": ..., "name": ..., "color": "#4caf50", "ttl": 600}, ...]
+ICAL_FEEDS = os.environ.get('ICAL_FEEDS', '').strip()
+CALENDAR_FETCH_WORKERS = int(os.environ.get('CALENDAR_FETCH_WORKERS', 4))
+CALENDAR_CACHE_TTL = int(os.environ.get('CALENDAR_CACHE_TTL', 300))  # seconds
+CALENDAR_HORIZON_DAYS = int(os.environ.get('CALENDAR_HORIZON_DAYS', 90))  # recurrence expansion
+CALENDAR_WINDOW_DAYS = int(os.environ.get('CALENDAR_WINDOW_DAYS', 3))  # days shown on the dashboard
+CALENDAR_TIMEZONE = ZoneInfo('America/Los_Angeles')
+
+@app.before_request
+def start_request_timer():
+    g.request_started = time.perf_counter()
 
 @app.after_request
 def after_request(response):
-    """Add CORS headers to all responses"""
+    """Add CORS headers to all responses and record the request's latency"""
     response.headers.add('Access-Control-Allow-Origin', '*')
     response.headers.add('Access-Control-Allow-Headers', 'Content-Type')
     response.headers.add('Access-Control-Allow-Methods', 'GET, POST, OPTIONS')
+    started = g.get('request_started')
+    if started is not None:
+        # By route pattern, so every snapshot ID or static file shares one series
+        route = request.url_rule.rule if request.url_rule else 'unmatched'
+        HTTP_REQUEST_SECONDS.observe(time.perf_counter() - started, route, request.method)
+        HTTP_RESPONSES.inc(route, request.method, response.status_code)
     return response
 
 @app.route('/health')
 def health_check():
-    """Enhanced health check endpoint"""
-    try:
-        weather_response = requests.get(
-            WEATHER_API_URL,
-            params={'lat': LAT, 'lon': LON, 'appid': WEATHER_API_KEY},
-            timeout=5
-        )
-        weather_response.raise_for_status()
-        logger.info("Health check performed")
-        return jsonify({
-            'status': 'healthy',
-            'timestamp': datetime.now().isoformat(),
-            'apis': {
-                'weather': 'connected',
-                'calendar': ICAL_FEED_URL is not None
-            }
-        }), 200
-    except Exception as e:
-        logger.error(f"Health check failed: {str(e)}")
-        return jsonify({
-            'status': 'unhealthy',
-            'error': str(e),
-            'timestamp': datetime.now().isoformat()
-        }), 503
+    """Liveness check: answers without touching any upstream service"""
+    return jsonify({
+        'status': 'healthy',
+        'timestamp': datetime.now().isoformat()
+    }), 200
+
+def upstream_statuses():
+    """The status of every configured upstream, by name"""
+    upstreams = {}
+    if WEATHER_API_KEY:
+        upstreams['weather'] = weather_status
+    if calendar_cache:
+        for feed in calendar_cache.feeds:
+            upstreams[feed.status.name] = feed.status
+    if os.environ.get('UNIFI_HOST'):
+        upstreams['unifi'] = unifi_status
+    return upstreams
+
+@app.route('/health/ready')
+def readiness_check():
+    """Readiness check built from the state recorded by the background refreshers"""
+    upstreams = upstream_statuses()
+    report = {name: status.as_dict() for name, status in upstreams.items()}
+    if 'unifi' in report and unifi_session:
+        report['unifi']['session'] = unifi_session.stats()
+        if doorbell_events:
+            report['unifi']['events'] = doorbell_events.stats()
+        if stream_relays:
+            report['unifi']['streams'] = {mac: relay.stats() for mac, relay in stream_relays.items()}
+
+    ready = all(status.ready for status in upstreams.values())
+    return jsonify({
+        'status': 'ready' if ready else 'not ready',
+        'timestamp': datetime.now().isoformat(),
+        'upstreams': report,
+        'dashboard': dict(dashboard_state.stats(), connections=len(ws_connections))
+    }), 200 if ready else 503, {} if ready else {'Retry-After': str(UPSTREAM_STATUS_INTERVAL)}
+
+def not_loaded_yet(message):
+    """503 from a follower whose copy of the leader's data is still empty"""
+    return jsonify({'error': message}), 503, {'Retry-After': str(background_lock.retry_interval)}
+
+# Read when /metrics is scraped, so they cost nothing in between
+Collected('dashboard_socketio_connections', 'Socket.IO clients connected to this process',
+          lambda: len(ws_connections))
+Collected('dashboard_state_version', 'Version of the dashboard state sent to panels',
+          lambda: dashboard_state.version)
+Collected('dashboard_cache_lookups_total', 'Cache lookups by result (hit, stale or miss)',
+          lambda: {
+              (name, result): getattr(cache, attr)
+              for name, cache in (('weather', weather_cache), ('doorbell_snapshot', snapshot_fetches),
+                                  ('calendar', calendar_cache))
+              if cache is not None
+              for result, attr in (('hit', 'hits'), ('stale', 'stale_hits'), ('miss', 'misses'))
+          }, labels=('cache', 'result'), kind='counter')
+Collected('dashboard_image_jobs', 'Image processing jobs waiting or running',
+          lambda: {(status,): count for status, count in image_jobs.stats().items() if status != 'workers'},
+          labels=('status',))
+
+@app.route('/metrics')
+def get_metrics():
+    """Request, upstream, cache and Socket.IO metrics in the Prometheus text format"""
+    return app.response_class(render_metrics(), mimetype='text/plain; version=0.0.4')
 
 def convert_webcal_to_https(url):
     """Convert webcal:// URLs to https:// with proper URL encoding"""
@@ -281,7 +434,7 @@ def convert_webcal_to_https(url):
 
         parsed = urlparse(unquote(url))
         if not parsed.scheme or parsed.scheme not in ['webcal', 'http', 'https']:
-            logger.error(f"Invalid URL scheme: {parsed.scheme}")
+            logger.error("Invalid URL scheme: %s", parsed.scheme)
             return None
 
         new_scheme = 'https' if parsed.scheme == 'webcal' else parsed.scheme
@@ -290,196 +443,470 @@ def convert_webcal_to_https(url):
 
         return urlunparse(parsed._replace(scheme=new_scheme, path=encoded_path, query=encoded_query))
     except Exception as e:
-        logger.error(f"Error converting URL: {str(e)}")
+        logger.error("Error converting URL: %s", e)
         return None
 
-def rate_limit_decorator(min_interval=1):
-    """Ensure minimum interval between API calls"""
-    last_call_time = {}
-    def decorator(func):
-        @wraps(func)
-        def wrapper(*args, **kwargs):
-            current_time = time.time()
-            if func.__name__ in last_call_time:
-                elapsed = current_time - last_call_time[func.__name__]
-                if elapsed < min_interval:
-                    return jsonify({
-                        'error': 'Too many requests. Please wait before retrying.',
-                        'retry_after': min_interval - elapsed
-                    }), 429
-            last_call_time[func.__name__] = current_time
-            return func(*args, **kwargs)
-        return wrapper
-    return decorator
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png')
+
+def handle_image_job(job):
+    """Record processed images in the catalog and report job progress to the upload page"""
+    if job['status'] == 'done':
+        image_index.update_metadata(job['filename'], job['result'])
+    elif job['status'] == 'failed' and job['batch']:
+        # A fresh upload that is not a readable image is not kept
+        filepath = os.path.join(images_folder, job['filename'])
+        image_index.remove(job['filename'])
+        if os.path.exists(filepath):
+            try:
+                os.remove(filepath)
+            except OSError as rm_err:
+                logger.error("Error removing invalid file %s: %s", filepath, rm_err)
+    publish_image_catalog()
+    if job['batch']:
+        broadcast('image_job', {key: job[key] for key in ('id', 'batch', 'filename', 'status', 'error')},
+                  to=f"upload:{job['batch']}")
+
+def publish_image_catalog():
+    """Tell the dashboards the catalog version, so carousels refetch only when it moves"""
+    dashboard_state.update('images', {'version': image_index.version})
+
+image_jobs = ImageJobQueue(process_image, max_workers=IMAGE_WORKERS, on_update=handle_image_job)
+
+def queue_derivatives(filename, batch=None):
+    """Verify an image and make its display-size copies in the worker processes"""
+    return image_jobs.submit(filename, os.path.join(images_folder, filename), derived_folder, batch=batch)
+
+def file_sha256(path):
+    """SHA-256 of a file, read in chunks"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(64 * 1024), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def rescan_images():
+    """Bring the catalog in line with the images folder.
+
+    Picks up files copied in or changed outside the upload page, drops
+    deleted ones (with their display sizes) and queues processing for any
+    image whose metadata is missing.
+    """
+    entries = image_index.entries()
+    on_disk = set()
+    for filename in os.listdir(images_folder):
+        if not filename.lower().endswith(IMAGE_EXTENSIONS):
+            continue
+        on_disk.add(filename)
+        filepath = os.path.join(images_folder, filename)
+        mtime = os.path.getmtime(filepath)
+        entry = entries.get(filename)
+        if entry is None or entry['mtime'] != mtime:
+            image_index.add(file_sha256(filepath), filename, os.path.getsize(filepath), mtime)
+            queue_derivatives(filename)
+        elif entry['manifest'] is None:
+            queue_derivatives(filename)
+    for filename in set(entries) - on_disk:
+        image_index.remove(filename)
+        if entries[filename]['manifest']:
+            remove_derivatives(derived_folder, entries[filename]['manifest'])
+        logger.info("Removed deleted image from catalog: %s", filename)
+
+def image_rescan_monitor():
+    """Rescan the images folder in background thread whenever its contents change"""
+    last_mtime = None
+    while True:
+        try:
+            mtime = os.stat(images_folder).st_mtime
+            if mtime != last_mtime:
+                rescan_images()
+                last_mtime = mtime
+            publish_image_catalog()
+        except Exception as e:
+            logger.error("Error rescanning images: %s", e)
+        time.sleep(IMAGE_RESCAN_INTERVAL)
 
 @app.route('/api/images')
 def get_images():
-    """Return a list of all images in the static/images directory"""
+    """List the carousel images from the catalog, each as the display size that suits the client.
+
+    ``width`` is the viewport width in device pixels, ``format`` is ``webp``
+    or ``jpeg`` and ``order`` is ``name``, ``date``, ``added`` or ``shuffle``
+    (with ``seed`` to keep a shuffle stable across pages). Results are
+    paginated with ``page`` and ``per_page``. Images without display sizes
+    yet fall back to the original upload.
+    """
     try:
-        image_dir = os.path.join(str(app.static_folder), 'images')
-        images = [f for f in os.listdir(image_dir) if f.lower().endswith(('.jpg', '.jpeg', '.png'))]
-        return jsonify({'images': sorted(images)})
+        width = request.args.get('width', type=int)
+        image_format = request.args.get('format', 'jpeg')
+        order = request.args.get('order', 'name')
+        seed = request.args.get('seed', '')
+        page = request.args.get('page', 1, type=int)
+        per_page = request.args.get('per_page', IMAGE_PAGE_SIZE, type=int)
+        if image_format not in ('webp', 'jpeg'):
+            return jsonify({'error': 'Invalid format'}), 400
+        if order not in IMAGE_ORDERS:
+            return jsonify({'error': 'Invalid order'}), 400
+        if page < 1 or not 1 <= per_page <= IMAGE_MAX_PAGE_SIZE:
+            return jsonify({'error': 'Invalid page or per_page'}), 400
+
+        # The catalog version covers every change, so revalidation needs no query
+        version = image_index.version
+        etag = hashlib.blake2b(
+            f"{version}:{width}:{image_format}:{order}:{seed}:{page}:{per_page}".encode(), digest_size=16
+        ).hexdigest()
+        if request.if_none_match.contains(etag):
+            response = app.response_class(status=304)
+            response.set_etag(etag)
+            return response
+
+        listing = image_index.listing(order, seed)
+        images = []
+        for entry in listing[(page - 1) * per_page:page * per_page]:
+            image = {
+                'name': entry['filename'],
+                'width': entry['width'],
+                'height': entry['height'],
+                'orientation': entry['orientation'],
+                'captured_at': entry['captured_at'],
+                'placeholder': None
+            }
+            manifest = entry['manifest']
+            # Display sizes are made from the original, so its hash versions them too
+            version_tag = entry['sha256'][:16]
+            if manifest is None:
+                image['src'] = url_for('static', filename=f"images/{entry['filename']}", v=version_tag)
+            else:
+                variant = choose_variant(manifest, width)
+                image.update(
+                    src=url_for('static', filename=f"images/derived/{variant.get(image_format, variant['jpeg'])}",
+                                v=version_tag),
+                    width=variant['width'],
+                    height=variant['height'],
+                    placeholder=manifest['placeholder']
+                )
+            images.append(image)
+
+        response = jsonify({
+            'images': images,
+            'total': len(listing),
+            'page': page,
+            'per_page': per_page,
+            'order': order,
+            'version': version
+        })
+        response.headers['Cache-Control'] = 'no-cache'
+        response.set_etag(etag)
+        return response
     except Exception as e:
-        logger.error(f"Error listing images: {str(e)}")
+        logger.error("Error listing images: %s", e)
         return jsonify({'error': str(e)}), 500
 
 @app.route('/upload', methods=['GET', 'POST'])
 def upload_photo():
     if request.method == 'POST':
-        if 'photos' not in request.files:
-            flash('No files selected', 'danger')
-            return redirect(request.url)
-        
-        photos = request.files.getlist('photos')
-        if not photos:
+        # The body is streamed to disk part by part instead of parsed into request.files
+        boundary = request.mimetype_params.get('boundary')
+        if request.mimetype != 'multipart/form-data' or not boundary:
             flash('No files selected', 'danger')
             return redirect(request.url)
         
         success_count = 0
         error_count = 0
+        duplicate_count = 0
+        batch_id = uuid.uuid4().hex
+        
+        # Ensure the images directory exists with proper permissions
+        ensure_static_directory()
         
-        for photo in photos:
-            if not photo.filename:
+        uploads = stream_uploads(request.stream, boundary, 'photos', images_folder, IMAGE_EXTENSIONS, UPLOAD_MAX_FILE_SIZE)
+        for upload in uploads:
+            if upload.error == 'unsupported file type':
+                error_count += 1
+                flash(f"Skipped {upload.filename}: Only JPEG/JPG/PNG files are allowed", "warning")
+                continue
+            if upload.error == 'file too large':
+                error_count += 1
+                flash(f"Skipped {upload.filename}: Larger than {UPLOAD_MAX_FILE_MB}MB", "warning")
                 continue
             
             filepath = None
             try:
-                if not photo.filename.lower().endswith(('.jpg', '.jpeg', '.png')):
-                    error_count += 1
-                    flash(f"Skipped {photo.filename}: Only JPEG/JPG/PNG files are allowed", "warning")
+                # Same content already stored: keep the existing copy
+                existing = image_index.find(upload.sha256)
+                if existing and os.path.exists(os.path.join(images_folder, existing)):
+                    upload.discard()
+                    duplicate_count += 1
+                    flash(f"Skipped {upload.filename}: Already uploaded", "warning")
                     continue
                 
-                # Generate unique filename preserving original extension
-                ext = os.path.splitext(photo.filename)[1].lower()
-                filename = secure_filename(f"{uuid.uuid4().hex}{ext}")
+                # Name the file after its content, preserving original extension
+                ext = os.path.splitext(upload.filename)[1].lower()
+                filename = secure_filename(f"{upload.sha256[:32]}{ext}")
                 filepath = os.path.join(images_folder, filename)
                 
-                # Ensure the images directory exists with proper permissions
-                ensure_static_directory()
-                
-                # Save the original image without modifications
-                photo.save(filepath)
-                
                 # Set proper file permissions (readable by web server)
                 try:
-                    os.chmod(filepath, 0o644)
-                    logger.info(f"Set permissions for {filepath}")
+                    os.chmod(upload.path, 0o644)
                 except Exception as e:
-                    logger.error(f"Error setting permissions for {filepath}: {str(e)}")
+                    logger.error("Error setting permissions for %s: %s", upload.path, e)
                     raise PermissionError(f"Failed to set proper permissions for {filepath}")
                 
-                # Verify the saved file
-                with Image.open(filepath) as img:
-                    img.verify()
+                # Move the complete file into place atomically
+                os.replace(upload.path, filepath)
+                upload.path = None
+                image_index.add(upload.sha256, filename, upload.size, os.path.getmtime(filepath))
                 
+                # Verification and resizing run in the image worker processes
+                queue_derivatives(filename, batch=batch_id)
                 success_count += 1
-                logger.info(f"Successfully uploaded and verified: {filename}")
+                logger.info("Successfully uploaded, queued for processing: %s", filename)
             except IOError as e:
                 error_count += 1
-                logger.error(f"IO Error processing {photo.filename}: {str(e)}")
+                logger.error("IO Error processing %s: %s", upload.filename, e)
                 if "Permission denied" in str(e):
-                    flash(f"Error uploading {photo.filename}: Permission denied. Please check folder permissions", "danger")
+                    flash(f"Error uploading {upload.filename}: Permission denied. Please check folder permissions", "danger")
                 else:
-                    flash(f"Error uploading {photo.filename}: Storage error", "danger")
-                if filepath and os.path.exists(filepath):
-                    try:
-                        os.remove(filepath)
-                    except OSError as rm_err:
-                        logger.error(f"Error removing invalid file {filepath}: {str(rm_err)}")
+                    flash(f"Error uploading {upload.filename}: Storage error", "danger")
+                upload.discard()
             except Exception as e:
                 error_count += 1
-                logger.error(f"Error processing {photo.filename}: {str(e)}")
+                logger.error("Error processing %s: %s", upload.filename, e)
                 if isinstance(e, PermissionError):
-                    flash(f"Error uploading {photo.filename}: Permission denied. Please check folder permissions", "danger")
+                    flash(f"Error uploading {upload.filename}: Permission denied. Please check folder permissions", "danger")
                 else:
-                    flash(f"Error uploading {photo.filename}: {str(e)}", "danger")
-                if filepath and os.path.exists(filepath):
-                    try:
-                        os.remove(filepath)
-                    except OSError as rm_err:
-                        logger.error(f"Error removing invalid file {filepath}: {str(rm_err)}")
+                    flash(f"Error uploading {upload.filename}: {str(e)}", "danger")
+                upload.discard()
         
+        if success_count + error_count + duplicate_count == 0:
+            flash('No files selected', 'danger')
         if success_count > 0:
-            flash(f"Successfully uploaded {success_count} image{'s' if success_count != 1 else ''}", "success")
+            publish_image_catalog()
+            flash(f"Successfully uploaded {success_count} image{'s' if success_count != 1 else ''}, processing now", "success")
         if error_count > 0:
             flash(f"Failed to upload {error_count} file{'s' if error_count != 1 else ''}", "danger")
+        return render_template('upload.html', batch_id=batch_id if success_count else None,
+                               max_file_mb=UPLOAD_MAX_FILE_MB, max_batch_mb=UPLOAD_MAX_BATCH_MB)
             
-    return render_template('upload.html')
+    return render_template('upload.html', max_file_mb=UPLOAD_MAX_FILE_MB, max_batch_mb=UPLOAD_MAX_BATCH_MB)
+
+@app.route('/api/upload/jobs/<batch_id>')
+def get_upload_jobs(batch_id):
+    """Processing status of every image in an upload batch"""
+    jobs = [{key: job[key] for key in ('id', 'batch', 'filename', 'status', 'error')}
+            for job in image_jobs.batch(batch_id)]
+    return jsonify({'batch': batch_id, 'jobs': jobs})
+
+def parse_calendar_event(component):
+    """Parse a single VEVENT from the feed into our event format"""
+    event = parse_ical_event(component, CALENDAR_TIMEZONE)
+    if event:
+        event['uid'] = str(component.get('uid', ''))
+        event['id'] = calendar_event_id(component, event)
+        event.setdefault('sequence', str(component.get('sequence', '0')))
+        if 'last_modified' not in event:
+            last_modified = component.get('last-modified')
+            event['last_modified'] = last_modified.dt.isoformat() if last_modified else None
+    return event
+
+def calendar_event_id(component, event):
+    """Stable id for an event: its UID, qualified by RECURRENCE-ID for overrides"""
+    uid = str(component.get('uid', '')) or f"{event['summary']}/{event['start_date']}/{event.get('start_time')}"
+    recurrence_id = component.get('recurrence-id')
+    if recurrence_id:
+        return f"{uid}/{recurrence_id.dt.isoformat()}"
+    return uid
+
+# Shared calendar cache, so concurrent panels reuse one upstream fetch
+def load_calendar_feeds():
+    """Feed settings from ICAL_FEEDS (a JSON list), falling back to ICAL_FEED_URL"""
+    if ICAL_FEEDS:
+        try:
+            feeds = json.loads(ICAL_FEEDS)
+        except ValueError as e:
+            logger.error("Invalid ICAL_FEEDS setting: %s", e)
+            return []
+    elif ICAL_FEED_URL:
+        feeds = [ICAL_FEED_URL]
+    else:
+        return []
+    return [feed if isinstance(feed, dict) else {'url': feed} for feed in feeds]
+
+def build_calendar_cache(feed_settings):
+    """Create one cache per valid feed and merge them with a CalendarAggregator"""
+    feeds = []
+    for position, settings in enumerate(feed_settings):
+        name = settings.get('name', f"Calendar {position + 1}")
+        feed_url = convert_webcal_to_https(settings.get('url', ''))
+        if not feed_url:
+            logger.error("Skipping calendar feed %s: invalid URL", position + 1)
+            continue
+        feeds.append(CalendarFeedCache(
+            feed_url,
+            parse_calendar_event,
+            CALENDAR_TIMEZONE,
+            expander=RecurrenceExpander(horizon_days=CALENDAR_HORIZON_DAYS),
+            tags={'calendar': name, 'color': settings.get('color')},
+            status=UpstreamStatus(f"calendar:{name}"),
+            ttl=int(settings.get('ttl', CALENDAR_CACHE_TTL))
+        ))
+    if not feeds:
+        return None
+    return CalendarAggregator(feeds, max_workers=CALENDAR_FETCH_WORKERS)
+
+# Shared calendar cache, so concurrent panels reuse one upstream fetch per feed
+calendar_feeds = load_calendar_feeds()
+calendar_cache = build_calendar_cache(calendar_feeds)
+
+def publish_calendar_window(changes=None):
+    """Give the dashboards the events of the days their calendar grid shows"""
+    today = datetime.now(CALENDAR_TIMEZONE).date()
+    start = today.strftime('%Y-%m-%d')
+    end = (today + timedelta(days=CALENDAR_WINDOW_DAYS - 1)).strftime('%Y-%m-%d')
+    dashboard_state.update('calendar', {
+        'start': start,
+        'end': end,
+        # Only what is in memory: this runs from restore and the refresh listeners, which must not fetch
+        'events': calendar_cache.lookup(start, end)
+    })
+
+def calendar_refresh_monitor():
+    """Refresh and parse the calendar feeds in background thread"""
+    while True:
+        try:
+            calendar_cache.refresh()
+            # Also moves the window along once the day changes
+            publish_calendar_window()
+        except Exception as e:
+            logger.error("Error in calendar refresh monitor: %s", e)
+        time.sleep(calendar_cache.ttl)
+
+def save_calendar_snapshot(changes):
+    """Persist parsed calendar events so a restart (or another worker) can serve them straight away"""
+    # Other workers only load the snapshot, they never write it back
+    if background_lock.held:
+        save_snapshot(SNAPSHOT_PATH, calendar=calendar_cache.snapshot())
+
+# Pass calendar changes on to the panels and the warm-start snapshot
+if calendar_cache:
+    calendar_cache.listeners.append(save_calendar_snapshot)
+    calendar_cache.listeners.append(publish_calendar_window)
+
+def parse_date_arg(name):
+    """Read an optional YYYY-MM-DD query parameter"""
+    value = request.args.get(name)
+    if not value:
+        return None
+    try:
+        return datetime.strptime(value, '%Y-%m-%d').strftime('%Y-%m-%d')
+    except ValueError:
+        raise ValueError(f"Invalid {name} date, expected YYYY-MM-DD")
 
 @app.route('/api/calendar')
-@rate_limit_decorator(min_interval=1)
 def get_calendar_events():
     try:
-        if not ICAL_FEED_URL:
-            logger.info("No calendar feed URL configured")
+        if not calendar_feeds:
+            logger.debug("No calendar feed URL configured")
             return jsonify({'events': [], 'warning': 'Calendar feed not configured'})
         
-        feed_url = convert_webcal_to_https(ICAL_FEED_URL)
-        if not feed_url:
-            logger.info("Invalid calendar feed URL")
+        if not calendar_cache:
+            logger.debug("Invalid calendar feed URL")
             return jsonify({'events': [], 'warning': 'Invalid calendar feed URL'})
         
-        logger.info(f"Fetching calendar events from feed")
-        response = requests.get(feed_url, timeout=10)
-        response.raise_for_status()
-        
-        calendar = Calendar.from_ical(response.text)
-        logger.info("Successfully parsed calendar feed")
-        
-        events = []
-        for component in calendar.walk():
-            if component.name == "VEVENT":
-                event = parse_ical_event(component, pytz.timezone('America/Los_Angeles'))
-                if event:
-                    events.append(event)
-                    logger.info(f"Parsed event: {event['summary']} on {event['start_date']}")
+        try:
+            start = parse_date_arg('start')
+            end = parse_date_arg('end')
+            limit = request.args.get('limit', type=int)
+            if limit is not None and limit < 1:
+                raise ValueError("limit must be a positive integer")
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
         
-        logger.info(f"Total events parsed: {len(events)}")
-        return jsonify({'events': events})
+        if calendar_cache.read_only and calendar_cache.events is None:
+            # Another worker runs the calendar refresh and has not saved a result yet
+            return not_loaded_yet('Calendar not available yet')
+
+        # Normally a plain read of the state kept fresh by calendar_refresh_monitor
+        events = calendar_cache.query(start, end, limit)
+        return jsonify({
+            'events': events,
+            'start': start,
+            'end': end,
+            'version': calendar_cache.version,
+            'stale': calendar_cache.is_stale()
+        })
         
     except Exception as e:
-        logger.error(f"Error fetching calendar events: {str(e)}")
+        logger.error("Error fetching calendar events: %s", e)
         return jsonify({'error': str(e)}), 500
+def get_stream_relay(doorbell):
+    """The shared relay for a doorbell camera, created on first use"""
+    mac = doorbell['mac']
+    with stream_relays_lock:
+        relay = stream_relays.get(mac)
+        if relay is None:
+            if DOORBELL_STREAM_SOURCE == 'ffmpeg' or (DOORBELL_STREAM_SOURCE == 'auto' and shutil.which('ffmpeg')):
+                # Credentials stay on the server; viewers only ever see JPEG frames
+                rtsp_port = int(os.environ.get('UNIFI_RTSP_PORT', 7447))
+                rtsp_url = f"rtsp://{quote(os.environ['UNIFI_USERNAME'], safe='')}:{quote(os.environ['UNIFI_PASSWORD'], safe='')}@{os.environ['UNIFI_HOST']}:{rtsp_port}/video/{mac}"
+                source_factory = lambda: FfmpegSource(rtsp_url, fps=DOORBELL_STREAM_FPS)
+            else:
+                source_factory = lambda: SnapshotSource(lambda: load_doorbell_snapshot(mac))
+            relay = stream_relays[mac] = StreamRelay(source_factory)
+        return relay
+
 # UniFi Doorbell Camera Routes
 @app.route('/api/doorbell/stream')
 def get_doorbell_stream():
-    """Get the current doorbell camera stream"""
+    """Live doorbell camera view as multipart MJPEG, shared by every viewer"""
     try:
-        controller = get_protect_api()
-        if not controller:
+        registry = get_device_registry()
+        if not registry:
             return jsonify({'error': 'Failed to connect to UniFi controller'}), 500
         
-        # Get all devices
-        devices = controller.get_devices()
-        doorbell = next((dev for dev in devices if 'G4 Doorbell' in dev.get('model', '')), None)
+        doorbell = registry.find('Doorbell', mac=request.args.get('mac'))
         
         if not doorbell:
             logger.error("No doorbell camera found")
             return jsonify({'error': 'No doorbell camera found'}), 404
-            
-        try:
-            # Get RTSP stream URL for the doorbell camera
-            # Use controller's port for RTSP stream
-            rtsp_port = int(os.environ.get('UNIFI_PORT', 7447))
-            stream_url = f"rtsp://{os.environ['UNIFI_USERNAME']}:{os.environ['UNIFI_PASSWORD']}@{os.environ['UNIFI_HOST']}:{rtsp_port}/video/{doorbell['mac']}"
-            return jsonify({'stream_url': stream_url})
-        except Exception as e:
-            logger.error(f"Error getting stream URL: {str(e)}")
-            return jsonify({'error': 'Failed to get stream URL'}), 500
+
+        relay = get_stream_relay(doorbell)
+        response = app.response_class(
+            relay.stream(),
+            mimetype=f"multipart/x-mixed-replace; boundary={BOUNDARY}",
+            direct_passthrough=True
+        )
+        response.headers['Cache-Control'] = 'no-store'
+        response.headers['X-Accel-Buffering'] = 'no'  # Keep nginx from buffering frames
+        return response
 
     except Exception as e:
-        logger.error(f"Error accessing doorbell camera: {str(e)}")
+        logger.error("Error accessing doorbell camera: %s", e)
         return jsonify({'error': str(e)}), 500
 
+@app.route('/api/doorbell/snapshot/<snapshot_id>')
+def get_doorbell_snapshot(snapshot_id):
+    """Serve the snapshot taken for a doorbell event"""
+    entry = snapshot_store.get(snapshot_id)
+    if entry is None:
+        return jsonify({'error': 'Snapshot not found'}), 404
+
+    data, etag = entry
+    response = app.response_class(data, mimetype='image/jpeg')
+    # A snapshot never changes once taken
+    response.headers['Cache-Control'] = 'public, max-age=31536000, immutable'
+    response.set_etag(etag)
+    return response.make_conditional(request)
+
 @app.route('/api/doorbell/answer', methods=['POST'])
 def answer_doorbell():
     """Answer the doorbell ring"""
     try:
         nvr = get_protect_api()
+        if not nvr:
+            return jsonify({'error': 'Failed to connect to UniFi controller'}), 500
         
         # Get the doorbell camera
-        devices = nvr.get_devices()
-        doorbell = next((dev for dev in devices if 'Doorbell' in dev.get('model', '')), None)
+        doorbell = get_device_registry().find('Doorbell', mac=request.args.get('mac'))
         
         if not doorbell:
             logger.error("No doorbell camera found")
@@ -487,18 +914,88 @@ def answer_doorbell():
             
         # Send command to answer doorbell (using UniFi Controller API)
         try:
-            nvr._api_post(f'stat/device/{doorbell["_id"]}/audio/on')
+            nvr.post(f'stat/device/{doorbell["_id"]}/audio/on')
             return jsonify({'status': 'success'})
         except Exception as e:
-            logger.error(f"Error activating doorbell audio: {str(e)}")
+            logger.error("Error activating doorbell audio: %s", e)
             return jsonify({'error': 'Failed to activate doorbell audio'}), 500
 
     except Exception as e:
-        logger.error(f"Error answering doorbell: {str(e)}")
+        logger.error("Error answering doorbell: %s", e)
         return jsonify({'error': str(e)}), 500
 
+# Weather responses shared by every panel, seeded from the snapshot by create_app
+weather_cache = TTLCache(ttl=WEATHER_CACHE_TTL)
+# An unchanged reading is only written back to the snapshot this often, to spare the SD card
+WEATHER_SNAPSHOT_INTERVAL = 3600  # seconds
+saved_weather = {}
+
+def publish_weather(weather_data, fetched_at):
+    """Send the dashboards' weather to every panel"""
+    dashboard_state.update('weather', dict(weather_data, fetched_at=fetched_at))
+
+def fetch_weather(lat, lon, units):
+    """Fetch current weather from OpenWeatherMap and remember it in the snapshot"""
+    params = {
+        'lat': lat,
+        'lon': lon,
+        'appid': WEATHER_API_KEY,
+        'units': units
+    }
+
+    logger.debug("Fetching weather data from OpenWeatherMap API")
+    with weather_status.track():
+        with track_upstream('openweathermap', 'current'):
+            response = requests.get(WEATHER_API_URL, params=params, timeout=10)
+        response.raise_for_status()
+        
+        data = response.json()
+        
+        if 'main' not in data or 'weather' not in data:
+            raise ValueError('Invalid weather data received')
+        
+    weather_data = {
+        'temp': data['main']['temp'],
+        'humidity': data['main']['humidity'],
+        'description': data['weather'][0]['description'],
+        'speed': data['wind']['speed']
+    }
+    
+    fetched_at = time.time()
+    if (lat, lon, units) == (LAT, LON, 'imperial'):
+        save_weather_snapshot(weather_data, fetched_at)
+        publish_weather(weather_data, fetched_at)
+    logger.debug("Successfully fetched weather data")
+    return weather_data
+
+def save_weather_snapshot(weather_data, fetched_at):
+    """Persist the dashboard's weather when it changed, or now and then so its age stays honest"""
+    if (weather_data == saved_weather.get('data')
+            and fetched_at - saved_weather.get('fetched_at', 0) < WEATHER_SNAPSHOT_INTERVAL):
+        return
+    save_snapshot(SNAPSHOT_PATH, weather={
+        'key': [LAT, LON, 'imperial'],
+        'data': weather_data,
+        'fetched_at': fetched_at
+    })
+    saved_weather.update(data=weather_data, fetched_at=fetched_at)
+
+def weather_refresh_monitor():
+    """Keep the dashboard's weather entry fresh in background thread"""
+    key = (LAT, LON, 'imperial')
+    while True:
+        entry = weather_cache.peek(key)
+        age = time.time() - entry[1] if entry else WEATHER_CACHE_TTL
+        if age < WEATHER_CACHE_TTL:
+            time.sleep(WEATHER_CACHE_TTL - age)
+            continue
+        try:
+            weather_cache.refresh(key, lambda: fetch_weather(*key))
+        except Exception as e:
+            logger.error("Error in weather refresh monitor: %s", e)
+            time.sleep(weather_cache.retry_interval)
+
 @app.route('/api/weather')
-@rate_limit_decorator(min_interval=1)
 def get_weather():
     """Get current weather data for configured location"""
     try:
@@ -506,114 +1003,80 @@ def get_weather():
             logger.error("No weather API key configured")
             return jsonify({'error': 'Weather API not configured'}), 503
 
-        params = {
-            'lat': LAT,
-            'lon': LON,
-            'appid': WEATHER_API_KEY,
-            'units': 'imperial'  # Use Fahrenheit for temperature
-        }
+        units = request.args.get('units', 'imperial')  # Fahrenheit by default
+        if units not in ('imperial', 'metric', 'standard'):
+            return jsonify({'error': 'Invalid units'}), 400
 
-        logger.info("Fetching weather data from OpenWeatherMap API")
-        response = requests.get(WEATHER_API_URL, params=params, timeout=10)
-        response.raise_for_status()
-        
-        data = response.json()
-        
-        if 'main' not in data or 'weather' not in data:
-            logger.error("Incomplete weather data received")
-            return jsonify({'error': 'Invalid weather data received'}), 500
-            
-        weather_data = {
-            'temp': data['main']['temp'],
-            'humidity': data['main']['humidity'],
-            'description': data['weather'][0]['description'],
-            'speed': data['wind']['speed']
-        }
-        
-        logger.info("Successfully fetched weather data")
-        return jsonify(weather_data)
+        # Concurrent panels share one upstream request per (lat, lon, units)
+        key = (LAT, LON, units)
+        weather_data, fetched_at = weather_cache.get(key, lambda: fetch_weather(*key))
+        age = time.time() - fetched_at
+
+        response = jsonify(dict(weather_data, stale=age >= WEATHER_CACHE_TTL))
+        response.headers['Cache-Control'] = f"public, max-age={max(0, int(WEATHER_CACHE_TTL - age))}"
+        response.add_etag()
+        return response.make_conditional(request)
         
     except requests.Timeout:
         logger.error("Weather API request timed out")
         return jsonify({'error': 'Request timed out'}), 504
     except requests.RequestException as e:
-        logger.error(f"Weather API request failed: {str(e)}")
+        logger.error("Weather API request failed: %s", e)
         return jsonify({'error': 'Failed to fetch weather data'}), 503
+    except LookupError:
+        # Another worker runs the weather refresh and has not saved a result yet
+        return not_loaded_yet('Weather not available yet')
+    except ValueError as e:
+        logger.error("Incomplete weather data received")
+        return jsonify({'error': str(e)}), 500
     except Exception as e:
-        logger.error(f"Unexpected error in weather endpoint: {str(e)}")
+        logger.error("Unexpected error in weather endpoint: %s", e)
         return jsonify({'error': str(e)}), 500
 
 def parse_ical_event(event, timezone):
-    """Parse an iCal event and convert to our format with enhanced WebDAV properties and recurring event support"""
-    from dateutil.rrule import rrulestr
-    from dateutil.relativedelta import relativedelta
+    """Parse an iCal event and convert to our format with enhanced WebDAV properties.
+
+    Recurring events are returned once, with their rule in ``recurrence``;
+    occurrences are expanded by the calendar cache's RecurrenceExpander.
+    """
     try:
         start = event.get('dtstart')
         if not start or not hasattr(start, 'dt'):
-            logger.error(f"Event missing start date or invalid format: {event.get('summary', 'No Title')}")
+            logger.error("Event missing start date or invalid format: %s", event.get('summary', 'No Title'))
             return None
 
-        # Get event summary for logging
-        summary = event.get('summary', 'No Title')
-        logger.info(f"Processing event: {summary} with start: {start.dt}")
-        logger.info(f"Event timezone info: {getattr(start.dt, 'tzinfo', 'No timezone')}")
+        summary = str(event.get('summary', 'No Title'))
+        # Runs for every event in the feed, so only at debug level and formatted lazily
+        logger.debug("Processing event: %s with start: %s", summary, start.dt)
 
+        tz_offset = None
         # Handle all-day events (don't apply timezone conversion)
         if isinstance(start.dt, date) and not isinstance(start.dt, datetime):
             start_date = start.dt.strftime('%Y-%m-%d')
-            logger.info(f"All-day event: {summary} on {start_date}")
             start_time = None
             is_all_day = True
         # Handle events with specific times
         else:
             try:
-                # Convert to UTC first if needed
-                if hasattr(start.dt, 'tzinfo') and start.dt.tzinfo:
-                    # Already has timezone info
-                    utc_dt = start.dt.astimezone(pytz.UTC)
-                else:
-                    # Naive datetime - assume UTC
-                    utc_dt = pytz.UTC.localize(start.dt)
-
-                # Convert to target timezone
-                local_dt = utc_dt.astimezone(timezone)
+                # Convert to target timezone, assuming UTC for naive datetimes
+                local_dt = to_local_datetime(start.dt, timezone)
                 start_date = local_dt.strftime('%Y-%m-%d')
                 start_time = local_dt.strftime('%H:%M:%S')
                 is_all_day = False
 
                 # Store timezone offset for client-side handling
                 tz_offset = local_dt.utcoffset().total_seconds() / 3600
-
-                # Validate parsed date
-                parsed_date = datetime.strptime(start_date, '%Y-%m-%d').date()
-                today = datetime.now(timezone).date()
-                logger.info(f"Comparing event date {parsed_date} with today {today}")
-
-                # Include timezone information in the response
-                return {
-                    'summary': summary,
-                    'start_date': start_date,
-                    'start_time': start_time,
-                    'is_all_day': is_all_day,
-                    'timezone_offset': tz_offset,
-                    'location': str(event.get('location', '')),
-                    'description': str(event.get('description', '')),
-                    'status': str(event.get('status', 'confirmed')),
-                    'classification': str(event.get('class', 'public')),
-                    'recurrence': bool(event.get('rrule'))
-                }
-
             except Exception as e:
-                logger.error(f"Error parsing datetime for event {summary}: {str(e)}")
+                logger.error("Error parsing datetime for event %s: %s", summary, e)
                 return None
             
         # Process end datetime
         end = event.get('dtend')
         end_date, end_time = None, None
-        if isinstance(end, vDDDTypes):
+        if hasattr(end, 'dt'):
             end_dt = end.dt
             if isinstance(end_dt, datetime):
-                localized_end = end_dt.astimezone(timezone)
+                localized_end = to_local_datetime(end_dt, timezone)
                 end_date = localized_end.date().strftime('%Y-%m-%d')
                 end_time = localized_end.strftime('%H:%M:%S')
             elif isinstance(end_dt, date):
@@ -633,19 +1096,19 @@ def parse_ical_event(event, timezone):
         if last_modified and isinstance(last_modified.dt, datetime):
             last_modified = last_modified.dt.astimezone(timezone).isoformat()
 
-        # Handle recurrence rules if present
+        # Record the recurrence rule; occurrences are expanded separately
         rrule = event.get('rrule')
-        recurrence = None
-        recurring_instances = []
+        recurrence = rrule.to_ical().decode() if rrule else None
 
-        # Initialize the parsed_event dictionary first
         parsed_event = {
             'date': start_date,  # Add explicit date field for calendar.js
-            'summary': str(event.get('summary', 'No Title')),
+            'summary': summary,
             'start_date': start_date,
             'start_time': start_time,
             'end_date': end_date,
             'end_time': end_time,
+            'is_all_day': is_all_day,
+            'timezone_offset': tz_offset,
             'description': str(event.get('description', '')),
             'location': location,
             'status': status,
@@ -653,53 +1116,137 @@ def parse_ical_event(event, timezone):
             'sequence': sequence,
             'created': created,
             'last_modified': last_modified,
-            'recurrence': None,
+            'recurrence': recurrence,
             'type': 'external',
-            'all_day': isinstance(start.dt, date) if start else False
+            'all_day': is_all_day
         }
 
-        if rrule:
-            logger.info(f"Processing recurring event: {event.get('summary')} with rule: {rrule}")
-            try:
-                # Convert RRULE to dateutil format
-                rrule_str = f"RRULE:{rrule}"
-                rule = rrulestr(rrule_str, dtstart=start.dt)
-                
-                # Get the next 3 days range
-                today = datetime.now(timezone).date()
-                until_date = today + relativedelta(days=3)
-                
-                # Generate instances within the range
-                instances = rule.between(
-                    datetime.combine(today, datetime.min.time(), tzinfo=timezone),
-                    datetime.combine(until_date, datetime.max.time(), tzinfo=timezone),
-                    inc=True
-                )
-                
-                # Create event instances
-                for instance_dt in instances:
-                    instance_start = instance_dt.astimezone(timezone)
-                    instance_event = parsed_event.copy()
-                    instance_event['start_date'] = instance_start.date().strftime('%Y-%m-%d')
-                    if not isinstance(start.dt, date):
-                        instance_event['start_time'] = instance_start.strftime('%H:%M:%S')
-                    recurring_instances.append(instance_event)
-                    logger.info(f"Generated recurring instance for {event.get('summary')} on {instance_event['start_date']}")
-            except Exception as e:
-                logger.error(f"Error processing recurrence rule for {event.get('summary')}: {str(e)}")
-
-            recurrence = str(rrule)
-            parsed_event['recurrence'] = recurrence
-
-        logger.info(f"Successfully parsed event: {parsed_event['summary']}")
         return parsed_event
     except Exception as e:
-        logger.error(f"Error parsing event: {str(e)}")
+        logger.error("Error parsing event: %s", e)
         return None
 
+def to_local_datetime(dt, timezone):
+    """Convert a datetime to the target timezone, treating naive values as UTC"""
+    if dt.tzinfo is None:
+        dt = dt.replace(tzinfo=ZoneInfo('UTC'))
+    return dt.astimezone(timezone)
+
 @app.route('/')
 def index():
     return render_template('index.html', current_time=datetime.now().strftime('%H:%M:%S'))
 
-if __name__ == '__main__':
-    app.run(host='0.0.0.0', port=5000)
+def restore_snapshot():
+    """Warm start: serve the last parsed events and weather until the first refresh completes"""
+    snapshot = load_snapshot(SNAPSHOT_PATH)
+    if calendar_cache and snapshot.get('calendar'):
+        calendar_cache.restore(snapshot['calendar'])
+        logger.info("Restored %s calendar events from snapshot", len(calendar_cache.events or []))
+    weather_snapshot = snapshot.get('weather', {})
+    if weather_snapshot.get('data'):
+        weather_cache.set(
+            tuple(weather_snapshot.get('key', (LAT, LON, 'imperial'))),
+            weather_snapshot['data'],
+            weather_snapshot.get('fetched_at')
+        )
+        saved_weather.update(data=weather_snapshot['data'], fetched_at=weather_snapshot.get('fetched_at') or 0)
+
+def create_app():
+    """Get the app ready to serve: folders and warm-start data, with no network I/O.
+
+    Importing this module only defines things; background services are
+    started separately by start_background_services.
+    """
+    if not app.config.get('DASHBOARD_CREATED'):
+        configure_logging(
+            level=LOG_LEVEL,
+            levels=LOG_LEVELS,
+            sample=LOG_SAMPLE,
+            log_file=LOG_FILE,
+            max_bytes=LOG_FILE_MAX_MB * 1024 * 1024,
+            backup_count=LOG_FILE_BACKUPS,
+            repeat_limit=LOG_REPEAT_LIMIT,
+            repeat_interval=LOG_REPEAT_INTERVAL
+        )
+        # Picks the eventlet or gevent server, so only once main.py has patched for it
+        socketio.init_app(app, cors_allowed_origins="*", async_mode=DASHBOARD_WORKER,
+                          message_queue=SOCKETIO_MESSAGE_QUEUE)
+        # Set default umask for new files
+        os.umask(0o022)
+        ensure_static_directory()
+        restore_snapshot()
+        app.config['DASHBOARD_CREATED'] = True
+        logger.info("Initialized Flask app with static folder: %s", static_folder)
+    return app
+
+def load_leader_state(seen):
+    """Pick up the calendar, weather and upstream status last saved by the worker running the pollers"""
+    for path, load in ((SNAPSHOT_PATH, restore_snapshot), (UPSTREAM_STATUS_PATH, load_upstream_status)):
+        try:
+            mtime = os.stat(path).st_mtime
+        except OSError:
+            continue
+        if seen.get(path) != mtime:
+            seen[path] = mtime
+            load()
+
+def load_upstream_status():
+    saved = load_snapshot(UPSTREAM_STATUS_PATH).get('upstreams', {})
+    for name, status in upstream_statuses().items():
+        if name in saved:
+            status.load(saved[name])
+
+def upstream_status_monitor():
+    """Save the upstream status for the other workers' readiness reports"""
+    saved = None
+    while True:
+        upstreams = {name: status.state() for name, status in upstream_statuses().items()}
+        if upstreams != saved:
+            save_snapshot(UPSTREAM_STATUS_PATH, upstreams=upstreams)
+            saved = upstreams
+        time.sleep(UPSTREAM_STATUS_INTERVAL)
+
+def set_read_only(read_only):
+    """Whether this worker's caches only serve what they hold instead of fetching"""
+    weather_cache.read_only = read_only
+    if calendar_cache:
+        calendar_cache.read_only = read_only
+        for feed in calendar_cache.feeds:
+            feed.read_only = read_only
+
+def follow_leader():
+    """Serve the data of the worker running the pollers until this one takes over"""
+    set_read_only(True)
+    seen = {}
+    while not background_lock.acquire():
+        load_leader_state(seen)
+        time.sleep(background_lock.retry_interval)
+    # Carry on from the previous leader's last saved data
+    load_leader_state(seen)
+    set_read_only(False)
+
+def run_background_services():
+    """Start the pollers and refreshers once this worker holds the background lock"""
+    if not background_lock.acquire():
+        logger.info("Background services run in another worker, following it (pid %s)", os.getpid())
+        follow_leader()
+    background_lock.wait()
+    dashboard_state.lead()
+    # Panels get the restored data before the first refresh comes back
+    if calendar_cache and calendar_cache.events is not None:
+        publish_calendar_window()
+    weather = weather_cache.peek((LAT, LON, 'imperial'))
+    if weather:
+        publish_weather(*weather)
+    threading.Thread(target=upstream_status_monitor, daemon=True).start()
+    threading.Thread(target=precompress_static_assets, daemon=True).start()
+    threading.Thread(target=doorbell_event_monitor, daemon=True).start()
+    threading.Thread(target=image_rescan_monitor, daemon=True).start()
+    if calendar_cache:
+        threading.Thread(target=calendar_refresh_monitor, daemon=True).start()
+    if WEATHER_API_KEY:
+        threading.Thread(target=weather_refresh_monitor, daemon=True).start()
+
+def start_background_services():
+    """Start the background services; they run in whichever worker process gets there first"""
+    threading.Thread(target=run_background_services, daemon=True).start()
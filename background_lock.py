@@ -0,0 +1,52 @@
+import fcntl
+import logging
+import os
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class BackgroundLock:
+    """Picks the one worker process that runs the background pollers.
+
+    Every worker calls ``wait``; the first to take an exclusive ``flock`` on
+    ``path`` returns straight away and keeps the lock for as long as it
+    lives. The others keep retrying every ``retry_interval`` seconds, so if
+    the holder exits (and the OS drops its lock) one of them takes over.
+    The non-blocking attempts keep a waiting worker from stalling its event
+    loop.
+    """
+
+    def __init__(self, path, retry_interval=5):
+        self.path = path
+        self.retry_interval = retry_interval
+        self._fd = None
+
+    @property
+    def held(self):
+        return self._fd is not None
+
+    def acquire(self):
+        """Take the lock if it is free; returns whether this process holds it"""
+        if self._fd is not None:
+            return True
+        os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+        fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            os.close(fd)
+            return False
+        # The holder's pid, for anyone wondering which worker runs the pollers
+        os.ftruncate(fd, 0)
+        os.write(fd, str(os.getpid()).encode())
+        self._fd = fd
+        return True
+
+    def wait(self):
+        """Block until this process holds the lock"""
+        if not self.acquire():
+            logger.info("Background services run in another worker, standing by (pid %s)", os.getpid())
+            while not self.acquire():
+                time.sleep(self.retry_interval)
+        logger.info("Running background services in this worker (pid %s)", os.getpid())
@@ -0,0 +1,505 @@
+"""Local stand-ins for the dashboard's upstream services.
+
+- FakeCalendar: an ICS feed of generated events (recurring, all-day and in
+  several timezones), answering revalidations with 304
+- FakeWeather: OpenWeatherMap's current-weather endpoint
+- FakeUniFi: a UniFi OS controller over HTTPS with one doorbell, its event
+  history and snapshots, and the event websocket; ``ring`` emits events
+
+Each serves from a background thread on 127.0.0.1 using only the standard
+library (plus the ``openssl`` command for FakeUniFi's certificate). Run this
+file to develop against them; it prints the settings to export:
+
+    python benchmarks/fake_upstreams.py --events 1000 --ring-interval 30
+"""
+import argparse
+import base64
+import hashlib
+import json
+import os
+import queue
+import random
+import re
+import select
+import shutil
+import socket
+import ssl
+import struct
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from collections import deque
+from datetime import datetime, timedelta, timezone
+from email.utils import formatdate
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs
+
+# TZID values used by the generated calendar; None is a floating time, 'date' an all-day event
+TIMEZONES = ('America/Los_Angeles', 'America/New_York', 'Europe/London', 'Asia/Tokyo', 'UTC', None, 'date')
+RRULES = (
+    'FREQ=DAILY;COUNT=10',
+    'FREQ=WEEKLY;BYDAY=MO,WE,FR',
+    'FREQ=WEEKLY;INTERVAL=2;COUNT=12',
+    'FREQ=MONTHLY;BYMONTHDAY=1,15',
+    'FREQ=YEARLY',
+)
+RECURRING_SHARE = 0.25
+
+WEBSOCKET_GUID = '258EAFA5-E914-47DA-95CA-C5AB0DC85B11'
+OP_TEXT, OP_CLOSE, OP_PING, OP_PONG = 0x1, 0x8, 0x9, 0xA
+
+
+def _ical_time(value, tz):
+    """A DTSTART-style property suffix (``;TZID=...:...`` or ``:...``) for the event's timezone"""
+    if tz == 'date':
+        return f";VALUE=DATE:{value:%Y%m%d}"
+    if tz == 'UTC':
+        return f":{value:%Y%m%dT%H%M%S}Z"
+    if tz is None:
+        return f":{value:%Y%m%dT%H%M%S}"
+    return f";TZID={tz}:{value:%Y%m%dT%H%M%S}"
+
+
+def generate_calendar(count, seed=0, today=None):
+    """An iCalendar feed with ``count`` VEVENTs around ``today``, the same for the same arguments.
+
+    A quarter of the events recur; some of those skip an occurrence (EXDATE)
+    or move one (a RECURRENCE-ID override, which counts towards ``count``).
+    """
+    rng = random.Random(seed)
+    today = today or datetime.now(timezone.utc).date()
+    stamp = f"{today:%Y%m%d}T000000Z"
+    lines = ['BEGIN:VCALENDAR', 'VERSION:2.0', 'PRODID:-//Dynamic Dashboard//Benchmark//EN', 'CALSCALE:GREGORIAN']
+    written = 0
+    while written < count:
+        tz = rng.choice(TIMEZONES)
+        day = today + timedelta(days=rng.randint(-60, 60))
+        if tz == 'date':
+            start = datetime(day.year, day.month, day.day)
+            end = start + timedelta(days=rng.choice((1, 1, 2)))
+        else:
+            start = datetime(day.year, day.month, day.day) + timedelta(minutes=30 * rng.randint(12, 42))
+            end = start + timedelta(minutes=30 * rng.randint(1, 6))
+        uid = f"benchmark-{written}@dashboard"
+        event = [
+            'BEGIN:VEVENT',
+            f"UID:{uid}",
+            f"DTSTAMP:{stamp}",
+            f"LAST-MODIFIED:{stamp}",
+            'SEQUENCE:0',
+            f"SUMMARY:Benchmark event {written}",
+            f"LOCATION:Room {rng.randint(1, 40)}",
+            f"DESCRIPTION:Generated for the load test, seed {seed}",
+            f"DTSTART{_ical_time(start, tz)}",
+            f"DTEND{_ical_time(end, tz)}",
+        ]
+        override = None
+        if rng.random() < RECURRING_SHARE:
+            rule = rng.choice(RRULES)
+            event.append(f"RRULE:{rule}")
+            if rule.startswith('FREQ=DAILY'):
+                event.append(f"EXDATE{_ical_time(start + timedelta(days=2), tz)}")
+                if tz != 'date' and written + 1 < count:
+                    moved = start + timedelta(days=1)
+                    override = [
+                        'BEGIN:VEVENT',
+                        f"UID:{uid}",
+                        f"DTSTAMP:{stamp}",
+                        'SEQUENCE:1',
+                        f"SUMMARY:Benchmark event {written} (moved)",
+                        f"RECURRENCE-ID{_ical_time(moved, tz)}",
+                        f"DTSTART{_ical_time(moved + timedelta(hours=1), tz)}",
+                        f"DTEND{_ical_time(moved + timedelta(hours=1) + (end - start), tz)}",
+                        'END:VEVENT',
+                    ]
+        event.append('END:VEVENT')
+        lines.extend(event)
+        written += 1
+        if override:
+            lines.extend(override)
+            written += 1
+    lines.append('END:VCALENDAR')
+    return ('\r\n'.join(lines) + '\r\n').encode()
+
+
+def self_signed_certificate(directory):
+    """Create a throwaway certificate for 127.0.0.1; returns (certfile, keyfile)"""
+    openssl = shutil.which('openssl')
+    if not openssl:
+        raise RuntimeError("The openssl command is needed to serve the fake UniFi controller over HTTPS")
+    certfile = os.path.join(directory, 'unifi-cert.pem')
+    keyfile = os.path.join(directory, 'unifi-key.pem')
+    subprocess.run([openssl, 'req', '-x509', '-newkey', 'rsa:2048', '-nodes', '-days', '1',
+                    '-subj', '/CN=127.0.0.1', '-keyout', keyfile, '-out', certfile],
+                   check=True, capture_output=True)
+    return certfile, keyfile
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+        self.server.upstream.handle(self, 'GET')
+
+    def do_POST(self):
+        self.server.upstream.handle(self, 'POST')
+
+    def log_message(self, format, *args):
+        pass
+
+
+def send(request, status, body=b'', content_type='application/json', headers=None):
+    """Write a complete response that keeps the connection open"""
+    if isinstance(body, (dict, list)):
+        body = json.dumps(body).encode()
+    request.send_response(status)
+    for name, value in (headers or {}).items():
+        request.send_header(name, value)
+    if status != 304:
+        request.send_header('Content-Type', content_type)
+        request.send_header('Content-Length', str(len(body)))
+    request.end_headers()
+    if status != 304:
+        request.wfile.write(body)
+
+
+class FakeUpstream:
+    """An upstream stand-in served by a threaded HTTP server on 127.0.0.1.
+
+    ``delay`` seconds are added to every response, to stand in for the round
+    trip to the real service. Subclasses implement ``respond``.
+    """
+
+    scheme = 'http'
+
+    def __init__(self, delay=0):
+        self.delay = delay
+        self.requests = 0
+        self._server = None
+        self._stopping = False
+
+    @property
+    def port(self):
+        return self._server.server_address[1]
+
+    @property
+    def url(self):
+        return f"{self.scheme}://127.0.0.1:{self.port}"
+
+    def ssl_context(self):
+        return None
+
+    def start(self, port=0):
+        self._server = ThreadingHTTPServer(('127.0.0.1', port), _Handler)
+        self._server.daemon_threads = True
+        self._server.upstream = self
+        context = self.ssl_context()
+        if context is not None:
+            self._server.socket = context.wrap_socket(self._server.socket, server_side=True)
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self):
+        self._stopping = True
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+
+    def handle(self, request, method):
+        self.requests += 1
+        length = int(request.headers.get('Content-Length') or 0)
+        body = request.rfile.read(length) if length else b''
+        if self.delay:
+            time.sleep(self.delay)
+        path, _, query = request.path.partition('?')
+        self.respond(request, method, path, parse_qs(query), body)
+
+    def respond(self, request, method, path, query, body):
+        raise NotImplementedError
+
+
+class FakeCalendar(FakeUpstream):
+    """ICS feed: ``/calendar.ics?events=N`` serves a generated calendar of N events.
+
+    Each size is generated once and served with an ETag and Last-Modified,
+    so the dashboard's conditional refetches get a 304 like from iCloud.
+    """
+
+    def __init__(self, delay=0, seed=0):
+        super().__init__(delay)
+        self.seed = seed
+        self._feeds = {}
+        self._lock = threading.Lock()
+
+    def feed_url(self, count):
+        return f"{self.url}/calendar.ics?events={count}"
+
+    def feed(self, count):
+        with self._lock:
+            if count not in self._feeds:
+                body = generate_calendar(count, self.seed)
+                self._feeds[count] = (body, '"' + hashlib.sha256(body).hexdigest()[:32] + '"', formatdate(usegmt=True))
+            return self._feeds[count]
+
+    def respond(self, request, method, path, query, body):
+        if path != '/calendar.ics':
+            return send(request, 404, {'error': 'not found'})
+        body, etag, last_modified = self.feed(int(query.get('events', ['100'])[0]))
+        headers = {'ETag': etag, 'Last-Modified': last_modified}
+        if request.headers.get('If-None-Match') == etag:
+            return send(request, 304, headers=headers)
+        send(request, 200, body, 'text/calendar; charset=utf-8', headers)
+
+
+class FakeWeather(FakeUpstream):
+    """OpenWeatherMap's ``/data/2.5/weather``, answering for any coordinates and units"""
+
+    def __init__(self, delay=0, seed=0):
+        super().__init__(delay)
+        self._rng = random.Random(seed)
+
+    @property
+    def api_url(self):
+        return f"{self.url}/data/2.5/weather"
+
+    def respond(self, request, method, path, query, body):
+        if path != '/data/2.5/weather':
+            return send(request, 404, {'cod': 404, 'message': 'not found'})
+        if not query.get('appid'):
+            return send(request, 401, {'cod': 401, 'message': 'Invalid API key'})
+        send(request, 200, {
+            'coord': {'lat': float(query.get('lat', ['0'])[0]), 'lon': float(query.get('lon', ['0'])[0])},
+            'weather': [{'id': 800, 'main': 'Clear', 'description': 'clear sky', 'icon': '01d'}],
+            'main': {'temp': round(self._rng.uniform(30, 90), 1), 'humidity': self._rng.randint(10, 90)},
+            'wind': {'speed': round(self._rng.uniform(0, 20), 1)},
+            'dt': int(time.time()),
+            'name': 'Benchmark',
+            'cod': 200
+        })
+
+
+def _recv_exact(sock, size):
+    data = b''
+    while len(data) < size:
+        chunk = sock.recv(size - len(data))
+        if not chunk:
+            return None
+        data += chunk
+    return data
+
+
+def _read_frame(sock):
+    """One client frame as (opcode, payload); (None, None) once the connection is gone"""
+    header = _recv_exact(sock, 2)
+    if header is None:
+        return None, None
+    length = header[1] & 0x7F
+    if length == 126:
+        length = struct.unpack('!H', _recv_exact(sock, 2))[0]
+    elif length == 127:
+        length = struct.unpack('!Q', _recv_exact(sock, 8))[0]
+    mask = _recv_exact(sock, 4) if header[1] & 0x80 else None
+    payload = _recv_exact(sock, length) if length else b''
+    if payload is None:
+        return None, None
+    if mask:
+        payload = bytes(byte ^ mask[i % 4] for i, byte in enumerate(payload))
+    return header[0] & 0x0F, payload
+
+
+def _frame(opcode, payload):
+    """A single unmasked server frame"""
+    size = len(payload)
+    if size < 126:
+        header = struct.pack('!BB', 0x80 | opcode, size)
+    elif size < 1 << 16:
+        header = struct.pack('!BBH', 0x80 | opcode, 126, size)
+    else:
+        header = struct.pack('!BBQ', 0x80 | opcode, 127, size)
+    return header + payload
+
+
+class FakeUniFi(FakeUpstream):
+    """UniFi OS controller with a doorbell, over HTTPS.
+
+    Answers the login, ``stat/device``, ``stat/event`` (paged newest first)
+    and ``snapshots`` calls under ``/api/s/<site>/`` whatever prefix the
+    client puts in front, and pushes events to every client of the
+    ``wss/s/<site>/events`` websocket. The history starts with one old ring
+    so a polling client has a cursor before the first ``ring``.
+    """
+
+    scheme = 'https'
+    DOORBELL = {'mac': 'f4:e2:c6:00:be:11', 'model': 'UVC G4 Doorbell', 'name': 'Front Door', 'type': 'uvc'}
+    DEVICES = (
+        DOORBELL,
+        {'mac': 'f4:e2:c6:00:be:12', 'model': 'UVC G4 Bullet', 'name': 'Driveway', 'type': 'uvc'},
+        {'mac': 'f4:e2:c6:00:be:13', 'model': 'U6-Lite', 'name': 'Hallway AP', 'type': 'uap'},
+    )
+
+    def __init__(self, certfile, keyfile, delay=0, snapshot_kb=100, seed=0, history_size=5000):
+        super().__init__(delay)
+        self.certfile = certfile
+        self.keyfile = keyfile
+        rng = random.Random(seed)
+        # JPEG markers around random bytes: the dashboard stores and serves snapshots without decoding them
+        self._snapshot = base64.b64encode(b'\xff\xd8' + rng.randbytes(snapshot_kb * 1024) + b'\xff\xd9').decode()
+        self._events = deque(maxlen=history_size)
+        self._sequence = 0
+        self._subscribers = set()
+        self._lock = threading.Lock()
+        self.logins = 0
+        self._append_events(1, 'ring', time.time() - 3600)
+
+    @property
+    def websocket_clients(self):
+        return len(self._subscribers)
+
+    def ssl_context(self):
+        context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+        context.load_cert_chain(self.certfile, self.keyfile)
+        return context
+
+    def ring(self, count=1, event_type='ring'):
+        """Emit ``count`` doorbell events at once; returns [(event id, emitted at)]"""
+        emitted_at = time.time()
+        events, subscribers = self._append_events(count, event_type, emitted_at)
+        for event in events:
+            message = json.dumps({'meta': {'rc': 'ok', 'message': 'events'}, 'data': [event]}).encode()
+            for outbox, wake in subscribers:
+                outbox.put(message)
+                try:
+                    wake.send(b'\0')
+                except OSError:
+                    pass
+        return [(event['_id'], emitted_at) for event in events]
+
+    def _append_events(self, count, event_type, at):
+        events = []
+        with self._lock:
+            for _ in range(count):
+                self._sequence += 1
+                # Shaped like a Mongo ObjectId, so IDs sort by creation as the dashboard expects
+                events.append({
+                    '_id': f"{int(at):08x}{self._sequence:016x}",
+                    'key': 'EVT_DOORBELL_RING',
+                    'eventType': event_type,
+                    'mac': self.DOORBELL['mac'],
+                    'time': int(at * 1000)
+                })
+            self._events.extend(events)
+            return events, list(self._subscribers)
+
+    def respond(self, request, method, path, query, body):
+        if path.endswith('/api/auth/login') or path.endswith('/api/login'):
+            self.logins += 1
+            return send(request, 200, {'meta': {'rc': 'ok'}, 'data': []}, headers={
+                'Set-Cookie': 'TOKEN=benchmark; Path=/; Secure; HttpOnly',
+                'X-CSRF-Token': 'benchmark'
+            })
+        if '/wss/' in path:
+            return self._serve_websocket(request)
+        match = re.search(r'/api/s/[^/]+/(.+)$', path)
+        if not match:
+            return send(request, 404, {'meta': {'rc': 'error', 'msg': 'api.err.NotFound'}})
+        endpoint = match.group(1)
+        payload = json.loads(body) if body else {}
+
+        if endpoint == 'stat/device':
+            data = list(self.DEVICES)
+        elif endpoint == 'stat/event':
+            with self._lock:
+                events = [event for event in reversed(self._events)
+                          if not payload.get('mac') or event['mac'] == payload['mac']]
+            start = int(payload.get('_start', 0))
+            data = events[start:start + int(payload.get('_limit', 3000))]
+        elif endpoint == 'snapshots':
+            data = {'data': self._snapshot}
+        else:
+            return send(request, 404, {'meta': {'rc': 'error', 'msg': 'api.err.NotFound'}})
+        send(request, 200, {'meta': {'rc': 'ok'}, 'data': data})
+
+    def _serve_websocket(self, request):
+        key = request.headers.get('Sec-WebSocket-Key')
+        if request.headers.get('Upgrade', '').lower() != 'websocket' or not key:
+            return send(request, 400, {'meta': {'rc': 'error', 'msg': 'websocket upgrade expected'}})
+        accept = base64.b64encode(hashlib.sha1((key + WEBSOCKET_GUID).encode()).digest()).decode()
+        request.send_response(101, 'Switching Protocols')
+        request.send_header('Upgrade', 'websocket')
+        request.send_header('Connection', 'Upgrade')
+        request.send_header('Sec-WebSocket-Accept', accept)
+        request.end_headers()
+        request.close_connection = True
+
+        # Reads and writes both happen on this thread, as an SSL socket is not safe to share
+        connection = request.connection
+        wake_reader, wake_writer = socket.socketpair()
+        subscriber = (queue.SimpleQueue(), wake_writer)
+        with self._lock:
+            self._subscribers.add(subscriber)
+        try:
+            while not self._stopping:
+                pending = getattr(connection, 'pending', lambda: 0)()
+                ready = [connection] if pending else select.select([connection, wake_reader], [], [], 1)[0]
+                if wake_reader in ready:
+                    wake_reader.recv(4096)
+                outbox = subscriber[0]
+                while not outbox.empty():
+                    connection.sendall(_frame(OP_TEXT, outbox.get()))
+                if connection in ready:
+                    opcode, payload = _read_frame(connection)
+                    if opcode is None:
+                        break
+                    if opcode == OP_CLOSE:
+                        connection.sendall(_frame(OP_CLOSE, payload[:2]))
+                        break
+                    if opcode == OP_PING:
+                        connection.sendall(_frame(OP_PONG, payload))
+        except OSError:
+            pass
+        finally:
+            with self._lock:
+                self._subscribers.discard(subscriber)
+            wake_reader.close()
+            wake_writer.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--events', type=int, default=1000, help='events in the calendar feed')
+    parser.add_argument('--delay-ms', type=float, default=0, help='added to every upstream response')
+    parser.add_argument('--ring-interval', type=float, default=0, help='seconds between doorbell rings (0: never)')
+    parser.add_argument('--calendar-port', type=int, default=8081)
+    parser.add_argument('--weather-port', type=int, default=8082)
+    parser.add_argument('--unifi-port', type=int, default=8443)
+    args = parser.parse_args()
+
+    delay = args.delay_ms / 1000
+    with tempfile.TemporaryDirectory() as directory:
+        certfile, keyfile = self_signed_certificate(directory)
+        calendar = FakeCalendar(delay).start(args.calendar_port)
+        weather = FakeWeather(delay).start(args.weather_port)
+        unifi = FakeUniFi(certfile, keyfile, delay).start(args.unifi_port)
+        print(f"ICAL_FEED_URL='{calendar.feed_url(args.events)}'")
+        print(f"OPENWEATHERMAP_API_URL={weather.api_url}")
+        print("OPENWEATHERMAP_API_KEY=benchmark")
+        print(f"UNIFI_HOST=127.0.0.1\nUNIFI_PORT={unifi.port}\nUNIFI_USERNAME=benchmark\nUNIFI_PASSWORD=benchmark")
+        sys.stdout.flush()
+        try:
+            while True:
+                if args.ring_interval:
+                    time.sleep(args.ring_interval)
+                    unifi.ring()
+                else:
+                    time.sleep(3600)
+        except KeyboardInterrupt:
+            pass
+        finally:
+            for upstream in (calendar, weather, unifi):
+                upstream.stop()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,85 @@
+"""Import-time benchmark for app.py.
+
+Imports the app in fresh interpreters and reports how long it took, then
+checks that the import stayed side-effect free: no threads started, no
+network connections attempted and none of the heavy, lazily imported
+libraries loaded. Exits non-zero when a check fails or the median import
+time is over ``--max-ms``, so it can gate a release.
+
+    python benchmarks/import_time.py --runs 5 --max-ms 1500
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Only loaded by the code that needs them, never by importing app
+LAZY_MODULES = ('PIL', 'icalendar', 'dateutil', 'pytz')
+
+PROBE = """
+import json, socket, sys, threading, time
+
+attempts = []
+def refuse(*args, **kwargs):
+    attempts.append(repr(args[:2]))
+    raise OSError('network access during import')
+socket.socket.connect = refuse
+socket.getaddrinfo = refuse
+
+threads = threading.active_count()
+started = time.perf_counter()
+import app
+elapsed = time.perf_counter() - started
+
+print(json.dumps({
+    'ms': elapsed * 1000,
+    'threads': threading.active_count() - threads,
+    'network': attempts,
+    'lazy_loaded': [name for name in %r if name in sys.modules],
+}))
+""" % (LAZY_MODULES,)
+
+
+def run_once(data_dir):
+    env = dict(os.environ, DASHBOARD_DATA_DIR=data_dir)
+    result = subprocess.run([sys.executable, '-c', PROBE], cwd=ROOT, env=env,
+                            capture_output=True, text=True, timeout=120)
+    if result.returncode != 0:
+        raise RuntimeError(f"Importing app failed:\n{result.stderr}")
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--max-ms', type=float, default=None, help='fail if the median is slower')
+    parser.add_argument('--data-dir', default=os.path.join(ROOT, 'data', 'benchmark'))
+    args = parser.parse_args()
+
+    runs = [run_once(args.data_dir) for _ in range(args.runs)]
+    times = sorted(run['ms'] for run in runs)
+    median = statistics.median(times)
+    print(f"import app: median {median:.0f} ms, min {times[0]:.0f} ms, max {times[-1]:.0f} ms ({args.runs} runs)")
+
+    failures = []
+    last = runs[-1]
+    if last['threads']:
+        failures.append(f"{last['threads']} thread(s) started on import")
+    if last['network']:
+        failures.append(f"network access on import: {', '.join(last['network'])}")
+    if last['lazy_loaded']:
+        failures.append(f"loaded on import: {', '.join(last['lazy_loaded'])}")
+    if args.max_ms is not None and median > args.max_ms:
+        failures.append(f"median {median:.0f} ms is over the {args.max_ms:.0f} ms budget")
+
+    for failure in failures:
+        print(f"FAIL: {failure}")
+    return 1 if failures else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
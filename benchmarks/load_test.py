@@ -0,0 +1,513 @@
+"""Load test for the dashboard, against local stand-ins for every upstream.
+
+Runs main.py from a scratch copy of the tree, pointed at the fakes in
+fake_upstreams.py, once per scenario:
+
+- calendar: N panels polling /api/calendar for today's window, once per
+  feed size (``--calendar-events``)
+- weather: N panels polling /api/weather
+- doorbell: bursts of rings from the fake controller, fanned out to M
+  Socket.IO clients; latency is from the ring to each client's receipt
+- upload: bulk photo uploads through /upload, until every image is processed
+
+Each scenario reports throughput, p50/p99 latency and the server's peak RSS.
+Save the results and compare the next release against them; with
+``--max-regression`` the run exits non-zero when a figure got worse by more
+than that many percent:
+
+    python benchmarks/load_test.py --output results-1.1.json
+    python benchmarks/load_test.py --compare results-1.1.json --max-regression 10
+
+Needs the app's requirements (the Socket.IO client is python-socketio and
+the test photos are made with Pillow) and the openssl command.
+"""
+import argparse
+import http.client
+import io
+import json
+import math
+import os
+import platform
+import random
+import re
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from datetime import date, datetime, timedelta
+
+from fake_upstreams import FakeCalendar, FakeUniFi, FakeWeather, self_signed_certificate
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SCENARIOS = ('calendar', 'weather', 'doorbell', 'upload')
+
+# Figures compared between runs, and whether a higher value is better
+COMPARED = (('throughput', True), ('p50_ms', False), ('p99_ms', False), ('peak_rss_mb', False))
+
+# Not copied into the scratch tree the app runs from
+SKIPPED_FILES = ('.git', 'data', 'logs', 'images', 'benchmarks', '__pycache__', '*.gz', '*.br')
+
+# Settings the app would otherwise pick up from the environment running the benchmark
+APP_SETTINGS = ('ICAL_', 'UNIFI_', 'OPENWEATHERMAP_', 'WEATHER_', 'CALENDAR_', 'DASHBOARD_', 'SOCKETIO_', 'LOG_')
+
+
+def percentile(ordered, percent):
+    """Nearest-rank percentile of an already sorted list"""
+    if not ordered:
+        return None
+    return ordered[max(0, math.ceil(percent / 100 * len(ordered)) - 1)]
+
+
+def summarize(latencies, errors, elapsed):
+    """Throughput (per second) and p50/p99 (ms) of successful operations"""
+    ordered = sorted(latencies)
+    return {
+        'count': len(ordered),
+        'errors': errors,
+        'throughput': len(ordered) / elapsed if elapsed else 0,
+        'p50_ms': percentile(ordered, 50) * 1000 if ordered else None,
+        'p99_ms': percentile(ordered, 99) * 1000 if ordered else None,
+    }
+
+
+def _proc_status(pid, field):
+    """A memory figure from /proc/<pid>/status, in MB; None off Linux or once the process is gone"""
+    try:
+        with open(f"/proc/{pid}/status") as status:
+            for line in status:
+                if line.startswith(field + ':'):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return None
+
+
+def _descendants(pid):
+    children = {}
+    for entry in os.listdir('/proc') if os.path.isdir('/proc') else ():
+        if entry.isdigit():
+            try:
+                with open(f"/proc/{entry}/stat") as stat:
+                    parent = int(stat.read().rpartition(')')[2].split()[1])
+            except (OSError, ValueError, IndexError):
+                continue
+            children.setdefault(parent, []).append(int(entry))
+    found, pending = [], [pid]
+    while pending:
+        for child in children.get(pending.pop(), ()):
+            found.append(child)
+            pending.append(child)
+    return found
+
+
+def _free_port():
+    with socket.socket() as probe:
+        probe.bind(('127.0.0.1', 0))
+        return probe.getsockname()[1]
+
+
+class Upstreams:
+    """The three fakes, shared by every scenario of a run"""
+
+    def __init__(self, directory, delay=0, seed=0):
+        certfile, keyfile = self_signed_certificate(directory)
+        self.calendar = FakeCalendar(delay, seed).start()
+        self.weather = FakeWeather(delay, seed).start()
+        self.unifi = FakeUniFi(certfile, keyfile, delay, seed=seed).start()
+
+    def stop(self):
+        for upstream in (self.calendar, self.weather, self.unifi):
+            upstream.stop()
+
+
+class DashboardProcess:
+    """main.py run from a scratch copy of ``source``, so uploads, logs and data stay out of the tree"""
+
+    def __init__(self, source, directory, env):
+        self.directory = os.path.join(directory, 'app')
+        shutil.copytree(source, self.directory, ignore=shutil.ignore_patterns(*SKIPPED_FILES))
+        self.port = _free_port()
+        self.url = f"http://127.0.0.1:{self.port}"
+        self.env = dict(env, HOST='127.0.0.1', PORT=str(self.port),
+                        DASHBOARD_DATA_DIR=os.path.join(self.directory, 'data'))
+        self.log_path = os.path.join(directory, 'server.log')
+        self.process = None
+
+    def start(self, timeout):
+        """Start the server and wait until /health/ready says every upstream answered; returns the seconds taken"""
+        started = time.perf_counter()
+        with open(self.log_path, 'wb') as log:
+            self.process = subprocess.Popen([sys.executable, 'main.py'], cwd=self.directory, env=self.env,
+                                            stdout=log, stderr=subprocess.STDOUT)
+        self.wait_for(lambda report: report.get('status') == 'ready', timeout)
+        return time.perf_counter() - started
+
+    def wait_for(self, condition, timeout):
+        """Poll the readiness report until ``condition(report)`` holds"""
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            if self.process.poll() is not None:
+                raise RuntimeError(f"The dashboard exited with {self.process.returncode}\n{self.log_tail()}")
+            try:
+                status, body = self.request('GET', '/health/ready')
+                if condition(json.loads(body)):
+                    return
+            except (OSError, http.client.HTTPException, ValueError):
+                pass
+            time.sleep(0.2)
+        raise RuntimeError(f"The dashboard was not ready within {timeout} s\n{self.log_tail()}")
+
+    def request(self, method, path, body=None, headers=None, timeout=60):
+        connection = http.client.HTTPConnection('127.0.0.1', self.port, timeout=timeout)
+        try:
+            connection.request(method, path, body=body, headers=headers or {})
+            response = connection.getresponse()
+            return response.status, response.read()
+        finally:
+            connection.close()
+
+    def memory(self):
+        """Peak RSS of the server and, summed, of its worker processes (MB)"""
+        workers = [_proc_status(pid, 'VmHWM') for pid in _descendants(self.process.pid)]
+        workers = [peak for peak in workers if peak is not None]
+        return {
+            'peak_rss_mb': _proc_status(self.process.pid, 'VmHWM'),
+            'workers_peak_rss_mb': sum(workers) if workers else None,
+        }
+
+    def log_tail(self, lines=40):
+        try:
+            with open(self.log_path, errors='replace') as log:
+                return ''.join(log.readlines()[-lines:])
+        except OSError:
+            return ''
+
+    def stop(self):
+        if self.process and self.process.poll() is None:
+            self.process.terminate()
+            try:
+                self.process.wait(10)
+            except subprocess.TimeoutExpired:
+                self.process.kill()
+                self.process.wait()
+
+
+@contextmanager
+def running_dashboard(args, upstreams, events, **settings):
+    """A started dashboard using the fakes, with a calendar of ``events`` events"""
+    env = {name: value for name, value in os.environ.items() if not name.startswith(APP_SETTINGS)}
+    env.update({
+        'NO_PROXY': '127.0.0.1,localhost',
+        'ICAL_FEED_URL': upstreams.calendar.feed_url(events),
+        'OPENWEATHERMAP_API_URL': upstreams.weather.api_url,
+        'OPENWEATHERMAP_API_KEY': 'benchmark',
+        'UNIFI_HOST': '127.0.0.1',
+        'UNIFI_PORT': str(upstreams.unifi.port),
+        'UNIFI_USERNAME': 'benchmark',
+        'UNIFI_PASSWORD': 'benchmark',
+        'UNIFI_EVENT_STREAM': 'false' if args.poll_events else 'true',
+        'UNIFI_EVENT_MAX_POLL_INTERVAL': '1',
+    })
+    env.update(settings)
+    with tempfile.TemporaryDirectory(prefix='dashboard-bench-') as directory:
+        dashboard = DashboardProcess(args.app_dir, directory, env)
+        try:
+            dashboard.ready_seconds = dashboard.start(args.ready_timeout)
+            yield dashboard
+        finally:
+            dashboard.stop()
+
+
+def poll_endpoint(port, path, panels, duration):
+    """``panels`` threads requesting ``path`` back to back, each over its own keep-alive connection"""
+    latencies = []
+    errors = [0]
+    lock = threading.Lock()
+    deadline = time.perf_counter() + duration
+
+    def panel():
+        timings = []
+        failed = 0
+        connection = http.client.HTTPConnection('127.0.0.1', port, timeout=30)
+        while time.perf_counter() < deadline:
+            started = time.perf_counter()
+            try:
+                connection.request('GET', path)
+                response = connection.getresponse()
+                response.read()
+                ok = response.status == 200
+            except (OSError, http.client.HTTPException):
+                ok = False
+                connection.close()
+                connection = http.client.HTTPConnection('127.0.0.1', port, timeout=30)
+            if ok:
+                timings.append(time.perf_counter() - started)
+            else:
+                failed += 1
+        connection.close()
+        with lock:
+            latencies.extend(timings)
+            errors[0] += failed
+
+    threads = [threading.Thread(target=panel) for _ in range(panels)]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return summarize(latencies, errors[0], time.perf_counter() - started)
+
+
+def run_calendar(args, upstreams):
+    results = {}
+    for events in args.calendar_events:
+        with running_dashboard(args, upstreams, events) as dashboard:
+            today = date.today()
+            path = f"/api/calendar?start={today}&end={today + timedelta(days=2)}"
+            status, body = dashboard.request('GET', path)
+            if status != 200:
+                raise RuntimeError(f"{path} answered {status}: {body[:200]!r}")
+            result = poll_endpoint(dashboard.port, path, args.panels, args.duration)
+            result.update(dashboard.memory(), ready_seconds=dashboard.ready_seconds,
+                          window_events=len(json.loads(body).get('events', [])))
+        results[f"calendar_{events}"] = result
+    return results
+
+
+def run_weather(args, upstreams):
+    with running_dashboard(args, upstreams, args.calendar_events[0]) as dashboard:
+        result = poll_endpoint(dashboard.port, '/api/weather', args.panels, args.duration)
+        result.update(dashboard.memory(), ready_seconds=dashboard.ready_seconds)
+    return {'weather': result}
+
+
+def run_doorbell(args, upstreams):
+    import socketio
+
+    mode = 'polling' if args.poll_events else 'stream'
+    with running_dashboard(args, upstreams, args.calendar_events[0]) as dashboard:
+        dashboard.wait_for(
+            lambda report: report.get('upstreams', {}).get('unifi', {}).get('events', {}).get('mode') == mode,
+            args.ready_timeout)
+
+        received = [{} for _ in range(args.clients)]
+        clients = []
+        for log in received:
+            client = socketio.Client(reconnection=False)
+            client.on('doorbell_event', lambda data, log=log: log.setdefault(data['id'], time.time()))
+            client.connect(dashboard.url, wait_timeout=10)
+            clients.append(client)
+
+        try:
+            latencies = []
+            missed = 0
+            busy = 0
+            for _ in range(args.bursts):
+                emitted = dict(upstreams.unifi.ring(args.burst_size))
+                deadline = time.monotonic() + args.burst_timeout
+                while time.monotonic() < deadline and not all(emitted.keys() <= log.keys() for log in received):
+                    time.sleep(0.005)
+                last = emitted_at = min(emitted.values())
+                for log in received:
+                    for event_id, at in emitted.items():
+                        if event_id in log:
+                            latencies.append(log[event_id] - at)
+                            last = max(last, log[event_id])
+                        else:
+                            missed += 1
+                busy += last - emitted_at
+                time.sleep(args.burst_interval)
+        finally:
+            for client in clients:
+                client.disconnect()
+
+        # Throughput is deliveries per second while a burst was being fanned out
+        result = summarize(latencies, missed, busy)
+        result.update(dashboard.memory(), clients=args.clients, events=args.bursts * args.burst_size,
+                      transport=mode)
+    return {'doorbell': result}
+
+
+def make_photos(count, size, seed):
+    """Distinct JPEGs of random pixels, so none is rejected as a duplicate"""
+    from PIL import Image
+
+    rng = random.Random(seed)
+    width, height = size
+    photos = []
+    for number in range(count):
+        image = Image.frombytes('RGB', size, rng.randbytes(width * height * 3))
+        buffer = io.BytesIO()
+        image.save(buffer, 'JPEG', quality=90)
+        photos.append((f"benchmark-{number:04d}.jpg", buffer.getvalue()))
+    return photos
+
+
+def multipart_body(photos, boundary):
+    parts = []
+    for filename, data in photos:
+        parts.append(
+            f'--{boundary}\r\nContent-Disposition: form-data; name="photos"; filename="{filename}"\r\n'
+            f'Content-Type: image/jpeg\r\n\r\n'.encode() + data + b'\r\n')
+    parts.append(f'--{boundary}--\r\n'.encode())
+    return b''.join(parts)
+
+
+def run_upload(args, upstreams):
+    photos = make_photos(args.photos, args.photo_size, args.seed)
+    batches = [photos[i:i + args.upload_batch] for i in range(0, len(photos), args.upload_batch)]
+    boundary = 'dashboard-benchmark-boundary'
+
+    with running_dashboard(args, upstreams, args.calendar_events[0]) as dashboard:
+        def upload(batch):
+            started = time.perf_counter()
+            status, body = dashboard.request('POST', '/upload', multipart_body(batch, boundary), {
+                'Content-Type': f'multipart/form-data; boundary={boundary}'
+            }, timeout=300)
+            match = re.search(rb'data-batch="([0-9a-f]+)"', body)
+            return time.perf_counter() - started, match.group(1).decode() if status == 200 and match else None
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(args.upload_concurrency) as pool:
+            uploads = list(pool.map(upload, batches))
+        uploaded = time.perf_counter() - started
+
+        # Then wait for the image workers to verify and resize everything
+        batch_ids = [batch_id for _, batch_id in uploads if batch_id]
+        jobs = []
+        deadline = time.monotonic() + args.ready_timeout
+        while time.monotonic() < deadline:
+            jobs = []
+            for batch_id in batch_ids:
+                status, body = dashboard.request('GET', f"/api/upload/jobs/{batch_id}")
+                jobs.extend(json.loads(body)['jobs'] if status == 200 else [])
+            if all(job['status'] in ('done', 'failed') for job in jobs):
+                break
+            time.sleep(0.2)
+        processed = time.perf_counter() - started
+
+        # Per upload request; throughput counts photos, not requests
+        stored = sum(len(batch) for batch, (_, batch_id) in zip(batches, uploads) if batch_id)
+        result = summarize([latency for latency, batch_id in uploads if batch_id],
+                           sum(1 for _, batch_id in uploads if not batch_id), uploaded)
+        result.update(dashboard.memory(), throughput=stored / uploaded,
+                      photos=len(photos), megabytes=sum(len(data) for _, data in photos) / 1e6,
+                      processed_seconds=processed,
+                      failed_jobs=sum(1 for job in jobs if job['status'] != 'done'))
+    return {'upload': result}
+
+
+RUNNERS = {'calendar': run_calendar, 'weather': run_weather, 'doorbell': run_doorbell, 'upload': run_upload}
+
+
+def release(directory):
+    try:
+        return subprocess.run(['git', 'describe', '--always', '--dirty', '--tags'], cwd=directory,
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def _figure(value, unit=''):
+    return '-' if value is None else f"{value:.1f}{unit}"
+
+
+def print_result(name, result):
+    print(f"{name:<18} {_figure(result['throughput']):>9}/s  p50 {_figure(result['p50_ms'], ' ms'):>10}  "
+          f"p99 {_figure(result['p99_ms'], ' ms'):>10}  peak RSS {_figure(result['peak_rss_mb'], ' MB'):>9}  "
+          f"errors {result['errors']}")
+
+
+def compare(previous, current, max_regression=None):
+    """Print each compared figure against the previous run; returns the regressions over the limit"""
+    regressions = []
+    print(f"\nCompared with {previous.get('release') or 'previous run'} ({previous.get('started_at', '?')}):")
+    for name, result in current['scenarios'].items():
+        before = previous.get('scenarios', {}).get(name)
+        if not before:
+            continue
+        for metric, higher_is_better in COMPARED:
+            old, new = before.get(metric), result.get(metric)
+            if not old or new is None:
+                continue
+            change = (new - old) / old * 100
+            worse = -change if higher_is_better else change
+            flag = ''
+            if max_regression is not None and worse > max_regression:
+                flag = '  REGRESSION'
+                regressions.append(f"{name} {metric} {change:+.1f}%")
+            print(f"  {name:<18} {metric:<12} {old:>10.1f} -> {new:>10.1f}  ({change:+.1f}%){flag}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--scenarios', default=','.join(SCENARIOS), help='comma-separated, from ' + ', '.join(SCENARIOS))
+    parser.add_argument('--app-dir', default=ROOT, help='tree to benchmark, e.g. a git worktree of an older release')
+    parser.add_argument('--duration', type=float, default=10, help='seconds of polling per calendar/weather run')
+    parser.add_argument('--panels', type=int, default=20, help='concurrent panels polling an endpoint')
+    parser.add_argument('--calendar-events', default='100,1000,10000,50000', help='feed sizes to run')
+    parser.add_argument('--clients', type=int, default=20, help='Socket.IO clients receiving doorbell events')
+    parser.add_argument('--bursts', type=int, default=5)
+    parser.add_argument('--burst-size', type=int, default=10, help='doorbell events emitted at once')
+    parser.add_argument('--burst-interval', type=float, default=2, help='seconds between bursts')
+    parser.add_argument('--burst-timeout', type=float, default=15, help='seconds to wait for a burst to arrive')
+    parser.add_argument('--poll-events', action='store_true', help='poll for doorbell events instead of streaming')
+    parser.add_argument('--photos', type=int, default=40)
+    parser.add_argument('--photo-size', default='1600x1200')
+    parser.add_argument('--upload-batch', type=int, default=10, help='photos per upload request')
+    parser.add_argument('--upload-concurrency', type=int, default=2)
+    parser.add_argument('--delay-ms', type=float, default=0, help='added to every upstream response')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--ready-timeout', type=float, default=600, help='seconds to wait for the server')
+    parser.add_argument('--output', help='write the results as JSON')
+    parser.add_argument('--compare', help='results JSON of a previous run')
+    parser.add_argument('--max-regression', type=float, default=None, help='fail if a figure is this many %% worse')
+    args = parser.parse_args()
+    args.calendar_events = [int(size) for size in args.calendar_events.split(',') if size.strip()]
+    args.photo_size = tuple(int(side) for side in args.photo_size.lower().split('x'))
+    scenarios = [name.strip() for name in args.scenarios.split(',') if name.strip()]
+    unknown = set(scenarios) - set(SCENARIOS)
+    if unknown:
+        parser.error(f"unknown scenarios: {', '.join(sorted(unknown))}")
+    # The Socket.IO client goes through requests, which would otherwise honour a configured proxy
+    os.environ['NO_PROXY'] = '127.0.0.1,localhost'
+
+    results = {
+        'release': release(args.app_dir),
+        'started_at': datetime.now().isoformat(timespec='seconds'),
+        'host': {'python': platform.python_version(), 'platform': platform.platform(), 'cpus': os.cpu_count()},
+        'settings': {key: value for key, value in vars(args).items() if key not in ('output', 'compare')},
+        'scenarios': {},
+    }
+    with tempfile.TemporaryDirectory(prefix='dashboard-upstreams-') as directory:
+        upstreams = Upstreams(directory, args.delay_ms / 1000, args.seed)
+        try:
+            for scenario in scenarios:
+                for name, result in RUNNERS[scenario](args, upstreams).items():
+                    results['scenarios'][name] = result
+                    print_result(name, result)
+        finally:
+            upstreams.stop()
+
+    if args.output:
+        with open(args.output, 'w') as output:
+            json.dump(results, output, indent=2)
+        print(f"Results written to {args.output}")
+
+    regressions = []
+    if args.compare:
+        with open(args.compare) as previous:
+            regressions = compare(json.load(previous), results, args.max_regression)
+    for regression in regressions:
+        print(f"FAIL: {regression}")
+    return 1 if regressions else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,504 @@
+import bisect
+import hashlib
+import heapq
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
+
+from datetime import datetime, timedelta
+
+import requests
+
+from metrics import UPSTREAM_SECONDS
+from recurrence import RecurrenceExpander, parse_recurrence_id, recurrence_spec
+
+logger = logging.getLogger(__name__)
+
+
+def event_version(event):
+    """Version of an event as published by the feed (SEQUENCE, LAST-MODIFIED)"""
+    return (event.get('sequence'), event.get('last_modified'))
+
+
+def iter_component_blocks(lines, names=(b'VEVENT', b'VTIMEZONE')):
+    """Yield (name, raw bytes) of each of the named components in a stream of iCal lines"""
+    block = None
+    name = None
+    for line in lines:
+        if block is None:
+            if line.startswith(b'BEGIN:'):
+                name = line[6:].strip()
+                if name in names:
+                    block = [line]
+            continue
+        block.append(line)
+        if line.startswith(b'END:') and line[4:].strip() == name:
+            yield name, b'\r\n'.join(block)
+            block = None
+
+
+def event_sort_key(event):
+    """Sort key for an event occurrence: its local start date and time"""
+    return (event.get('start_date') or '', event.get('start_time') or '')
+
+
+def diff_events(old_events, new_events):
+    """Work out which events were added, changed or removed, keyed by event id"""
+    old = {event['id']: event for event in old_events}
+    new = {event['id']: event for event in new_events}
+
+    added = [event for event_id, event in new.items() if event_id not in old]
+    removed = [event_id for event_id in old if event_id not in new]
+    changed = []
+    for event_id, event in new.items():
+        previous = old.get(event_id)
+        if previous is None or previous is event:
+            continue
+        if event_version(previous) != event_version(event):
+            changed.append(event)
+        elif not event.get('last_modified') and previous != event:
+            # Feeds without LAST-MODIFIED can only be compared field by field
+            changed.append(event)
+
+    return {'added': added, 'changed': changed, 'removed': removed}
+
+
+def occurrence_event(event, start, duration, timezone):
+    """Copy of a recurring event moved to one of its occurrences"""
+    instance = dict(event)
+    instance['id'] = f"{event['id']}/{start.isoformat()}"
+    if isinstance(start, datetime):
+        start = start.astimezone(timezone)
+        instance['start_time'] = start.strftime('%H:%M:%S')
+        instance['timezone_offset'] = start.utcoffset().total_seconds() / 3600
+    instance['date'] = instance['start_date'] = start.strftime('%Y-%m-%d')
+
+    if duration is not None:
+        end = start + timedelta(seconds=duration)
+        instance['end_date'] = end.strftime('%Y-%m-%d')
+        if isinstance(end, datetime):
+            instance['end_time'] = end.strftime('%H:%M:%S')
+    return instance
+
+
+def build_index(events):
+    """Sorted (keys, events) lists for bisecting by start date"""
+    ordered = sorted(events, key=event_sort_key)
+    return [event_sort_key(event) for event in ordered], ordered
+
+
+class EventStore:
+    """Shared state and refresh logic for a cached, queryable list of events.
+
+    Fresh results are served straight from memory. Once the TTL has expired the
+    last good result is still served immediately while a single background
+    refresh runs. Concurrent misses on a cold cache collapse into one refresh.
+
+    Events are kept in a list sorted by start, so a date-range query is a pair
+    of bisects rather than a scan. Every change bumps ``version``, records the
+    delta in ``last_changes`` and is passed to each callable in ``listeners``.
+    A ``read_only`` store only serves what it holds and never fetches, for a
+    worker that gets its events from the one running the pollers.
+    """
+
+    def __init__(self, ttl=300, retry_interval=30):
+        self.ttl = ttl
+        self.retry_interval = retry_interval
+
+        self.events = None
+        self.index = ([], [])
+        self.version = 0
+        self.last_changes = None
+        self.listeners = []
+        self.read_only = False
+        self.fetched_at = 0
+        self.failed_at = 0
+        self.last_error = None
+        # Lookups through get_events: fresh hits, stale hits (served while refreshing) and misses
+        self.hits = 0
+        self.stale_hits = 0
+        self.misses = 0
+
+        self._lock = threading.Lock()
+        self._inflight = None
+
+    def is_stale(self):
+        return time.time() - self.fetched_at >= self.ttl
+
+    def is_refreshing(self):
+        return self._inflight is not None
+
+    def get_events(self):
+        """Return the cached events, fetching or revalidating as needed"""
+        with self._lock:
+            events = self.events
+
+        if events is None:
+            self.misses += 1
+            if self.read_only:
+                raise RuntimeError('Calendar not loaded yet')
+            # Cold cache: every caller waits on the same upstream fetch
+            self.refresh()
+            with self._lock:
+                if self.events is None:
+                    raise RuntimeError(self.last_error or 'Calendar feed unavailable')
+                return self.events
+
+        if self.is_stale():
+            self.stale_hits += 1
+            if not self.read_only and time.time() - self.failed_at >= self.retry_interval:
+                self.refresh_in_background()
+        else:
+            self.hits += 1
+        return events
+
+    def query(self, start=None, end=None, limit=None):
+        """Return events starting between two YYYY-MM-DD dates (inclusive)"""
+        self.get_events()
+        return self.lookup(start, end, limit)
+
+    def lookup(self, start=None, end=None, limit=None):
+        """Like ``query``, but only reads what is in memory and never starts a fetch"""
+        keys, events = self.index
+        lo = bisect.bisect_left(keys, (start,)) if start else 0
+        hi = bisect.bisect_right(keys, (end, '\x7f')) if end else len(keys)
+        if limit is not None:
+            hi = min(hi, lo + limit)
+        return events[lo:hi]
+
+    def refresh_in_background(self):
+        """Start a revalidation unless one is already running"""
+        with self._lock:
+            if self._inflight is not None:
+                return
+        threading.Thread(target=self.refresh, daemon=True).start()
+
+    def refresh(self):
+        """Refresh the events, or wait for the refresh another caller already started"""
+        with self._lock:
+            inflight = self._inflight
+            leader = inflight is None
+            if leader:
+                inflight = self._inflight = threading.Event()
+
+        if not leader:
+            inflight.wait()
+            return
+
+        try:
+            self._fetch()
+        finally:
+            with self._lock:
+                self._inflight = None
+            inflight.set()
+
+    def _fetch(self):
+        raise NotImplementedError
+
+    def _publish_events(self, events, presorted=False):
+        """Swap in a new event list, updating the index and version on change"""
+        changes = diff_events(self.events or [], events)
+        changed = any(changes.values())
+        if changed or self.events is None:
+            index = ([event_sort_key(event) for event in events], events) if presorted else build_index(events)
+        else:
+            index = self.index
+
+        with self._lock:
+            if changed:
+                self.last_changes = dict(changes, base_version=self.version, version=self.version + 1)
+                self.version += 1
+            self.events = events
+            self.index = index
+
+        if changed:
+            for listener in self.listeners:
+                try:
+                    listener(self.last_changes)
+                except Exception as e:
+                    logger.error("Error notifying calendar listener: %s", e)
+
+
+class CalendarFeedCache(EventStore):
+    """Process-wide cache of the parsed events for one iCal feed.
+
+    Stale results are revalidated with a conditional GET (ETag /
+    Last-Modified). The feed is parsed as it streams in: it is split at VEVENT
+    boundaries and each raw block is hashed, so ``parser`` only runs again for
+    blocks that changed since the previous fetch. Recurring events are
+    expanded into their occurrences over the expander's horizon.
+
+    ``tags`` (for example the feed's name and color) are added to every event,
+    and the outcome of each fetch is recorded in ``status`` if one is given.
+    """
+
+    def __init__(self, url, parser, timezone, expander=None, tags=None, status=None, ttl=300,
+                 timeout=10, retry_interval=30, chunk_size=64 * 1024):
+        super().__init__(ttl=ttl, retry_interval=retry_interval)
+        self.url = url
+        self.parser = parser
+        self.timezone = timezone
+        self.expander = expander or RecurrenceExpander()
+        self.tags = tags or {}
+        self.status = status
+        self.timeout = timeout
+        self.chunk_size = chunk_size
+
+        self.etag = None
+        self.last_modified = None
+
+        # (event, recurrence spec) for each VEVENT block hash seen in the last fetch
+        self._parsed_blocks = {}
+        self._entries = []
+        self._materialized_on = None
+        self._occurrences = {}
+
+    def snapshot(self):
+        """JSON-serialisable state for a warm start after a restart"""
+        with self._lock:
+            return {
+                'fetched_at': self.fetched_at,
+                'etag': self.etag,
+                'last_modified': self.last_modified,
+                'blocks': {
+                    block_hash.hex(): [event, spec]
+                    for block_hash, (event, spec) in self._parsed_blocks.items()
+                }
+            }
+
+    def restore(self, state):
+        """Serve events from a snapshot until the next fetch replaces them"""
+        try:
+            parsed_blocks = {
+                bytes.fromhex(block_hash): (event, spec)
+                for block_hash, (event, spec) in state['blocks'].items()
+            }
+            # Set before publishing, so listeners do not see a cold feed and fetch it
+            with self._lock:
+                self._parsed_blocks = parsed_blocks
+                self.fetched_at = state.get('fetched_at', 0)
+                self.etag = state.get('etag')
+                self.last_modified = state.get('last_modified')
+            self._publish([entry for entry in parsed_blocks.values() if entry[0]])
+        except Exception as e:
+            logger.error("Error restoring calendar snapshot: %s", e)
+
+    def _fetch(self):
+        attempted_at = time.time()
+        started = time.monotonic()
+        not_modified = self._fetch_feed()
+        latency = time.monotonic() - started
+        if self.status is not None:
+            self.status.record(attempted_at, latency, self.last_error)
+        outcome = 'error' if self.last_error else 'not_modified' if not_modified else 'ok'
+        UPSTREAM_SECONDS.observe(latency, 'ics', 'fetch', outcome)
+
+    def _fetch_feed(self):
+        """Fetch and parse the feed; returns True if it had not changed (304)"""
+        headers = {}
+        if self.events is not None:
+            if self.etag:
+                headers['If-None-Match'] = self.etag
+            if self.last_modified:
+                headers['If-Modified-Since'] = self.last_modified
+
+        try:
+            logger.debug("Fetching calendar events from feed")
+            response = requests.get(self.url, headers=headers, timeout=self.timeout, stream=True)
+
+            with response:
+                if response.status_code == 304:
+                    logger.debug("Calendar feed not modified")
+                    if self._materialized_on != self._today():
+                        # New day: move the recurrence window forward
+                        self._publish(self._entries)
+                    with self._lock:
+                        self.fetched_at = time.time()
+                        self.last_error = None
+                    return True
+
+                response.raise_for_status()
+                entries, parsed_blocks = self._parse_stream(response)
+
+            self._publish(entries)
+
+            with self._lock:
+                self._parsed_blocks = parsed_blocks
+                self.fetched_at = time.time()
+                self.last_error = None
+                self.etag = response.headers.get('ETag')
+                self.last_modified = response.headers.get('Last-Modified')
+        except Exception as e:
+            logger.error("Error fetching calendar events: %s", e)
+            with self._lock:
+                self.failed_at = time.time()
+                self.last_error = str(e)
+        return False
+
+    def _today(self):
+        return datetime.now(self.timezone).date()
+
+    def _publish(self, entries):
+        """Expand recurrences and publish the resulting events"""
+        today = self._today()
+        self._publish_events(self._materialize(entries, today))
+        with self._lock:
+            self._entries = entries
+            self._materialized_on = today
+
+    def _materialize(self, entries, today):
+        """Flatten parsed entries into events, expanding recurring ones"""
+        start, end = self.expander.window(today)
+        overrides = {
+            (spec['uid'], parse_recurrence_id(spec['recurrence_id']))
+            for _, spec in entries if spec and 'recurrence_id' in spec
+        }
+
+        previous = self._occurrences
+        occurrences = {}
+        events = []
+        rules = []
+        for event, spec in entries:
+            if not spec or 'rrule' not in spec:
+                events.append(event)
+                continue
+
+            rules.append(spec)
+            for occurrence in self.expander.occurrences(spec, start, end):
+                if (spec['uid'], occurrence) in overrides:
+                    continue
+                # Reuse the occurrence built last time if its master is unchanged
+                key = (event['id'], occurrence)
+                cached = previous.get(key)
+                if cached is not None and cached[0] is event:
+                    instance = cached[1]
+                else:
+                    instance = occurrence_event(event, occurrence, spec['duration'], self.timezone)
+                occurrences[key] = (event, instance)
+                events.append(instance)
+
+        self.expander.prune(rules)
+        self._occurrences = occurrences
+        return events
+
+    def _parse_stream(self, response):
+        """Parse the VEVENTs in a streamed response, reusing unchanged blocks"""
+        # icalendar is slow to import, so it is loaded by the first fetch rather than at startup
+        from icalendar import Event, Timezone
+
+        previous = self._parsed_blocks
+        parsed_blocks = {}
+        entries = []
+        parsed_count = 0
+
+        lines = response.iter_lines(chunk_size=self.chunk_size)
+        for name, block in iter_component_blocks(lines):
+            if name == b'VTIMEZONE':
+                # Feeds define their zones before the events using them; parsing one registers
+                # its TZID with icalendar, so Windows or custom zone names resolve instead of
+                # leaving the times naive
+                self._parse_timezone(block, Timezone)
+                continue
+            block_hash = hashlib.blake2b(block, digest_size=16).digest()
+            if block_hash in parsed_blocks:
+                continue
+            if block_hash in previous:
+                entry = previous[block_hash]
+            else:
+                entry = self._parse_block(block, Event)
+                parsed_count += 1
+            parsed_blocks[block_hash] = entry
+            if entry[0]:
+                entries.append(entry)
+
+        logger.info("Total events parsed: %d (%d new or changed)", len(entries), parsed_count)
+        return entries, parsed_blocks
+
+    def _parse_timezone(self, block, timezone_type):
+        try:
+            timezone_type.from_ical(block.decode('utf-8', errors='replace'))
+        except Exception as e:
+            logger.error("Error parsing calendar timezone: %s", e)
+
+    def _parse_block(self, block, event_type):
+        try:
+            component = event_type.from_ical(block.decode('utf-8', errors='replace'))
+            event = self.parser(component)
+            if event:
+                event.update(self.tags)
+            return event, recurrence_spec(component) if event else None
+        except Exception as e:
+            logger.error("Error parsing calendar event: %s", e)
+            return None, None
+
+
+class CalendarAggregator(EventStore):
+    """Merge several calendar feeds into one event list.
+
+    Stale feeds are refreshed concurrently on a bounded thread pool. A feed
+    that is slower than ``timeout`` keeps running in the background and is
+    merged in when it finishes, so it never holds up the others. Feeds are
+    merged in one pass over their sorted indexes and deduplicated by event id,
+    the first feed in the list winning.
+    """
+
+    def __init__(self, feeds, max_workers=4, timeout=15):
+        super().__init__(ttl=min(feed.ttl for feed in feeds))
+        self.feeds = feeds
+        self.timeout = timeout
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='calendar-feed')
+        self._merged_versions = None
+
+    def snapshot(self):
+        return {feed.url: feed.snapshot() for feed in self.feeds if feed.events is not None}
+
+    def restore(self, state):
+        """Restore each feed from a snapshot and merge them without any network I/O"""
+        for feed in self.feeds:
+            if feed.url in state:
+                feed.restore(state[feed.url])
+
+        ready = [feed for feed in self.feeds if feed.events is not None]
+        if ready:
+            with self._lock:
+                self._merged_versions = tuple((id(feed), feed.version) for feed in ready)
+                self.fetched_at = min(feed.fetched_at for feed in ready)
+            self._publish_events(self._merge(ready), presorted=True)
+
+    def _fetch(self):
+        due = [
+            feed for feed in self.feeds
+            if (feed.events is None or feed.is_stale()) and not feed.is_refreshing()
+        ]
+        futures = [self._executor.submit(feed.refresh) for feed in due]
+        _, pending = wait(futures, timeout=self.timeout)
+        for future in pending:
+            logger.warning("Calendar feed still loading, merging it when it finishes")
+            future.add_done_callback(lambda _: self.refresh_in_background())
+
+        ready = [feed for feed in self.feeds if feed.events is not None]
+        if not ready:
+            errors = '; '.join(feed.last_error for feed in self.feeds if feed.last_error)
+            with self._lock:
+                self.failed_at = time.time()
+                self.last_error = errors or 'Calendar feeds unavailable'
+            return
+
+        versions = tuple((id(feed), feed.version) for feed in ready)
+        if versions != self._merged_versions or self.events is None:
+            self._publish_events(self._merge(ready), presorted=True)
+
+        with self._lock:
+            self._merged_versions = versions
+            self.fetched_at = time.time()
+            self.last_error = None
+
+    def _merge(self, feeds):
+        seen = set()
+        events = []
+        for event in heapq.merge(*(feed.index[1] for feed in feeds), key=event_sort_key):
+            if event['id'] not in seen:
+                seen.add(event['id'])
+                events.append(event)
+        return events
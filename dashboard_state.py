@@ -0,0 +1,137 @@
+import logging
+import os
+import threading
+import uuid
+from collections import deque
+
+from state_snapshot import load_snapshot, save_snapshot
+
+logger = logging.getLogger(__name__)
+
+
+class DashboardState:
+    """Latest data every dashboard panel shows, kept in one place.
+
+    One value per section (weather, calendar window, image catalog,
+    doorbell). ``update`` replaces a section and, only if it actually
+    changed, bumps ``version`` and passes ``emit`` a diff holding the
+    changed section and the version it applies on top of. Panels start from
+    a snapshot and apply diffs in order; a panel that comes back with the
+    version it already has is sent just the diffs it missed, for as long as
+    they are in the history. ``epoch`` tells versions from before a restart
+    apart.
+
+    With several worker processes only the one running the background
+    pollers is the ``leader``: its diffs reach every panel through the
+    Socket.IO message queue and it writes the state to ``mirror_path``.
+    The other workers ignore ``update`` and answer their panels' catch-ups
+    from that file, until ``lead`` makes them take over.
+    """
+
+    def __init__(self, emit, history_size=100, mirror_path=None, leader=True):
+        self.emit = emit
+        self.epoch = uuid.uuid4().hex
+        self.version = 0
+        self.mirror_path = mirror_path
+        self.leader = leader
+        self._sections = {}
+        self._history = deque(maxlen=history_size)
+        self._mirror_mtime = None
+        self._lock = threading.Lock()
+
+    def get(self, section):
+        with self._lock:
+            return self._sections.get(section)
+
+    def update(self, section, value):
+        """Replace a section; returns whether it changed"""
+        with self._lock:
+            return self._set(section, value)
+
+    def patch(self, section, values):
+        """Change some keys of a dict section, keeping the others"""
+        with self._lock:
+            return self._set(section, dict(self._sections.get(section) or {}, **values))
+
+    def snapshot(self):
+        with self._lock:
+            self._follow_mirror()
+            return self._snapshot()
+
+    def lead(self):
+        """Take over from the previous leader, carrying on from its last version"""
+        with self._lock:
+            self._follow_mirror()
+            self.leader = True
+
+    def catch_up(self, epoch, version, send):
+        """Bring one panel up to date: the diffs after ``version`` if still known, else a snapshot"""
+        with self._lock:
+            self._follow_mirror()
+            missed = self._since(version) if epoch == self.epoch else None
+            if missed is None:
+                send('dashboard_state', self._snapshot())
+            else:
+                for diff in missed:
+                    send('dashboard_diff', diff)
+
+    def stats(self):
+        with self._lock:
+            return {
+                'leader': self.leader,
+                'version': self.version,
+                'sections': sorted(self._sections),
+                'history': len(self._history)
+            }
+
+    def _set(self, section, value):
+        if not self.leader:
+            return False
+        if section in self._sections and self._sections[section] == value:
+            return False
+        self._sections[section] = value
+        diff = {'base_version': self.version, 'version': self.version + 1, 'changes': {section: value}}
+        self.version += 1
+        self._history.append(diff)
+        # Sent under the lock so every panel gets the diffs in version order
+        try:
+            self.emit(diff)
+        except Exception as e:
+            logger.error("Error sending dashboard update %s: %s", diff['version'], e)
+        if self.mirror_path:
+            save_snapshot(self.mirror_path, dashboard={
+                'epoch': self.epoch,
+                'version': self.version,
+                'sections': self._sections,
+                'history': list(self._history)
+            })
+        return True
+
+    def _follow_mirror(self):
+        if self.leader or not self.mirror_path:
+            return
+        try:
+            mtime = os.stat(self.mirror_path).st_mtime
+        except OSError:
+            return
+        if mtime == self._mirror_mtime:
+            return
+        mirror = load_snapshot(self.mirror_path).get('dashboard')
+        if mirror:
+            self.epoch = mirror['epoch']
+            self.version = mirror['version']
+            self._sections = mirror['sections']
+            self._history = deque(mirror['history'], maxlen=self._history.maxlen)
+        self._mirror_mtime = mtime
+
+    def _snapshot(self):
+        return {'epoch': self.epoch, 'version': self.version, 'state': dict(self._sections)}
+
+    def _since(self, version):
+        if not isinstance(version, int) or isinstance(version, bool) or version > self.version:
+            return None
+        if version == self.version:
+            return []
+        if not self._history or self._history[0]['base_version'] > version:
+            return None
+        return [diff for diff in self._history if diff['version'] > version]
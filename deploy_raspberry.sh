@@ -1,5 +1,6 @@
 # Add Nginx upload size configuration
-echo "client_max_body_size 50M;" > /etc/nginx/conf.d/upload_size.conf
+# Uploads are streamed to disk by the app, so nginx should pass them through unbuffered
+printf "client_max_body_size 1024M;\nproxy_request_buffering off;\n" > /etc/nginx/conf.d/upload_size.conf
 sudo systemctl restart nginx
 
 #!/bin/bash
@@ -20,6 +21,9 @@ print_success() {
     echo -e "\e[1;32m>>> Success: $1\e[0m"
 }
 
+# Number of app processes behind nginx (one port each, starting at 5000)
+DASHBOARD_WORKERS=${DASHBOARD_WORKERS:-1}
+
 # Check if script is run with sudo
 if [ "$EUID" -ne 0 ]; then
     print_error "Please run this script with sudo"
@@ -37,8 +41,14 @@ setup_environment() {
     cat > /opt/dashboard/.env << EOL
 OPENWEATHERMAP_API_KEY=${WEATHER_API_KEY}
 ICAL_FEED_URL=${CALENDAR_URL}
+DASHBOARD_WORKER=eventlet
 EOL
 
+    # Several processes pass Socket.IO broadcasts to each other through Redis
+    if [ "$DASHBOARD_WORKERS" -gt 1 ]; then
+        echo "SOCKETIO_MESSAGE_QUEUE=redis://127.0.0.1:6379/0" >> /opt/dashboard/.env
+    fi
+
     chmod 600 /opt/dashboard/.env
     print_success "Environment variables configured"
 }
@@ -49,6 +59,9 @@ install_dependencies() {
     
     apt-get update
     apt-get install -y python3-pip python3-venv python3-dev nginx build-essential
+    if [ "$DASHBOARD_WORKERS" -gt 1 ]; then
+        apt-get install -y redis-server
+    fi
     
     print_success "System dependencies installed"
 }
@@ -74,6 +87,9 @@ setup_application() {
 
     # Install Python dependencies in virtual environment
     /opt/dashboard/venv/bin/pip install -r /opt/dashboard/requirements.txt
+    if [ "$DASHBOARD_WORKERS" -gt 1 ]; then
+        /opt/dashboard/venv/bin/pip install redis
+    fi
 
     # Set proper permissions
     chown -R www-data:www-data /opt/dashboard
@@ -106,11 +122,11 @@ setup_application() {
 setup_systemd() {
     print_message "Configuring systemd service..."
     
-    # Create systemd service file
-    cat > /etc/systemd/system/dashboard.service << EOL
+    # One service instance per port, e.g. dashboard@5000
+    cat > /etc/systemd/system/dashboard@.service << EOL
 [Unit]
-Description=Dashboard Application
-After=network.target
+Description=Dashboard Application (port %i)
+After=network.target redis-server.service
 
 [Service]
 User=www-data
@@ -118,6 +134,7 @@ Group=www-data
 WorkingDirectory=/opt/dashboard
 Environment=PYTHONUNBUFFERED=1
 EnvironmentFile=/opt/dashboard/.env
+Environment=PORT=%i
 ExecStart=/opt/dashboard/venv/bin/python main.py
 Restart=always
 RestartSec=10
@@ -128,8 +145,10 @@ EOL
 
     # Reload systemd and enable service
     systemctl daemon-reload
-    systemctl enable dashboard
-    systemctl start dashboard
+    for i in $(seq 0 $((DASHBOARD_WORKERS - 1))); do
+        systemctl enable "dashboard@$((5000 + i))"
+        systemctl start "dashboard@$((5000 + i))"
+    done
     
     print_success "Systemd service configured"
 }
@@ -138,14 +157,34 @@ EOL
 setup_nginx() {
     print_message "Configuring Nginx..."
     
+    # A panel has to stick to one process for its Socket.IO session
+    UPSTREAM_SERVERS=""
+    for i in $(seq 0 $((DASHBOARD_WORKERS - 1))); do
+        UPSTREAM_SERVERS="${UPSTREAM_SERVERS}    server 127.0.0.1:$((5000 + i));\n"
+    done
+
     # Create Nginx configuration
     cat > /etc/nginx/sites-available/dashboard << EOL
+upstream dashboard_app {
+    ip_hash;
+$(printf "$UPSTREAM_SERVERS")
+}
+
+# Static URLs carry a content hash (?v=...), so those can be cached for good
+map \$arg_v \$static_cache_control {
+    ""      "no-cache";
+    default "public, max-age=31536000, immutable";
+}
+
 server {
     listen 80;
     server_name localhost;
 
     location / {
-        proxy_pass http://127.0.0.1:5000;
+        proxy_pass http://dashboard_app;
+        proxy_http_version 1.1;
+        proxy_set_header Upgrade \$http_upgrade;
+        proxy_set_header Connection "upgrade";
         proxy_set_header Host \$host;
         proxy_set_header X-Real-IP \$remote_addr;
         proxy_set_header X-Forwarded-For \$proxy_add_x_forwarded_for;
@@ -154,8 +193,10 @@ server {
 
     location /static {
         alias /opt/dashboard/static;
-        expires 30d;
-        add_header Cache-Control "public, no-transform";
+        # .gz copies are written next to the files by the app at startup
+        gzip_static on;
+        add_header Cache-Control \$static_cache_control;
+        add_header Vary Accept-Encoding;
     }
 }
 EOL
@@ -0,0 +1,169 @@
+import base64
+import io
+import json
+import logging
+import math
+import os
+import tempfile
+from datetime import datetime
+
+logger = logging.getLogger(__name__)
+
+# Display widths the carousel chooses between, largest first
+DISPLAY_WIDTHS = (1920, 1280)
+PLACEHOLDER_WIDTH = 32
+JPEG_QUALITY = 82
+WEBP_QUALITY = 80
+
+# EXIF orientations that swap width and height
+_TRANSPOSED_ORIENTATIONS = (5, 6, 7, 8)
+_EXIF_IFD = 0x8769
+_DATETIME_ORIGINAL = 0x9003
+_DATETIME = 0x0132
+
+
+def manifest_path(output_dir, source_name):
+    return os.path.join(output_dir, os.path.splitext(source_name)[0] + '.json')
+
+
+def load_manifest(output_dir, source_name):
+    """Manifest written by create_derivatives, or None if there is none yet"""
+    try:
+        with open(manifest_path(output_dir, source_name), 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def choose_variant(manifest, width=None):
+    """Smallest variant at least ``width`` pixels wide, else the largest there is"""
+    variants = manifest['variants']  # largest first
+    if not width:
+        return variants[0]
+    for variant in reversed(variants):
+        if variant['width'] >= width:
+            return variant
+    return variants[0]
+
+
+def create_derivatives(source_path, output_dir, widths=DISPLAY_WIDTHS, webp=True):
+    """Write display-size copies of an image plus a blur placeholder.
+
+    Orientation from EXIF is applied to the pixels and the copies are saved
+    without EXIF (only the colour profile is kept). Returns the manifest,
+    which is also written next to the copies as ``<name>.json``.
+    """
+    # Imported here so the web process never loads Pillow; this runs in the image workers
+    from PIL import Image, ImageOps
+
+    source_name = os.path.basename(source_path)
+    stem = os.path.splitext(source_name)[0]
+    os.makedirs(output_dir, exist_ok=True)
+
+    with Image.open(source_path) as img:
+        captured_at = _captured_at(img)
+        # The catalog records the photo's own size, so read it before the decoder is told to downscale
+        original_width, original_height = _oriented_size(img)
+        _draft(img, max(widths))
+        icc_profile = img.info.get('icc_profile')
+        img = ImageOps.exif_transpose(img)
+        if img.mode not in ('RGB', 'L'):
+            img = img.convert('RGB')
+        width, height = img.size
+
+        variants = []
+        for target in sorted({min(w, width) for w in widths}, reverse=True):
+            resized = img if target == width else img.resize(
+                (target, max(1, round(height * target / width))), Image.LANCZOS)
+            variant = {
+                'width': resized.width,
+                'height': resized.height,
+                'jpeg': _save(resized, output_dir, f"{stem}-{target}.jpg", 'JPEG', icc_profile,
+                              quality=JPEG_QUALITY, optimize=True, progressive=True)
+            }
+            if webp:
+                variant['webp'] = _save(resized, output_dir, f"{stem}-{target}.webp", 'WEBP', icc_profile,
+                                        quality=WEBP_QUALITY, method=4)
+            variants.append(variant)
+
+        placeholder = img.copy()
+        placeholder.thumbnail((PLACEHOLDER_WIDTH, PLACEHOLDER_WIDTH))
+        buffer = io.BytesIO()
+        placeholder.save(buffer, 'JPEG', quality=50)
+
+    manifest = {
+        'source': source_name,
+        'width': original_width,
+        'height': original_height,
+        'orientation': ('landscape' if original_width > original_height
+                        else 'portrait' if original_height > original_width else 'square'),
+        'captured_at': captured_at,
+        'variants': variants,
+        'placeholder': 'data:image/jpeg;base64,' + base64.b64encode(buffer.getvalue()).decode()
+    }
+    _write_atomic(manifest_path(output_dir, source_name), json.dumps(manifest).encode())
+    logger.info("Created %s display sizes for %s", len(variants), source_name)
+    return manifest
+
+
+def remove_derivatives(output_dir, manifest):
+    """Delete the display sizes and manifest made for an image"""
+    names = [manifest_path(output_dir, manifest['source'])]
+    for variant in manifest['variants']:
+        names.extend(variant[key] for key in ('jpeg', 'webp') if key in variant)
+    for name in names:
+        try:
+            os.remove(os.path.join(output_dir, name))
+        except FileNotFoundError:
+            pass
+
+
+def _captured_at(img):
+    """When the photo was taken, from EXIF, as an ISO timestamp (or None)"""
+    exif = img.getexif()
+    value = exif.get_ifd(_EXIF_IFD).get(_DATETIME_ORIGINAL) or exif.get(_DATETIME)
+    try:
+        return datetime.strptime(str(value).strip('\x00 '), '%Y:%m:%d %H:%M:%S').isoformat() if value else None
+    except ValueError:
+        return None
+
+
+def _oriented_size(img):
+    """(width, height) of the image as displayed, after its EXIF orientation is applied"""
+    width, height = img.size
+    if img.getexif().get(0x0112) in _TRANSPOSED_ORIENTATIONS:
+        return height, width
+    return width, height
+
+
+def _draft(img, max_width):
+    """Let the JPEG decoder downscale while decoding when the image is much larger than needed"""
+    if img.format != 'JPEG':
+        return
+    width, _ = _oriented_size(img)
+    if width <= max_width:
+        return
+    scale = max_width / width
+    requested = (math.ceil(img.size[0] * scale), math.ceil(img.size[1] * scale))
+    img.draft('RGB', requested)
+
+
+def _save(img, output_dir, name, image_format, icc_profile, **options):
+    buffer = io.BytesIO()
+    if icc_profile:
+        options['icc_profile'] = icc_profile
+    img.save(buffer, image_format, **options)
+    _write_atomic(os.path.join(output_dir, name), buffer.getvalue())
+    return name
+
+
+def _write_atomic(path, data):
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), prefix='.derived-', suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+        os.chmod(tmp_path, 0o644)
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
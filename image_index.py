@@ -0,0 +1,151 @@
+import json
+import logging
+import os
+import random
+import sqlite3
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+# Listing orders accepted by ImageIndex.listing
+ORDERS = ('name', 'date', 'added', 'shuffle')
+
+_COLUMNS = {
+    'filename': 'TEXT PRIMARY KEY',
+    'sha256': 'TEXT NOT NULL',
+    'size': 'INTEGER',
+    'added_at': 'REAL',
+    'mtime': 'REAL',
+    'width': 'INTEGER',
+    'height': 'INTEGER',
+    'orientation': 'TEXT',
+    'captured_at': 'TEXT',
+    'manifest': 'TEXT'
+}
+
+
+class ImageIndex:
+    """Persistent catalog of the carousel images (SQLite).
+
+    Keeps each image's content hash, dimensions, orientation, capture date
+    and display-size manifest. ``version`` goes up with every change and is
+    stored with the data, so listings can be revalidated without a query.
+    Reads come from an in-memory copy of the table that is only rebuilt when
+    the version changes, including changes made by other worker processes.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._version = 0
+        self._data_version = None
+        self._lock = threading.Lock()
+        self._conn = None
+        self._rows = None
+        self._orders = {}
+
+    @property
+    def version(self):
+        with self._lock:
+            self._sync_version()
+            return self._version
+
+    def find(self, sha256):
+        """Filename already stored with this SHA-256, or None"""
+        with self._lock:
+            row = self._db().execute('SELECT filename FROM images WHERE sha256 = ?', (sha256,)).fetchone()
+        return row[0] if row else None
+
+    def add(self, sha256, filename, size, mtime=None):
+        """Record a stored image; its metadata follows once it has been processed"""
+        self._write(
+            'INSERT OR REPLACE INTO images (filename, sha256, size, added_at, mtime) VALUES (?, ?, ?, ?, ?)',
+            (filename, sha256, size, time.time(), mtime)
+        )
+
+    def update_metadata(self, filename, manifest):
+        """Store the dimensions, capture details and display sizes of a processed image"""
+        self._write(
+            'UPDATE images SET width = ?, height = ?, orientation = ?, captured_at = ?, manifest = ? '
+            'WHERE filename = ?',
+            (manifest['width'], manifest['height'], manifest.get('orientation'),
+             manifest.get('captured_at'), json.dumps(manifest), filename)
+        )
+
+    def remove(self, filename):
+        self._write('DELETE FROM images WHERE filename = ?', (filename,))
+
+    def entries(self):
+        """Every image as a dict, keyed by filename"""
+        return {row['filename']: row for row in self._all_rows()[1]}
+
+    def listing(self, order='name', seed=None):
+        """Every image as a dict, in the given order; ``seed`` fixes a shuffle so pages line up"""
+        version, rows = self._all_rows()
+        if order == 'shuffle':
+            rows = sorted(rows, key=lambda row: row['filename'])
+            random.Random(seed).shuffle(rows)
+            return rows
+        key = (version, order)
+        ordered = self._orders.get(key)
+        if ordered is None:
+            if order == 'date':
+                ordered = sorted(rows, key=lambda row: row['captured_at'] or '', reverse=True)
+            elif order == 'added':
+                ordered = sorted(rows, key=lambda row: row['added_at'] or 0, reverse=True)
+            else:
+                ordered = sorted(rows, key=lambda row: row['filename'])
+            self._orders = {key: ordered}
+        return ordered
+
+    def _all_rows(self):
+        with self._lock:
+            self._sync_version()
+            if self._rows is None or self._rows[0] != self._version:
+                db = self._db()
+                cursor = db.execute(f"SELECT {', '.join(_COLUMNS)} FROM images")
+                rows = []
+                for values in cursor:
+                    row = dict(zip(_COLUMNS, values))
+                    row['manifest'] = json.loads(row['manifest']) if row['manifest'] else None
+                    rows.append(row)
+                self._rows = (self._version, rows)
+            return self._rows
+
+    def _write(self, sql, params):
+        with self._lock:
+            db = self._db()
+            db.execute(sql, params)
+            # Counted in the database, which other worker processes write to as well
+            row = db.execute("SELECT value FROM meta WHERE key = 'version'").fetchone()
+            self._version = (int(row[0]) if row else 0) + 1
+            db.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('version', ?)", (str(self._version),))
+            db.commit()
+
+    def _db(self):
+        if self._conn is None:
+            os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+            self._conn = sqlite3.connect(self.path, check_same_thread=False)
+            self._conn.execute('PRAGMA journal_mode=WAL')
+            self._conn.execute(
+                f"CREATE TABLE IF NOT EXISTS images ({', '.join(f'{name} {kind}' for name, kind in _COLUMNS.items())})"
+            )
+            # Catalogs created before the metadata columns existed
+            existing = {row[1] for row in self._conn.execute('PRAGMA table_info(images)')}
+            for name, kind in _COLUMNS.items():
+                if name not in existing:
+                    self._conn.execute(f"ALTER TABLE images ADD COLUMN {name} {kind}")
+            self._conn.execute('CREATE INDEX IF NOT EXISTS images_sha256 ON images (sha256)')
+            self._conn.execute('CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)')
+            self._conn.commit()
+            logger.info("Opened image catalog %s", self.path)
+        return self._conn
+
+    def _sync_version(self):
+        # data_version only moves when another connection has committed
+        db = self._db()
+        data_version = db.execute('PRAGMA data_version').fetchone()[0]
+        if data_version != self._data_version:
+            row = db.execute("SELECT value FROM meta WHERE key = 'version'").fetchone()
+            self._version = int(row[0]) if row else 0
+            self._data_version = data_version
@@ -0,0 +1,139 @@
+import logging
+import threading
+import time
+import uuid
+from collections import OrderedDict, deque
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from image_derivatives import create_derivatives
+
+logger = logging.getLogger(__name__)
+
+
+def process_image(source_path, output_dir):
+    """Verify an uploaded image and make its display sizes; runs in a worker process"""
+    from PIL import Image
+
+    with Image.open(source_path) as img:
+        img.verify()
+    return create_derivatives(source_path, output_dir)
+
+
+class ImageJobQueue:
+    """Queue of CPU-bound image jobs run in a bounded process pool.
+
+    At most ``max_workers`` jobs run at once and the rest wait in a FIFO, so
+    a large upload batch never occupies more than that many cores and the
+    web server's own process stays free. Each file has at most one job
+    queued or running; submitting it again returns the existing job.
+    ``on_update`` is called with a copy of the job whenever its status
+    changes (queued, processing, done or failed).
+    """
+
+    def __init__(self, task, max_workers=2, on_update=None, max_history=500):
+        self.task = task
+        self.max_workers = max_workers
+        self.on_update = on_update
+        self.max_history = max_history
+
+        self._jobs = OrderedDict()
+        self._active = {}
+        self._queue = deque()
+        self._running = 0
+        self._pool = None
+        self._lock = threading.Lock()
+
+    def submit(self, filename, *args, batch=None):
+        """Queue a job for filename, calling task(*args) in a worker; returns the job"""
+        with self._lock:
+            job_id = self._active.get(filename)
+            if job_id is not None:
+                return dict(self._jobs[job_id])
+            job = {
+                'id': uuid.uuid4().hex,
+                'batch': batch,
+                'filename': filename,
+                'status': 'queued',
+                'error': None,
+                'result': None,
+                'queued_at': time.time(),
+                'finished_at': None
+            }
+            self._jobs[job['id']] = job
+            self._active[filename] = job['id']
+            self._queue.append((job['id'], args))
+            while len(self._jobs) > self.max_history:
+                oldest = next(iter(self._jobs))
+                if self._jobs[oldest]['status'] not in ('done', 'failed'):
+                    break
+                del self._jobs[oldest]
+        self._notify(job)
+        self._dispatch()
+        return dict(job)
+
+    def get(self, job_id):
+        with self._lock:
+            job = self._jobs.get(job_id)
+            return dict(job) if job else None
+
+    def batch(self, batch):
+        """Every job of an upload batch, in submission order"""
+        with self._lock:
+            return [dict(job) for job in self._jobs.values() if job['batch'] == batch]
+
+    def stats(self):
+        with self._lock:
+            return {
+                'queued': len(self._queue),
+                'running': self._running,
+                'workers': self.max_workers
+            }
+
+    def _dispatch(self):
+        started = []
+        with self._lock:
+            while self._running < self.max_workers and self._queue:
+                job_id, args = self._queue.popleft()
+                job = self._jobs[job_id]
+                if self._pool is None:
+                    self._pool = ProcessPoolExecutor(max_workers=self.max_workers)
+                try:
+                    future = self._pool.submit(self.task, *args)
+                except BrokenProcessPool:
+                    # A worker died; start a fresh pool and try again
+                    self._pool = ProcessPoolExecutor(max_workers=self.max_workers)
+                    future = self._pool.submit(self.task, *args)
+                self._running += 1
+                job['status'] = 'processing'
+                started.append((job, future))
+        for job, future in started:
+            self._notify(job)
+            future.add_done_callback(lambda future, job_id=job['id']: self._finished(job_id, future))
+
+    def _finished(self, job_id, future):
+        with self._lock:
+            self._running -= 1
+            job = self._jobs.get(job_id)
+            if job is not None:
+                try:
+                    job['result'] = future.result()
+                    job['status'] = 'done'
+                except Exception as e:
+                    job['status'] = 'failed'
+                    job['error'] = str(e) or type(e).__name__
+                job['finished_at'] = time.time()
+                self._active.pop(job['filename'], None)
+        if job is not None:
+            if job['status'] == 'failed':
+                logger.error("Image job for %s failed: %s", job['filename'], job['error'])
+            self._notify(job)
+        self._dispatch()
+
+    def _notify(self, job):
+        if self.on_update is None:
+            return
+        try:
+            self.on_update(dict(job))
+        except Exception as e:
+            logger.error("Error reporting image job %s: %s", job['id'], e)
@@ -0,0 +1,189 @@
+import atexit
+import logging
+import logging.handlers
+import os
+import queue
+import sys
+import threading
+import time
+
+LOG_FORMAT = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+
+
+def parse_logger_settings(value):
+    """``"calendar_feed=WARNING,app=DEBUG"`` as a dict of logger name to value"""
+    settings = {}
+    for item in (value or '').split(','):
+        name, sep, setting = item.partition('=')
+        if sep and name.strip() and setting.strip():
+            settings[name.strip()] = setting.strip()
+    return settings
+
+
+class RepeatFilter(logging.Filter):
+    """Rate limit records that keep repeating, such as an error raised every second.
+
+    Records are keyed by logger, level and call site (file and line), so
+    calls with different arguments, f-strings included, still count as
+    repeats and the number of keys stays bounded. Up to ``limit`` records per key pass in each ``interval``; the
+    rest are dropped, and the first record let through afterwards says how
+    many were. Only records at ``min_level`` and above are limited.
+    """
+
+    def __init__(self, limit=5, interval=60, min_level=logging.WARNING):
+        super().__init__()
+        self.limit = limit
+        self.interval = interval
+        self.min_level = min_level
+        self._windows = {}
+
+    def filter(self, record):
+        if record.levelno < self.min_level or self.limit <= 0:
+            return True
+        key = (record.name, record.levelno, record.pathname, record.lineno)
+        now = time.monotonic()
+        window = self._windows.get(key)
+        if window is None or now - window[0] >= self.interval:
+            suppressed = window[2] if window else 0
+            self._windows[key] = [now, 1, 0]
+            if suppressed:
+                record.msg = f"{record.msg} ({suppressed} similar messages suppressed)"
+            return True
+        window[1] += 1
+        if window[1] > self.limit:
+            window[2] += 1
+            return False
+        return True
+
+
+class SampleFilter(logging.Filter):
+    """Keep one in every N records below WARNING for chatty loggers.
+
+    ``rates`` maps a logger name (and its children) to N. Counting is per
+    call site, so a rare message is not drowned out by a frequent one.
+    """
+
+    def __init__(self, rates):
+        super().__init__()
+        self.rates = rates
+        self._rate_by_name = {}
+        self._counts = {}
+
+    def filter(self, record):
+        if record.levelno >= logging.WARNING or not self.rates:
+            return True
+        rate = self._rate_by_name.get(record.name)
+        if rate is None:
+            rate = self._rate_by_name[record.name] = self._rate_for(record.name)
+        if rate <= 1:
+            return True
+        key = (record.name, record.pathname, record.lineno)
+        count = self._counts.get(key, 0)
+        self._counts[key] = count + 1
+        return count % rate == 0
+
+    def _rate_for(self, name):
+        while name:
+            if name in self.rates:
+                return self.rates[name]
+            name = name.rpartition('.')[0]
+        return 1
+
+
+class DeferredQueueHandler(logging.handlers.QueueHandler):
+    """QueueHandler that leaves formatting to the listener thread.
+
+    The stock handler formats every record on the calling thread before
+    queueing it; here the record goes on the queue as it is, so the request
+    or event-loop thread only pays for the filters and a queue put. Records
+    stay in this process, so their arguments need not be picklable.
+    """
+
+    def prepare(self, record):
+        return record
+
+
+def _start_os_thread(target):
+    """Run ``target`` on a real OS thread even if eventlet or gevent patched threading; returns a join function.
+
+    A green thread would run the handlers' blocking file and console writes
+    on the event loop, which is what queueing the records is meant to avoid.
+    """
+    if 'eventlet' in sys.modules:
+        from eventlet import patcher
+        if patcher.is_monkey_patched('thread'):
+            thread = patcher.original('threading').Thread(target=target, daemon=True)
+            thread.start()
+            return thread.join
+    if 'gevent' in sys.modules:
+        from gevent import monkey
+        if monkey.is_module_patched('threading'):
+            start_new_thread, allocate_lock = monkey.get_original('_thread', ['start_new_thread', 'allocate_lock'])
+            finished = allocate_lock()
+            finished.acquire()
+
+            def run():
+                try:
+                    target()
+                finally:
+                    finished.release()
+
+            start_new_thread(run, ())
+            return finished.acquire
+    thread = threading.Thread(target=target, daemon=True)
+    thread.start()
+    return thread.join
+
+
+class OSThreadQueueListener(logging.handlers.QueueListener):
+    """QueueListener whose thread is always a real OS thread (see _start_os_thread).
+
+    The queue is a ``queue.SimpleQueue``, which eventlet and gevent leave
+    alone: putting never blocks a green thread, and the blocking get only
+    ever runs on the listener's own OS thread. ``stop`` can be called twice.
+    """
+
+    def start(self):
+        self._thread = _start_os_thread(self._monitor)
+
+    def stop(self):
+        if self._thread is not None:
+            self.enqueue_sentinel()
+            self._thread()
+            self._thread = None
+
+
+def configure_logging(level='INFO', levels=None, sample=None, log_file=None, max_bytes=5 * 1024 * 1024,
+                      backup_count=3, repeat_limit=5, repeat_interval=60):
+    """Send all logging through a queue to stdout and a rotating file, written by one listener thread.
+
+    ``levels`` and ``sample`` map logger names to a level and a sampling rate
+    (keep one in N records below WARNING). Returns the started listener,
+    which is also stopped at exit so queued records are flushed.
+    """
+    formatter = logging.Formatter(LOG_FORMAT)
+    handlers = [logging.StreamHandler()]
+    if log_file:
+        os.makedirs(os.path.dirname(log_file) or '.', exist_ok=True)
+        handlers.append(logging.handlers.RotatingFileHandler(
+            log_file, maxBytes=max_bytes, backupCount=backup_count, encoding='utf-8'))
+    for handler in handlers:
+        handler.setFormatter(formatter)
+
+    log_queue = queue.SimpleQueue()
+    queue_handler = DeferredQueueHandler(log_queue)
+    queue_handler.addFilter(SampleFilter({name: int(rate) for name, rate in (sample or {}).items()}))
+    queue_handler.addFilter(RepeatFilter(limit=repeat_limit, interval=repeat_interval))
+
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    root.addHandler(queue_handler)
+    root.setLevel(level.upper() if isinstance(level, str) else level)
+    for name, logger_level in (levels or {}).items():
+        logging.getLogger(name).setLevel(logger_level.upper())
+
+    listener = OSThreadQueueListener(log_queue, *handlers, respect_handler_level=True)
+    listener.start()
+    atexit.register(listener.stop)
+    return listener
@@ -1,6 +1,27 @@
-from app import app, socketio
+import os
 
-if __name__ == "__main__":
+# Patch before anything else is imported, so the threads, sockets and SSL used by
+# requests, the UniFi client and the background pollers all yield to the event loop
+DASHBOARD_WORKER = os.environ.setdefault('DASHBOARD_WORKER', 'eventlet')
+if DASHBOARD_WORKER == 'gevent':
+    from gevent import monkey
+    monkey.patch_all()
+elif DASHBOARD_WORKER == 'eventlet':
     import eventlet
     eventlet.monkey_patch()
-    socketio.run(app, host='0.0.0.0', port=5000, debug=True, use_reloader=True, log_output=True)
+else:
+    raise SystemExit(f"Unsupported DASHBOARD_WORKER {DASHBOARD_WORKER!r}, expected eventlet or gevent")
+
+from app import create_app, socketio, start_background_services  # noqa: E402
+
+app = create_app()
+
+if __name__ == "__main__":
+    # Run one process per port behind nginx; set SOCKETIO_MESSAGE_QUEUE when there are several
+    port = int(os.environ.get('PORT', 5000))
+    debug = os.environ.get('DASHBOARD_DEBUG', '').lower() in ('1', 'true', 'yes')
+    # With the reloader only the child process it spawns serves requests
+    if not debug or os.environ.get('WERKZEUG_RUN_MAIN') == 'true':
+        start_background_services()
+    socketio.run(app, host=os.environ.get('HOST', '0.0.0.0'), port=port,
+                 debug=debug, use_reloader=debug, log_output=debug)
@@ -0,0 +1,152 @@
+import bisect
+import time
+from contextlib import contextmanager
+
+# Seconds; request and upstream latencies on a Pi mostly fall between 5 ms and 10 s
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+_registry = []
+
+
+def _label_text(names, values):
+    if not names:
+        return ''
+    pairs = ','.join(f'{name}="{_escape(value)}"' for name, value in zip(names, values))
+    return '{' + pairs + '}'
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _number(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    """Monotonic count per label set.
+
+    Updates take no lock: a label set's cell is created once and then only
+    incremented, which is safe between green threads and at worst drops a
+    rare increment between OS threads, a fair trade for a metrics counter.
+    """
+
+    kind = 'counter'
+
+    def __init__(self, name, documentation, labels=()):
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+        self._values = {}
+        _registry.append(self)
+
+    def inc(self, *label_values, amount=1):
+        cell = self._values.get(label_values)
+        if cell is None:
+            cell = self._values.setdefault(label_values, [0])
+        cell[0] += amount
+
+    def samples(self):
+        for label_values, cell in list(self._values.items()):
+            yield self.name, self.labels, label_values, cell[0]
+
+
+class Histogram:
+    """Distribution of observed values (seconds) per label set.
+
+    Each label set gets its bucket counts allocated once, on first use; an
+    observation is a bisect and two additions, without locks (see Counter).
+    """
+
+    kind = 'histogram'
+
+    def __init__(self, name, documentation, labels=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+        self.buckets = tuple(sorted(buckets))
+        self._series = {}
+        _registry.append(self)
+
+    def observe(self, value, *label_values):
+        series = self._series.get(label_values)
+        if series is None:
+            series = self._series.setdefault(label_values, [[0] * (len(self.buckets) + 1), 0.0])
+        series[0][bisect.bisect_left(self.buckets, value)] += 1
+        series[1] += value
+
+    @contextmanager
+    def time(self, *label_values):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, *label_values)
+
+    def samples(self):
+        names = self.labels + ('le',)
+        for label_values, (counts, total) in list(self._series.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += count
+                yield f"{self.name}_bucket", names, label_values + (_number(bound),), cumulative
+            yield f"{self.name}_sum", self.labels, label_values, total
+            yield f"{self.name}_count", self.labels, label_values, cumulative
+
+
+class Collected:
+    """Values read only when metrics are scraped, e.g. a connection count or cache statistics.
+
+    ``collect`` returns a number, or a dict of label-value tuples to numbers.
+    """
+
+    def __init__(self, name, documentation, collect, labels=(), kind='gauge'):
+        self.name = name
+        self.documentation = documentation
+        self.collect = collect
+        self.labels = tuple(labels)
+        self.kind = kind
+        _registry.append(self)
+
+    def samples(self):
+        values = self.collect()
+        if not isinstance(values, dict):
+            values = {(): values}
+        for label_values, value in values.items():
+            yield self.name, self.labels, label_values, value
+
+
+def render():
+    """All registered metrics in the Prometheus text format"""
+    lines = []
+    for metric in _registry:
+        lines.append(f"# HELP {metric.name} {metric.documentation}")
+        lines.append(f"# TYPE {metric.name} {metric.kind}")
+        for name, label_names, label_values, value in metric.samples():
+            lines.append(f"{name}{_label_text(label_names, label_values)} {_number(value)}")
+    return '\n'.join(lines) + '\n'
+
+
+HTTP_REQUEST_SECONDS = Histogram(
+    'dashboard_http_request_duration_seconds', 'Time to produce an HTTP response, by route', ('route', 'method'))
+HTTP_RESPONSES = Counter(
+    'dashboard_http_responses_total', 'HTTP responses, by route and status', ('route', 'method', 'status'))
+UPSTREAM_SECONDS = Histogram(
+    'dashboard_upstream_request_duration_seconds', 'Time spent on calls to upstream services',
+    ('upstream', 'operation', 'outcome'))
+SOCKETIO_EMIT_SECONDS = Histogram(
+    'dashboard_socketio_emit_seconds', 'Time to fan a Socket.IO event out to its clients', ('event',))
+
+
+@contextmanager
+def track_upstream(upstream, operation):
+    """Time a call to an upstream service, labelled by whether it raised"""
+    started = time.perf_counter()
+    outcome = 'error'
+    try:
+        yield
+        outcome = 'ok'
+    finally:
+        UPSTREAM_SECONDS.observe(time.perf_counter() - started, upstream, operation, outcome)
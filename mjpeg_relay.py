@@ -0,0 +1,180 @@
+import logging
+import subprocess
+import threading
+import time
+from collections import deque
+
+logger = logging.getLogger(__name__)
+
+BOUNDARY = 'frame'
+
+_JPEG_START = b'\xff\xd8'
+_JPEG_END = b'\xff\xd9'
+# Sent while there is no frame yet; before the first boundary it is ignorable preamble
+KEEPALIVE_CHUNK = b'\r\n'
+
+
+def multipart_chunk(frame):
+    """One part of a multipart/x-mixed-replace MJPEG response"""
+    return (f"--{BOUNDARY}\r\nContent-Type: image/jpeg\r\nContent-Length: {len(frame)}\r\n\r\n".encode()
+            + frame + b'\r\n')
+
+
+class FfmpegSource:
+    """JPEG frames transcoded from an RTSP stream by an ffmpeg subprocess"""
+
+    def __init__(self, rtsp_url, fps=5, quality=5, read_size=65536):
+        self.rtsp_url = rtsp_url
+        self.fps = fps
+        self.quality = quality
+        self.read_size = read_size
+        self._process = None
+
+    def frames(self):
+        self._process = subprocess.Popen(
+            ['ffmpeg', '-loglevel', 'error', '-rtsp_transport', 'tcp', '-i', self.rtsp_url,
+             '-an', '-r', str(self.fps), '-q:v', str(self.quality),
+             '-f', 'image2pipe', '-vcodec', 'mjpeg', '-'],
+            stdin=subprocess.DEVNULL, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL
+        )
+        buffer = b''
+        while True:
+            chunk = self._process.stdout.read1(self.read_size)
+            if not chunk:
+                raise ConnectionError(f"ffmpeg exited with status {self._process.poll()}")
+            buffer += chunk
+            # ffmpeg's MJPEG output is a plain run of JPEGs, split on their markers
+            while True:
+                start = buffer.find(_JPEG_START)
+                end = buffer.find(_JPEG_END, start + 2) if start != -1 else -1
+                if end == -1:
+                    break
+                yield buffer[start:end + 2]
+                buffer = buffer[end + 2:]
+
+    def close(self):
+        if self._process is not None and self._process.poll() is None:
+            self._process.terminate()
+            try:
+                self._process.wait(timeout=5)
+            except subprocess.TimeoutExpired:
+                self._process.kill()
+
+
+class SnapshotSource:
+    """JPEG frames from repeatedly asking the controller for a snapshot"""
+
+    def __init__(self, fetch, interval=1):
+        self.fetch = fetch
+        self.interval = interval
+
+    def frames(self):
+        while True:
+            started = time.monotonic()
+            yield self.fetch()
+            time.sleep(max(0, self.interval - (time.monotonic() - started)))
+
+    def close(self):
+        pass
+
+
+class StreamRelay:
+    """Fans one upstream camera connection out to any number of viewers.
+
+    The upstream source is opened by the first viewer and closed when the
+    last one leaves. Frames go into a small ring buffer; a viewer that falls
+    more than ``max_lag`` frames behind skips straight to the newest frame
+    instead of slowing the upstream or the other viewers down.
+    """
+
+    def __init__(self, source_factory, buffer_size=8, max_lag=2, keepalive=10, retry_interval=5):
+        self.source_factory = source_factory
+        self.max_lag = max_lag
+        self.keepalive = keepalive
+        self.retry_interval = retry_interval
+
+        self.viewers = 0
+        self.connects = 0
+        self.frames_received = 0
+        self.frames_dropped = 0
+        self.last_error = None
+
+        self._frames = deque(maxlen=buffer_size)
+        self._seq = 0
+        self._thread = None
+        self._cond = threading.Condition()
+
+    def stream(self):
+        """Multipart MJPEG body for one viewer"""
+        with self._cond:
+            self.viewers += 1
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, daemon=True)
+                self._thread.start()
+            # Start from the newest buffered frame, if any
+            seq = self._seq - 1 if self._frames else self._seq
+        try:
+            while True:
+                with self._cond:
+                    if self._seq == seq:
+                        self._cond.wait(timeout=self.keepalive)
+                    if self._seq == seq:
+                        # Nothing new: write something anyway, as a gone viewer is only noticed
+                        # when a write fails. The last frame again, or filler before the first
+                        frame = self._frames[-1] if self._frames else None
+                    else:
+                        oldest = self._seq - len(self._frames) + 1
+                        if self._seq - seq > self.max_lag or seq + 1 < oldest:
+                            self.frames_dropped += self._seq - seq - 1
+                            seq = self._seq
+                        else:
+                            seq += 1
+                        frame = self._frames[seq - oldest]
+                yield multipart_chunk(frame) if frame is not None else KEEPALIVE_CHUNK
+        finally:
+            with self._cond:
+                self.viewers -= 1
+
+    def stats(self):
+        return {
+            'viewers': self.viewers,
+            'upstream_open': self._thread is not None,
+            'connects': self.connects,
+            'frames_received': self.frames_received,
+            'frames_dropped': self.frames_dropped,
+            'last_error': self.last_error
+        }
+
+    def _run(self):
+        """Read the upstream while anyone is watching, reconnecting after errors"""
+        while True:
+            source = None
+            failed = False
+            try:
+                source = self.source_factory()
+                self.connects += 1
+                logger.info("Opened doorbell camera stream")
+                for frame in source.frames():
+                    with self._cond:
+                        if self.viewers == 0:
+                            break
+                        self._frames.append(frame)
+                        self._seq += 1
+                        self.frames_received += 1
+                        self._cond.notify_all()
+            except Exception as e:
+                failed = True
+                self.last_error = str(e)
+                logger.error("Doorbell camera stream error: %s", e)
+            finally:
+                if source is not None:
+                    source.close()
+
+            with self._cond:
+                if self.viewers == 0:
+                    self._thread = None
+                    self._frames.clear()
+                    logger.info("Closed doorbell camera stream, no viewers left")
+                    return
+            if failed:
+                time.sleep(self.retry_interval)
@@ -0,0 +1,179 @@
+import bisect
+import logging
+import threading
+from datetime import date, datetime, time, timedelta
+from zoneinfo import ZoneInfo
+
+logger = logging.getLogger(__name__)
+
+
+def _windows_zone(name):
+    """IANA name for a Windows zone name such as 'Pacific Standard Time' (Outlook/Exchange feeds)"""
+    try:
+        from icalendar.windows_to_olson import WINDOWS_TO_OLSON
+    except ImportError:
+        return None
+    return WINDOWS_TO_OLSON.get(name)
+
+
+def zone_name(dt):
+    """IANA name of a datetime's timezone, if it has a usable one"""
+    tzinfo = getattr(dt, 'tzinfo', None)
+    if tzinfo is None:
+        return None
+    name = getattr(tzinfo, 'key', None) or getattr(tzinfo, 'zone', None) or dt.tzname()
+    for candidate in (name, _windows_zone(name)):
+        try:
+            ZoneInfo(candidate)
+            return candidate
+        except Exception:
+            pass
+    return None
+
+
+def wall_clock(dt, tzid):
+    """Naive wall-clock time of a date/datetime in the given zone"""
+    if not isinstance(dt, datetime):
+        return datetime.combine(dt, time.min)
+    if dt.tzinfo is None or tzid is None:
+        return dt.replace(tzinfo=None)
+    return dt.astimezone(ZoneInfo(tzid)).replace(tzinfo=None)
+
+
+def recurrence_spec(component):
+    """Describe the recurrence of a VEVENT as a JSON-serialisable dict.
+
+    Returns the rule, DTSTART, EXDATEs and duration for a recurring master,
+    ``{'uid', 'recurrence_id'}`` for an override of one occurrence, or None
+    for a plain event.
+    """
+    uid = str(component.get('uid', ''))
+    recurrence_id = component.get('recurrence-id')
+    if recurrence_id:
+        return {'uid': uid, 'recurrence_id': recurrence_id.dt.isoformat()}
+
+    rrule = component.get('rrule')
+    if not rrule:
+        return None
+
+    dtstart = component.get('dtstart').dt
+    all_day = not isinstance(dtstart, datetime)
+    # Expansion runs in the event's own wall-clock time so DST is honoured
+    tzid = None if all_day else (zone_name(dtstart) or 'UTC')
+
+    exdates = []
+    exdate_props = component.get('exdate') or []
+    if not isinstance(exdate_props, list):
+        exdate_props = [exdate_props]
+    for prop in exdate_props:
+        for exdate in getattr(prop, 'dts', []):
+            exdates.append(wall_clock(exdate.dt, tzid).isoformat())
+
+    duration = None
+    dtend = component.get('dtend')
+    if dtend is not None:
+        duration = (wall_clock(dtend.dt, tzid) - wall_clock(dtstart, tzid)).total_seconds()
+    elif component.get('duration') is not None:
+        duration = component.get('duration').dt.total_seconds()
+
+    return {
+        'uid': uid,
+        'rrule': rrule.to_ical().decode(),
+        'dtstart': wall_clock(dtstart, tzid).isoformat(),
+        'tzid': tzid,
+        'all_day': all_day,
+        'exdates': sorted(exdates),
+        'duration': duration
+    }
+
+
+def parse_recurrence_id(value):
+    """Inverse of ``isoformat()`` for the date or datetime of an occurrence"""
+    if 'T' in value:
+        return datetime.fromisoformat(value)
+    return date.fromisoformat(value)
+
+
+def spec_key(spec):
+    return (spec['uid'], spec['rrule'], spec['dtstart'], spec['tzid'], tuple(spec['exdates']))
+
+
+class RecurrenceExpander:
+    """Expand recurring events over a rolling horizon.
+
+    Compiled rules are memoised by (UID, RRULE, DTSTART, EXDATE) together with
+    the occurrences generated so far. As the window moves forward, past
+    occurrences are dropped and only the newly uncovered days are expanded.
+    """
+
+    def __init__(self, horizon_days=90):
+        self.horizon_days = horizon_days
+        self._entries = {}
+        self._lock = threading.Lock()
+
+    def window(self, today):
+        return today, today + timedelta(days=self.horizon_days)
+
+    def occurrences(self, spec, start, end):
+        """Occurrences of ``spec`` between two dates (inclusive).
+
+        Returns dates for all-day events and aware datetimes otherwise.
+        """
+        window_start = datetime.combine(start, time.min)
+        window_end = datetime.combine(end, time.max)
+
+        with self._lock:
+            key = spec_key(spec)
+            entry = self._entries.get(key)
+            if entry is None or window_start < entry['start']:
+                # New rule, or the window moved backwards: expand from scratch
+                entry = self._entries[key] = {
+                    'rule': entry['rule'] if entry else self._compile(spec),
+                    'start': window_start,
+                    'until': window_start - timedelta(microseconds=1),
+                    'items': []
+                }
+
+            items = entry['items']
+            if window_start > entry['start']:
+                del items[:bisect.bisect_left(items, window_start)]
+                entry['start'] = window_start
+
+            if window_end > entry['until']:
+                if entry['rule'] is not None:
+                    new_items = entry['rule'].between(entry['until'], window_end, inc=True)
+                    items.extend(dt for dt in new_items if dt > entry['until'])
+                entry['until'] = window_end
+
+            selected = items[:bisect.bisect_right(items, window_end)]
+
+        if spec['all_day']:
+            return [dt.date() for dt in selected]
+        zone = ZoneInfo(spec['tzid'])
+        return [dt.replace(tzinfo=zone) for dt in selected]
+
+    def prune(self, specs):
+        """Forget rules that are no longer in the feed"""
+        keep = {spec_key(spec) for spec in specs}
+        with self._lock:
+            for key in list(self._entries):
+                if key not in keep:
+                    del self._entries[key]
+
+    def _compile(self, spec):
+        # Compiled rules are memoized, so this import runs once per new rule, not per event
+        from dateutil.rrule import rrulestr
+
+        try:
+            rule = rrulestr(
+                f"RRULE:{spec['rrule']}",
+                dtstart=datetime.fromisoformat(spec['dtstart']),
+                forceset=True,
+                ignoretz=True
+            )
+            for exdate in spec['exdates']:
+                rule.exdate(datetime.fromisoformat(exdate))
+            return rule
+        except Exception as e:
+            logger.error("Error compiling recurrence rule for %s: %s", spec['uid'], e)
+            return None
@@ -0,0 +1,115 @@
+import hashlib
+import logging
+import os
+import re
+import tempfile
+import threading
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+_SNAPSHOT_ID = re.compile(r'^[0-9A-Za-z_-]{1,64}$')
+
+
+def valid_snapshot_id(snapshot_id):
+    return bool(snapshot_id and _SNAPSHOT_ID.match(snapshot_id))
+
+
+class SnapshotStore:
+    """Bounded LRU of camera snapshots keyed by event ID.
+
+    Snapshots are kept as raw JPEG bytes with a content ETag. When
+    ``directory`` is set, every snapshot is also written there (up to
+    ``max_files`` of them), so it can be served after it leaves memory and by
+    any other process reading the same directory, such as a follower worker.
+    """
+
+    def __init__(self, max_items=50, directory=None, max_files=500):
+        self.max_items = max_items
+        self.directory = directory
+        self.max_files = max_files
+        self._entries = OrderedDict()
+        self._files = OrderedDict()
+        self._lock = threading.Lock()
+
+        if directory:
+            self._load_files()
+
+    def put(self, snapshot_id, data):
+        """Store a snapshot and return its ETag"""
+        if not valid_snapshot_id(snapshot_id):
+            raise ValueError(f"Invalid snapshot id: {snapshot_id}")
+        etag = hashlib.blake2b(data, digest_size=16).hexdigest()
+        # On disk before anyone is told the URL, so other workers can serve it straight away
+        self._write(snapshot_id, data)
+        with self._lock:
+            self._entries[snapshot_id] = (data, etag)
+            self._entries.move_to_end(snapshot_id)
+            while len(self._entries) > self.max_items:
+                self._entries.popitem(last=False)
+        return etag
+
+    def get(self, snapshot_id):
+        """Return (data, etag) for a snapshot, or None if it is not stored"""
+        if not valid_snapshot_id(snapshot_id):
+            return None
+        with self._lock:
+            entry = self._entries.get(snapshot_id)
+            if entry is not None:
+                self._entries.move_to_end(snapshot_id)
+                return entry
+        if not self.directory:
+            return None
+        # Also written by other processes, so look even for IDs this one has not stored
+        try:
+            with open(self._path(snapshot_id), 'rb') as f:
+                data = f.read()
+        except FileNotFoundError:
+            return None
+        except OSError as e:
+            logger.error("Error reading snapshot %s: %s", snapshot_id, e)
+            return None
+        return data, hashlib.blake2b(data, digest_size=16).hexdigest()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def _path(self, snapshot_id):
+        return os.path.join(self.directory, f"{snapshot_id}.jpg")
+
+    def _write(self, snapshot_id, data):
+        if not self.directory:
+            return
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            fd, tmp_path = tempfile.mkstemp(dir=self.directory, prefix='.snapshot-', suffix='.tmp')
+            with os.fdopen(fd, 'wb') as f:
+                f.write(data)
+            os.replace(tmp_path, self._path(snapshot_id))
+        except OSError as e:
+            logger.error("Error writing snapshot %s: %s", snapshot_id, e)
+            return
+
+        with self._lock:
+            self._files[snapshot_id] = True
+            self._files.move_to_end(snapshot_id)
+            expired = []
+            while len(self._files) > self.max_files:
+                expired.append(self._files.popitem(last=False)[0])
+        for expired_id in expired:
+            try:
+                os.unlink(self._path(expired_id))
+            except OSError:
+                pass
+
+    def _load_files(self):
+        """Pick up snapshots written by a previous run, oldest first"""
+        try:
+            names = [name for name in os.listdir(self.directory) if name.endswith('.jpg')]
+        except FileNotFoundError:
+            return
+        names.sort(key=lambda name: os.path.getmtime(os.path.join(self.directory, name)))
+        for name in names:
+            snapshot_id = name[:-len('.jpg')]
+            if valid_snapshot_id(snapshot_id):
+                self._files[snapshot_id] = True
@@ -0,0 +1,57 @@
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+SNAPSHOT_FORMAT = 1
+
+_write_lock = threading.Lock()
+# Latest contents of each snapshot file, so saving one section keeps the others
+_snapshots = {}
+
+
+def load_snapshot(path):
+    """Load a snapshot written by save_snapshot, or {} if missing or unreadable"""
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            snapshot = json.load(f)
+        if snapshot.get('format') != SNAPSHOT_FORMAT:
+            logger.warning("Ignoring snapshot with unknown format: %s", path)
+            return {}
+        logger.debug("Loaded snapshot from %s", path)
+        # What this process saves next builds on what it last loaded, which may be another process's write
+        _snapshots[path] = dict(snapshot)
+        return snapshot
+    except FileNotFoundError:
+        return {}
+    except Exception as e:
+        logger.error("Error loading snapshot %s: %s", path, e)
+        return {}
+
+
+def save_snapshot(path, **sections):
+    """Merge sections into the snapshot at path, replacing the file atomically"""
+    with _write_lock:
+        snapshot = _snapshots.setdefault(path, {'format': SNAPSHOT_FORMAT})
+        snapshot.update(sections)
+        snapshot['saved_at'] = time.time()
+
+        directory = os.path.dirname(path) or '.'
+        try:
+            os.makedirs(directory, exist_ok=True)
+            fd, tmp_path = tempfile.mkstemp(dir=directory, prefix='.snapshot-', suffix='.tmp')
+            try:
+                with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                    json.dump(snapshot, f, separators=(',', ':'), default=str)
+                    f.flush()
+                    os.fsync(f.fileno())
+                os.replace(tmp_path, path)
+            except BaseException:
+                os.unlink(tmp_path)
+                raise
+        except Exception as e:
+            logger.error("Error saving snapshot %s: %s", path, e)
@@ -3,8 +3,17 @@ class Calendar {
         this.calendarElement = document.getElementById('calendar-widget');
         this.calendarGridElement = document.querySelector('.calendar-grid');
         this.events = new Map();
+        this.eventsById = new Map();
         
         this.updateCalendar();
+        if (this.subscribeToUpdates()) {
+            // The server pushes the displayed days; this only redraws at midnight
+            setInterval(() => this.updateCalendar(), 1000 * 60 * 60);
+            setTimeout(() => {
+                if (window.dashboard.state.calendar === undefined) this.fetchEvents();
+            }, 1000);
+            return;
+        }
         this.fetchEvents();
         setInterval(() => {
             this.updateCalendar();
@@ -12,6 +21,33 @@ class Calendar {
         }, 1000 * 60 * 60); // Update every hour
     }
 
+    subscribeToUpdates() {
+        if (!window.dashboard || !window.dashboard.socket) {
+            console.warn('Socket.IO not available, calendar will only poll for updates');
+            return false;
+        }
+        window.dashboard.subscribe('calendar', (window_) => this.applyWindow(window_));
+        return true;
+    }
+
+    applyWindow(window_) {
+        if (!window_ || !Array.isArray(window_.events)) return;
+
+        // The server's day differs from ours, ask for our own days instead
+        const days = this.getNextThreeDays(new Date());
+        if (window_.start !== this.formatDate(days[0]) || window_.end !== this.formatDate(days[days.length - 1])) {
+            this.fetchEvents();
+            return;
+        }
+
+        this.eventsById.clear();
+        window_.events.forEach((event, index) => {
+            this.eventsById.set(event && event.id ? event.id : `index-${index}`, event);
+        });
+        this.groupEvents();
+        this.updateCalendar();
+    }
+
     // Helper function to safely parse date string
     safeParseDateString(dateStr, timeStr = null) {
         try {
@@ -226,13 +262,28 @@ class Calendar {
         }
     }
 
+    // Only request the days the grid actually displays
+    getWindowParams() {
+        const days = this.getNextThreeDays(new Date());
+        return new URLSearchParams({
+            start: this.formatDate(days[0]),
+            end: this.formatDate(days[days.length - 1])
+        }).toString();
+    }
+
+    formatDate(date) {
+        const month = String(date.getMonth() + 1).padStart(2, '0');
+        const day = String(date.getDate()).padStart(2, '0');
+        return `${date.getFullYear()}-${month}-${day}`;
+    }
+
     async fetchWithRetry(retryCount = 0, maxRetries = 3) {
         const baseDelay = 1000; // 1 second
         const maxDelay = 10000; // 10 seconds
         
         try {
             console.log(`Attempting calendar fetch (attempt ${retryCount + 1}/${maxRetries + 1})`);
-            const response = await fetch('/api/calendar');
+            const response = await fetch(`/api/calendar?${this.getWindowParams()}`);
             console.log(`Calendar API response status: ${response.status}`);
             
             if (response.status === 502) {
@@ -276,67 +327,12 @@ class Calendar {
                 throw new Error('Invalid events data structure');
             }
 
-            // Clear existing events
-            this.events.clear();
-
-            // Process and group events by date
+            this.eventsById.clear();
             data.events.forEach((event, index) => {
-                // Validate event structure
-                if (!event || typeof event !== 'object') {
-                    console.warn(`Invalid event at index ${index}:`, event);
-                    return;
-                }
-
-                // Validate required fields
-                const date = event.date || event.start_date;
-                if (!date || typeof date !== 'string') {
-                    console.warn(`Event missing valid date at index ${index}:`, event);
-                    return;
-                }
-
-                // Add detailed debug logging
-                console.log(`Processing event ${index + 1}/${data.events.length}:`, {
-                    summary: event.summary || 'No summary',
-                    date: date,
-                    start_time: event.start_time || 'No time',
-                    is_all_day: !!event.is_all_day
-                });
-
-                try {
-                    // Validate date format
-                    if (!this.safeParseDateString || !this.safeParseDateString(date)) {
-                        console.warn(`Invalid date format for event ${index}:`, date);
-                        return;
-                    }
-
-                    // Group events by date
-                    const dateEvents = this.events.get(date) || [];
-                    dateEvents.push({
-                        ...event,
-                        summary: event.summary || 'Untitled Event',
-                        description: event.description || '',
-                        location: event.location || '',
-                        is_all_day: !!event.is_all_day,
-                        status: event.status || 'confirmed',
-                        classification: event.classification || 'public'
-                    });
-
-                    // Sort events for this date
-                    try {
-                        dateEvents.sort(this.compareEvents.bind(this));
-                    } catch (sortError) {
-                        console.error(`Error sorting events for date ${date}:`, sortError);
-                    }
-
-                    this.events.set(date, dateEvents);
-                } catch (processError) {
-                    console.error(`Error processing event at index ${index}:`, {
-                        error: processError,
-                        event: event
-                    });
-                }
+                this.eventsById.set(event && event.id ? event.id : `index-${index}`, event);
             });
 
+            this.groupEvents();
             this.updateCalendar();
         } catch (error) {
             console.error('Calendar fetch error:', error);
@@ -370,6 +366,70 @@ class Calendar {
         }
     }
 
+    groupEvents() {
+        // Clear existing events
+        this.events.clear();
+
+        // Process and group events by date
+        const events = Array.from(this.eventsById.values());
+        events.forEach((event, index) => {
+            // Validate event structure
+            if (!event || typeof event !== 'object') {
+                console.warn(`Invalid event at index ${index}:`, event);
+                return;
+            }
+
+            // Validate required fields
+            const date = event.date || event.start_date;
+            if (!date || typeof date !== 'string') {
+                console.warn(`Event missing valid date at index ${index}:`, event);
+                return;
+            }
+
+            // Add detailed debug logging
+            console.log(`Processing event ${index + 1}/${events.length}:`, {
+                summary: event.summary || 'No summary',
+                date: date,
+                start_time: event.start_time || 'No time',
+                is_all_day: !!event.is_all_day
+            });
+
+            try {
+                // Validate date format
+                if (!this.safeParseDateString || !this.safeParseDateString(date)) {
+                    console.warn(`Invalid date format for event ${index}:`, date);
+                    return;
+                }
+
+                // Group events by date
+                const dateEvents = this.events.get(date) || [];
+                dateEvents.push({
+                    ...event,
+                    summary: event.summary || 'Untitled Event',
+                    description: event.description || '',
+                    location: event.location || '',
+                    is_all_day: !!event.is_all_day,
+                    status: event.status || 'confirmed',
+                    classification: event.classification || 'public'
+                });
+
+                // Sort events for this date
+                try {
+                    dateEvents.sort(this.compareEvents.bind(this));
+                } catch (sortError) {
+                    console.error(`Error sorting events for date ${date}:`, sortError);
+                }
+
+                this.events.set(date, dateEvents);
+            } catch (processError) {
+                console.error(`Error processing event at index ${index}:`, {
+                    error: processError,
+                    event: event
+                });
+            }
+        });
+    }
+
     getNextThreeDays(date) {
         const dates = [];
         const startDate = new Date(date);
@@ -535,8 +595,13 @@ class Calendar {
                         event.classification ? event.classification.toLowerCase() : 'public'
                     ].filter(Boolean).join(' ');
                     
+                    // Color tag of the feed the event came from
+                    const colorStyle = /^#[0-9a-fA-F]{3,8}$/.test(event.color || '') ?
+                        `style="border-left: 3px solid ${event.color}; padding-left: 4px;"` : '';
+                    
                     return `
-                        <div class="${eventClasses}"
+                        <div class="${eventClasses}" ${colorStyle}
+                             data-calendar="${this.escapeHtml(event.calendar || '')}"
                              data-status="${(event.status || 'confirmed').toLowerCase()}"
                              title="${this.escapeHtml(fullTitle)}">
                             <div class="event-info">
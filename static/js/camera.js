@@ -21,7 +21,8 @@ function connectWebSocket() {
     const socketUrl = `${protocol}//${window.location.host}`;
     
     try {
-        const socket = io(socketUrl, {
+        // Shares the dashboard's connection rather than opening a second one
+        const socket = window.dashboard && window.dashboard.socket ? window.dashboard.socket : io(socketUrl, {
             reconnection: true,
             reconnectionDelay: 1000,
             reconnectionDelayMax: 5000,
@@ -38,6 +39,11 @@ function connectWebSocket() {
         document.getElementById('doorbell-widget').style.display = 'block';
     });
 
+    // Snapshots follow their event so the ring itself is shown without waiting
+    socket.on('doorbell_snapshot', (data) => {
+        handleDoorbellSnapshot(data);
+    });
+
     socket.on('disconnect', () => {
         console.log('Disconnected from doorbell events');
     });
@@ -48,18 +54,24 @@ function connectWebSocket() {
 
     // Store socket reference for cleanup
     window.doorbellSocket = socket;
+    } catch (error) {
+        console.error('Error connecting to doorbell events:', error);
+    }
 }
 
 function handleDoorbellEvent(event) {
     const eventsList = document.getElementById('doorbell-events');
     const eventItem = document.createElement('div');
     eventItem.className = 'doorbell-event';
+    if (event.id) {
+        eventItem.dataset.eventId = event.id;
+    }
     
     // Add event to list with timestamp
     eventItem.innerHTML = `
         <div class="event-time">${new Date(event.timestamp).toLocaleTimeString()}</div>
         <div class="event-type">${event.type}</div>
-        ${event.thumbnail ? `<img src="data:image/jpeg;base64,${event.thumbnail}" alt="Event Thumbnail">` : ''}
+        ${event.thumbnail ? `<img src="${event.thumbnail}" alt="Event Thumbnail">` : ''}
     `;
     
     eventsList.insertBefore(eventItem, eventsList.firstChild);
@@ -75,6 +87,20 @@ function handleDoorbellEvent(event) {
     }
 }
 
+function handleDoorbellSnapshot(snapshot) {
+    const eventItem = document.querySelector(`.doorbell-event[data-event-id="${CSS.escape(snapshot.id || '')}"]`);
+    if (!eventItem || !snapshot.thumbnail) {
+        return;
+    }
+    let img = eventItem.querySelector('img');
+    if (!img) {
+        img = document.createElement('img');
+        img.alt = 'Event Thumbnail';
+        eventItem.appendChild(img);
+    }
+    img.src = snapshot.thumbnail;
+}
+
 function showDoorbellNotification() {
     const notification = document.createElement('div');
     notification.className = 'doorbell-notification';
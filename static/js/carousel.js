@@ -5,19 +5,38 @@ class BackgroundCarousel {
         this.transitionTime = 10000; // 10 seconds between transitions
         this.fadeTime = 1000; // 1 second fade duration
         this.localImages = [];
+        this.placeholders = new Map();
         this.loadedImages = new Map();
         this.fallbackGradient = 'linear-gradient(135deg, #1a1a1a 0%, #2a2a2a 100%)';
+        this.order = 'name'; // or 'date', 'added', 'shuffle'
+        this.seed = Math.floor(Math.random() * 1e9); // keeps a shuffle stable between pages
+        this.pageSize = 500;
+        this.refreshInterval = 300000; // 5 minutes between catalog checks
+        this.catalogVersion = null;
 
         if (!this.container) {
             this.setFallbackBackground();
             return;
         }
 
+        if (window.dashboard && window.dashboard.socket) {
+            // The server announces every catalog change, new uploads included
+            window.dashboard.subscribe('images', (catalog) => {
+                if (catalog && catalog.version !== this.catalogVersion) {
+                    this.catalogVersion = catalog.version;
+                    this.loadImageList();
+                }
+            });
+            return;
+        }
+        this.loadImageList();
+        setInterval(() => this.fetchImageList(), this.refreshInterval);
+    }
+
+    loadImageList() {
+        // fetchImageList initializes the carousel once it has images
         this.fetchImageList().then(() => {
-            if (this.localImages.length > 0) {
-                this.preloadImages();
-                this.initialize();
-            } else {
+            if (this.localImages.length === 0) {
                 this.setFallbackBackground();
             }
         });
@@ -29,26 +48,72 @@ class BackgroundCarousel {
         }
     }
 
-    preloadImages() {
-        this.localImages.forEach(src => {
+    // Only the images about to be shown are downloaded, not the whole library
+    preloadImages(index) {
+        [index, (index + 1) % this.localImages.length].forEach(i => {
+            const src = this.localImages[i];
+            if (!src || this.loadedImages.has(src)) return;
             const img = new Image();
-            img.onload = () => this.loadedImages.set(src, true);
+            img.onload = () => {
+                this.loadedImages.set(src, true);
+                this.showLoaded(src);
+            };
             img.onerror = () => this.loadedImages.set(src, false);
             img.src = src;
         });
     }
 
     getBackgroundImage(src) {
-        return this.loadedImages.get(src) ? `url(${src})` : this.fallbackGradient;
+        if (this.loadedImages.get(src)) {
+            return `url(${src})`;
+        }
+        const placeholder = this.placeholders.get(src);
+        return placeholder ? `url(${placeholder})` : this.fallbackGradient;
+    }
+
+    showLoaded(src) {
+        // Swap the blurred placeholder for the full image once it arrives
+        if (this.bg1 && this.localImages[this.currentIndex] === src) {
+            const activeElement = this.bg1.style.opacity === '1' ? this.bg1 : this.bg2;
+            activeElement.style.backgroundImage = this.getBackgroundImage(src);
+        }
+    }
+
+    getImageListUrl(page) {
+        const width = Math.round(Math.max(window.screen.width, window.innerWidth) * (window.devicePixelRatio || 1));
+        const canvas = document.createElement('canvas');
+        const webp = canvas.toDataURL('image/webp').startsWith('data:image/webp');
+        return `/api/images?width=${width}&format=${webp ? 'webp' : 'jpeg'}` +
+            `&order=${this.order}&seed=${this.seed}&page=${page}&per_page=${this.pageSize}`;
+    }
+
+    async fetchImagePages() {
+        // The catalog is paginated; pages are revalidated with their ETag
+        let images = [];
+        for (let page = 1; ; page++) {
+            const response = await fetch(this.getImageListUrl(page), {cache: 'no-cache'});
+            const data = await response.json();
+            if (data.error || !Array.isArray(data.images)) {
+                return null;
+            }
+            images = images.concat(data.images);
+            if (images.length >= data.total || data.images.length === 0) {
+                return images;
+            }
+        }
     }
 
     async fetchImageList() {
         try {
-            const response = await fetch('/api/images');
-            const data = await response.json();
+            const images = await this.fetchImagePages();
             
-            if (!data.error && data.images && Array.isArray(data.images)) {
-                const newImages = data.images.map(img => `/static/images/${img}`);
+            if (images) {
+                const newImages = images.map(img => img.src);
+                images.forEach(img => {
+                    if (img.placeholder) {
+                        this.placeholders.set(img.src, img.placeholder);
+                    }
+                });
                 
                 // Check if image list has changed
                 const hasNewImages = newImages.length !== this.localImages.length ||
@@ -57,7 +122,7 @@ class BackgroundCarousel {
                 if (hasNewImages) {
                     this.localImages = newImages;
                     // Reinitialize carousel if new images are found
-                    this.preloadImages();
+                    this.preloadImages(0);
                     if (this.bg1) {
                         this.currentIndex = 0;
                         this.bg1.style.backgroundImage = this.getBackgroundImage(this.localImages[0]);
@@ -99,6 +164,7 @@ class BackgroundCarousel {
 
         // Set initial background
         if (this.localImages.length > 0) {
+            this.preloadImages(0);
             this.bg1.style.backgroundImage = this.getBackgroundImage(this.localImages[0]);
             this.bg1.style.opacity = 1;
             this.bg2.style.opacity = 0;
@@ -132,6 +198,7 @@ class BackgroundCarousel {
         inactiveElement.style.opacity = 1;
 
         this.currentIndex = nextIndex;
+        this.preloadImages(nextIndex);
     }
 }
 
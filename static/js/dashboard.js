@@ -0,0 +1,85 @@
+// One Socket.IO connection per panel carrying the whole dashboard state.
+// The server sends a snapshot on connect and versioned diffs after that;
+// widgets subscribe to the section they show instead of polling for it.
+class DashboardChannel {
+    constructor() {
+        this.epoch = null;
+        this.version = null;
+        this.state = {};
+        this.subscribers = new Map();
+        this.syncing = false;
+
+        if (typeof io === 'undefined') {
+            console.warn('Socket.IO not available, widgets will poll for updates');
+            this.socket = null;
+            return;
+        }
+
+        // On reconnect the server is told what we have and only sends what we missed
+        this.socket = io({
+            auth: (cb) => cb({epoch: this.epoch, version: this.version})
+        });
+        this.socket.on('dashboard_state', (snapshot) => this.applySnapshot(snapshot));
+        this.socket.on('dashboard_diff', (diff) => this.applyDiff(diff));
+    }
+
+    subscribe(section, callback) {
+        if (!this.subscribers.has(section)) {
+            this.subscribers.set(section, []);
+        }
+        this.subscribers.get(section).push(callback);
+        if (this.state[section] !== undefined) {
+            callback(this.state[section]);
+        }
+    }
+
+    applySnapshot(snapshot) {
+        if (!snapshot || typeof snapshot !== 'object') return;
+
+        this.epoch = snapshot.epoch;
+        this.version = snapshot.version;
+        this.syncing = false;
+        const previous = this.state;
+        this.state = snapshot.state || {};
+        Object.keys(this.state).forEach(section => {
+            if (JSON.stringify(previous[section]) !== JSON.stringify(this.state[section])) {
+                this.notify(section);
+            }
+        });
+    }
+
+    applyDiff(diff) {
+        if (!diff || typeof diff !== 'object' || this.version === null) return;
+
+        // Already applied, e.g. sent again while catching up
+        if (diff.version <= this.version) return;
+
+        // Missed one in between, ask for the rest
+        if (diff.base_version !== this.version) {
+            if (!this.syncing) {
+                this.syncing = true;
+                this.socket.emit('dashboard_sync', {epoch: this.epoch, version: this.version});
+            }
+            return;
+        }
+
+        this.version = diff.version;
+        this.syncing = false;
+        Object.entries(diff.changes || {}).forEach(([section, value]) => {
+            this.state[section] = value;
+            this.notify(section);
+        });
+    }
+
+    notify(section) {
+        (this.subscribers.get(section) || []).forEach(callback => {
+            try {
+                callback(this.state[section]);
+            } catch (error) {
+                console.error(`Error updating ${section} widget:`, error);
+            }
+        });
+    }
+}
+
+window.dashboard = new DashboardChannel();
@@ -23,6 +23,15 @@ class WeatherWidget {
         this.retryCount = 0;
         
         this.setLoadingState();
+        if (window.dashboard && window.dashboard.socket) {
+            // Pushed by the server whenever its weather refresh changes something;
+            // the lookup below only covers a server that has no weather yet
+            window.dashboard.subscribe('weather', (data) => this.render(data));
+            setTimeout(() => {
+                if (window.dashboard.state.weather === undefined) this.updateWeather();
+            }, 1000);
+            return;
+        }
         setTimeout(() => this.updateWeather(), 1000);
         setInterval(() => this.updateWeather(), this.updateInterval);
     }
@@ -64,6 +73,20 @@ class WeatherWidget {
         );
     }
 
+    render(data) {
+        const requiredFields = ['temp', 'humidity', 'description', 'speed'];
+        if (!data || !requiredFields.every(field => data[field] !== undefined)) {
+            throw new Error('Incomplete weather data');
+        }
+
+        this.elements.temp.textContent = `${Math.round(data.temp)}°F`;
+        this.elements.desc.textContent = data.description;
+        this.updateElement(this.elements.humidity, ` ${data.humidity}%`, 'fa-tint');
+        this.updateElement(this.elements.wind, ` ${Math.round(data.speed)} mph`, 'fa-wind');
+
+        this.widget.classList.remove('error');
+    }
+
     async updateWeather() {
         if (!this.widget || !this.elements) return;
         
@@ -91,17 +114,7 @@ class WeatherWidget {
                 throw new Error(data.error);
             }
 
-            const requiredFields = ['temp', 'humidity', 'description', 'speed'];
-            if (!requiredFields.every(field => data[field] !== undefined)) {
-                throw new Error('Incomplete weather data');
-            }
-
-            this.elements.temp.textContent = `${Math.round(data.temp)}°F`;
-            this.elements.desc.textContent = data.description;
-            this.updateElement(this.elements.humidity, ` ${data.humidity}%`, 'fa-tint');
-            this.updateElement(this.elements.wind, ` ${Math.round(data.speed)} mph`, 'fa-wind');
-            
-            this.widget.classList.remove('error');
+            this.render(data);
             this.retryCount = 0;
         } catch (error) {
             if (error.name === 'AbortError') {
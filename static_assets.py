@@ -0,0 +1,156 @@
+import gzip
+import hashlib
+import logging
+import mimetypes
+import os
+import tempfile
+
+from flask import abort, request, send_file
+from werkzeug.security import safe_join
+
+try:
+    import brotli
+except ImportError:  # optional; only gzip copies are made without it
+    brotli = None
+
+logger = logging.getLogger(__name__)
+
+IMMUTABLE_MAX_AGE = 365 * 24 * 3600
+# Text assets that are worth compressing ahead of time
+COMPRESSIBLE_EXTENSIONS = ('.css', '.js', '.svg', '.json', '.txt', '.html')
+MIN_COMPRESS_SIZE = 1024
+
+# Preferred first; the suffixes match nginx's gzip_static/brotli_static
+_ENCODINGS = (('br', '.br'), ('gzip', '.gz'))
+
+
+class StaticAssets:
+    """Serves the static folder with fingerprinted URLs and long-lived caching.
+
+    ``fingerprint`` is a short hash of a file's content, added to static URLs
+    as ``?v=``. A request whose ``v`` matches is cached by the browser for a
+    year without revalidating; any other request gets ``no-cache`` and an
+    ETag, so it costs a 304 at most. Files under ``content_addressed`` are
+    named after their content (the uploaded photos and their display sizes),
+    so any ``v`` there is trusted without hashing the file. Text assets get
+    ``.gz`` copies (and ``.br`` when brotli is installed) next to them, chosen
+    by Accept-Encoding. Byte ranges are answered by ``send_file``.
+    """
+
+    def __init__(self, root, content_addressed=('images/',)):
+        self.root = root
+        self.content_addressed = content_addressed
+        self._fingerprints = {}
+
+    def fingerprint(self, filename):
+        """Short content hash of a static file, or None if there is no such file"""
+        path = safe_join(self.root, filename)
+        try:
+            st = os.stat(path) if path else None
+        except OSError:
+            st = None
+        if st is None:
+            return None
+        key = (st.st_mtime_ns, st.st_size)
+        cached = self._fingerprints.get(filename)
+        if cached is None or cached[0] != key:
+            digest = hashlib.blake2b(digest_size=8)
+            with open(path, 'rb') as f:
+                for chunk in iter(lambda: f.read(65536), b''):
+                    digest.update(chunk)
+            cached = (key, digest.hexdigest())
+            self._fingerprints[filename] = cached
+        return cached[1]
+
+    def precompress(self):
+        """Write compressed copies of text assets that do not have an up-to-date one"""
+        encoders = [('.gz', lambda data: gzip.compress(data, compresslevel=9, mtime=0))]
+        if brotli is not None:
+            encoders.insert(0, ('.br', lambda data: brotli.compress(data, quality=11)))
+        written = 0
+        for dirpath, dirnames, filenames in os.walk(self.root):
+            # Photos are already compressed and there may be thousands of them
+            dirnames[:] = [name for name in dirnames
+                           if not self._is_content_addressed(self._relative(os.path.join(dirpath, name)) + '/')]
+            for name in filenames:
+                if not name.endswith(COMPRESSIBLE_EXTENSIONS):
+                    continue
+                path = os.path.join(dirpath, name)
+                try:
+                    st = os.stat(path)
+                    if st.st_size < MIN_COMPRESS_SIZE:
+                        continue
+                    data = None
+                    for suffix, compress in encoders:
+                        if _is_fresh(path + suffix, st):
+                            continue
+                        if data is None:
+                            with open(path, 'rb') as f:
+                                data = f.read()
+                        _write_copy(path + suffix, compress(data), st)
+                        written += 1
+                except OSError as e:
+                    logger.error("Error compressing static file %s: %s", path, e)
+        logger.info("Precompressed static assets (%s files written, brotli %s)",
+                    written, 'enabled' if brotli is not None else 'not installed')
+        return written
+
+    def send(self, filename):
+        """View function for the static endpoint"""
+        path = safe_join(self.root, filename)
+        if path is None or not os.path.isfile(path):
+            abort(404)
+        mimetype = mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+
+        compressible = filename.endswith(COMPRESSIBLE_EXTENSIONS)
+        encoding = None
+        send_path = path
+        if compressible:
+            st = os.stat(path)
+            for name, suffix in _ENCODINGS:
+                if request.accept_encodings[name] and _is_fresh(path + suffix, st):
+                    encoding, send_path = name, path + suffix
+                    break
+
+        version = request.args.get('v')
+        immutable = bool(version) and (self._is_content_addressed(filename)
+                                       or version == self.fingerprint(filename))
+        response = send_file(send_path, mimetype=mimetype, conditional=True,
+                             max_age=IMMUTABLE_MAX_AGE if immutable else None)
+        if encoding:
+            response.headers['Content-Encoding'] = encoding
+        if compressible:
+            response.vary.add('Accept-Encoding')
+        if immutable:
+            response.cache_control.immutable = True
+        else:
+            response.cache_control.no_cache = True
+        return response
+
+    def _is_content_addressed(self, filename):
+        return filename.replace(os.sep, '/').startswith(self.content_addressed)
+
+    def _relative(self, path):
+        return os.path.relpath(path, self.root)
+
+
+def _is_fresh(path, source_stat):
+    """Whether a compressed copy was made from the current version of its source"""
+    try:
+        return os.stat(path).st_mtime_ns == source_stat.st_mtime_ns
+    except OSError:
+        return False
+
+
+def _write_copy(path, data, source_stat):
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), prefix='.static-', suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+        os.chmod(tmp_path, 0o644)
+        # Same mtime as the source marks the copy as up to date
+        os.utime(tmp_path, ns=(source_stat.st_atime_ns, source_stat.st_mtime_ns))
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
@@ -0,0 +1,32 @@
+from snapshot_store import SnapshotStore
+
+
+def test_stores_sharing_a_directory_serve_each_others_snapshots(tmp_path):
+    leader = SnapshotStore(max_items=2, directory=str(tmp_path))
+    follower = SnapshotStore(max_items=2, directory=str(tmp_path))
+
+    etag = leader.put('event1', b'jpeg bytes')
+
+    assert follower.get('event1') == (b'jpeg bytes', etag)
+    assert follower.get('missing') is None
+
+
+def test_snapshots_are_served_from_disk_after_leaving_memory(tmp_path):
+    store = SnapshotStore(max_items=1, max_files=2, directory=str(tmp_path))
+    for n in range(3):
+        store.put(f'event{n}', bytes([n]))
+
+    assert len(store) == 1
+    assert store.get('event1')[0] == b'\x01'
+    # Only the newest max_files stay on disk
+    assert store.get('event0') is None
+    assert sorted(path.name for path in tmp_path.glob('*.jpg')) == ['event1.jpg', 'event2.jpg']
+
+
+def test_without_a_directory_snapshots_only_live_in_memory(tmp_path):
+    store = SnapshotStore(max_items=1)
+    store.put('event0', b'a')
+    store.put('event1', b'b')
+
+    assert store.get('event0') is None
+    assert store.get('../etc/passwd') is None
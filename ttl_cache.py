@@ -0,0 +1,109 @@
+import logging
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class _Call:
+    """An in-flight load that other callers for the same key can wait on"""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class TTLCache:
+    """Keyed TTL cache with request coalescing.
+
+    ``get`` calls the loader at most once per key at a time: concurrent misses
+    wait on the same in-flight call and all receive its result (or its
+    exception). Expired entries are returned as they are while a single
+    background load refreshes them. A ``read_only`` cache never calls the
+    loader: misses raise LookupError and expired entries are served as they are.
+    """
+
+    def __init__(self, ttl, retry_interval=30):
+        self.ttl = ttl
+        self.retry_interval = retry_interval
+        self._entries = {}
+        self._inflight = {}
+        self._failed_at = {}
+        self._lock = threading.Lock()
+        self.read_only = False
+        # Lookups through get: fresh hits, stale hits (served while refreshing) and misses
+        self.hits = 0
+        self.stale_hits = 0
+        self.misses = 0
+
+    def set(self, key, value, fetched_at=None):
+        with self._lock:
+            self._entries[key] = (value, fetched_at or time.time())
+
+    def peek(self, key):
+        """Return the cached (value, fetched_at) for key without loading"""
+        with self._lock:
+            return self._entries.get(key)
+
+    def get(self, key, loader):
+        """Return (value, fetched_at) for key, loading it if needed"""
+        with self._lock:
+            entry = self._entries.get(key)
+            failed_at = self._failed_at.get(key, 0)
+
+        if entry is None:
+            self.misses += 1
+            if self.read_only:
+                raise LookupError(f"{key!r} is not loaded yet")
+            return self._load(key, loader, wait=True)
+
+        now = time.time()
+        if now - entry[1] >= self.ttl:
+            self.stale_hits += 1
+            if not self.read_only and now - failed_at >= self.retry_interval:
+                self._load(key, loader, wait=False)
+        else:
+            self.hits += 1
+        return entry
+
+    def refresh(self, key, loader):
+        """Load key now (or join the load already in flight) and return the new entry"""
+        return self._load(key, loader, wait=True)
+
+    def _load(self, key, loader, wait):
+        with self._lock:
+            call = self._inflight.get(key)
+            leader = call is None
+            if leader:
+                call = self._inflight[key] = _Call()
+
+        if leader:
+            if wait:
+                self._run(key, loader, call)
+            else:
+                threading.Thread(target=self._run, args=(key, loader, call), daemon=True).start()
+
+        if not wait:
+            return None
+        call.done.wait()
+        if call.error is not None:
+            raise call.error
+        return call.result
+
+    def _run(self, key, loader, call):
+        try:
+            entry = (loader(), time.time())
+            with self._lock:
+                self._entries[key] = entry
+                self._failed_at.pop(key, None)
+            call.result = entry
+        except Exception as e:
+            logger.error("Error loading %s: %s", key, e)
+            with self._lock:
+                self._failed_at[key] = time.time()
+            call.error = e
+        finally:
+            with self._lock:
+                del self._inflight[key]
+            call.done.set()
@@ -0,0 +1,111 @@
+import logging
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class DeviceRegistry:
+    """In-memory index of the devices adopted by the UniFi controller.
+
+    The device inventory is downloaded on a slow interval, or sooner when the
+    controller session changes (a new login), and indexed by MAC and model so
+    hot paths can look devices up without a network round trip. Each
+    callable in ``listeners`` is passed the registry after every refresh.
+    """
+
+    def __init__(self, session, refresh_interval=300, retry_interval=30):
+        self.session = session
+        self.refresh_interval = refresh_interval
+        self.retry_interval = retry_interval
+
+        self.refreshed_at = 0
+        self.failed_at = 0
+        self.last_error = None
+        self.listeners = []
+        self._by_mac = {}
+        self._by_model = {}
+        self._matches = {}
+        self._session_logins = None
+        self._refresh_lock = threading.Lock()
+
+    def is_stale(self):
+        if time.time() - self.failed_at < self.retry_interval:
+            return False
+        return (time.time() - self.refreshed_at >= self.refresh_interval
+                or self.session.logins != self._session_logins)
+
+    def get(self, mac):
+        """Device with the given MAC address, or None"""
+        self._ensure_loaded()
+        return self._by_mac.get(mac.lower()) if mac else None
+
+    def find_all(self, model):
+        """Devices whose model name contains ``model`` (e.g. 'Doorbell')"""
+        self._ensure_loaded()
+        matches = self._matches.get(model)
+        if matches is None:
+            matches = [
+                device
+                for name, devices in self._by_model.items() if model in name
+                for device in devices
+            ]
+            self._matches[model] = matches
+        return matches
+
+    def find(self, model, mac=None):
+        """A specific device by MAC if given, otherwise the first matching model"""
+        if mac:
+            device = self.get(mac)
+            return device if device and model in device.get('model', '') else None
+        matches = self.find_all(model)
+        return matches[0] if matches else None
+
+    def doorbells(self):
+        return self.find_all('Doorbell')
+
+    def refresh(self):
+        """Download the device inventory and rebuild the indexes"""
+        try:
+            devices = self.session.get_devices() or []
+        except Exception as e:
+            self.failed_at = time.time()
+            self.last_error = str(e)
+            logger.error("Error refreshing UniFi device registry: %s", e)
+            raise
+
+        by_mac = {}
+        by_model = {}
+        for device in devices:
+            if device.get('mac'):
+                by_mac[device['mac'].lower()] = device
+            by_model.setdefault(device.get('model', ''), []).append(device)
+
+        # Swap whole indexes so readers never see a half-built registry
+        self._by_mac, self._by_model, self._matches = by_mac, by_model, {}
+        self._session_logins = self.session.logins
+        self.refreshed_at = time.time()
+        self.last_error = None
+        logger.info("UniFi device registry refreshed: %s devices", len(by_mac))
+        for listener in self.listeners:
+            try:
+                listener(self)
+            except Exception as e:
+                logger.error("Error notifying device registry listener: %s", e)
+
+    def _ensure_loaded(self):
+        if self.refreshed_at == 0:
+            # Nothing to serve yet, so the first caller loads it synchronously
+            with self._refresh_lock:
+                if self.refreshed_at == 0:
+                    self.refresh()
+        elif self.is_stale() and self._refresh_lock.acquire(blocking=False):
+            threading.Thread(target=self._refresh_in_background, daemon=True).start()
+
+    def _refresh_in_background(self):
+        try:
+            self.refresh()
+        except Exception:
+            pass
+        finally:
+            self._refresh_lock.release()
@@ -0,0 +1,189 @@
+import json
+import logging
+import time
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+
+def event_id(event):
+    """The controller's ID for an event (a Mongo ObjectId, so IDs sort by creation)"""
+    return event.get('_id') or f"{event.get('time', 0):016d}:{event.get('key', '')}:{event.get('mac', '')}"
+
+
+class DoorbellEventFeed:
+    """Delivers doorbell events from the UniFi controller as they happen.
+
+    Subscribes to the controller's event websocket and only polls
+    ``stat/event`` while the stream is down, widening the poll interval while
+    nothing is happening. Events are tracked by controller event ID rather
+    than by wall-clock time, so bursts are paged through instead of cut off
+    and clock drift between the dashboard and the controller does not matter.
+    Each doorbell has its own cursor, starting at its newest event when the
+    feed starts so history is not replayed.
+    """
+
+    def __init__(self, session, registry, on_event, event_types=('ring', 'motion'),
+                 use_stream=True, min_poll_interval=1, max_poll_interval=10,
+                 reconnect_interval=5, max_reconnect_interval=60, page_size=50,
+                 max_pages=5, seen_size=1000):
+        self.session = session
+        self.registry = registry
+        self.on_event = on_event
+        self.event_types = set(event_types)
+        self.use_stream = use_stream
+        self.min_poll_interval = min_poll_interval
+        self.max_poll_interval = max_poll_interval
+        self.reconnect_interval = reconnect_interval
+        self.max_reconnect_interval = max_reconnect_interval
+        self.page_size = page_size
+        self.max_pages = max_pages
+        self.seen_size = seen_size
+
+        self.cursors = {}
+        self.mode = 'starting'
+        self.connected_at = None
+        self.poll_interval = min_poll_interval
+        self.events = 0
+        self.last_event_at = None
+        self.last_error = None
+        self._seen = OrderedDict()
+
+    def run(self):
+        """Deliver events forever; meant to be the target of a daemon thread"""
+        try:
+            self._poll()
+        except Exception as e:
+            logger.error("Error reading recent UniFi events: %s", e)
+        reconnect_interval = self.reconnect_interval
+        while True:
+            if self.use_stream:
+                try:
+                    self._stream()
+                    reconnect_interval = self.reconnect_interval
+                except ImportError:
+                    logger.warning("websockets is not installed, polling for UniFi events")
+                    self.use_stream = False
+                except Exception as e:
+                    self.last_error = str(e)
+                    logger.error("UniFi event stream unavailable: %s", e)
+                self.connected_at = None
+
+            # Poll until it is time to try the stream again
+            deadline = time.monotonic() + reconnect_interval if self.use_stream else None
+            self._poll_until(deadline)
+            reconnect_interval = min(reconnect_interval * 2, self.max_reconnect_interval)
+
+    def stats(self):
+        return {
+            'mode': self.mode,
+            'connected_at': self.connected_at,
+            'poll_interval': self.poll_interval if self.mode == 'polling' else None,
+            'cursors': dict(self.cursors),
+            'events': self.events,
+            'last_event_at': self.last_event_at,
+            'last_error': self.last_error
+        }
+
+    def _stream(self):
+        with self.session.open_websocket('events?clients=v2') as websocket:
+            self.mode = 'stream'
+            self.connected_at = time.time()
+            logger.info("Subscribed to UniFi event stream")
+            # Pick up anything that happened while the stream was down
+            try:
+                self._poll()
+            except Exception as e:
+                logger.error("Error catching up on UniFi events: %s", e)
+            for message in websocket:
+                self._handle_message(message)
+
+    def _handle_message(self, message):
+        try:
+            payload = json.loads(message)
+        except ValueError:
+            return
+        if payload.get('meta', {}).get('message') != 'events':
+            return
+        for event in payload.get('data', []):
+            device = self.registry.get(event.get('mac'))
+            if device and 'Doorbell' in device.get('model', ''):
+                self._deliver(device, event)
+
+    def _poll_until(self, deadline):
+        self.mode = 'polling'
+        self.poll_interval = self.min_poll_interval
+        while deadline is None or time.monotonic() < deadline:
+            try:
+                found = self._poll()
+                self.poll_interval = (self.min_poll_interval if found
+                                      else min(self.poll_interval * 2, self.max_poll_interval))
+            except Exception as e:
+                self.last_error = str(e)
+                logger.error("Error polling UniFi events: %s", e)
+                self.poll_interval = self.max_poll_interval
+            wait = self.poll_interval
+            if deadline is not None:
+                wait = min(wait, max(deadline - time.monotonic(), 0))
+            time.sleep(wait)
+
+    def _poll(self):
+        """Fetch every doorbell event newer than its cursor; returns how many were delivered"""
+        found = 0
+        for doorbell in self.registry.doorbells():
+            for event in self._fetch_since_cursor(doorbell['mac']):
+                if self._deliver(doorbell, event):
+                    found += 1
+        return found
+
+    def _fetch_since_cursor(self, mac):
+        """Newest-first pages of events back to the doorbell's cursor, returned oldest first"""
+        cursor = self.cursors.get(mac)
+        if cursor is None:
+            # First look at this doorbell: start after its newest event, or before
+            # any event at all if it has none yet, so the first ring is delivered
+            batch = self.session.post('stat/event', {'_sort': '-time', '_limit': 1, 'mac': mac}) or []
+            self.cursors[mac] = max((event_id(event) for event in batch), default='')
+            return []
+
+        events = []
+        for page in range(self.max_pages):
+            batch = self.session.post('stat/event', {
+                '_sort': '-time',
+                '_start': page * self.page_size,
+                '_limit': self.page_size,
+                'mac': mac
+            }) or []
+            newer = [event for event in batch if event_id(event) > cursor]
+            events.extend(newer)
+            if len(newer) < len(batch) or len(batch) < self.page_size:
+                break
+        else:
+            logger.warning("More than %s new events for %s, older ones skipped", self.max_pages * self.page_size, mac)
+        events.reverse()
+        return events
+
+    def _remember(self, event, mac):
+        """Mark an event as seen and move mac's cursor past it; False if it already was"""
+        key = event_id(event)
+        if key in self._seen:
+            return False
+        self._seen[key] = True
+        if len(self._seen) > self.seen_size:
+            self._seen.popitem(last=False)
+        if key > self.cursors.get(mac, ''):
+            self.cursors[mac] = key
+        return True
+
+    def _deliver(self, doorbell, event):
+        if not self._remember(event, doorbell['mac']):
+            return False
+        if event.get('eventType', '').lower() not in self.event_types:
+            return False
+        self.events += 1
+        self.last_event_at = time.time()
+        try:
+            self.on_event(doorbell, event)
+        except Exception as e:
+            logger.error("Error handling doorbell event: %s", e)
+        return True
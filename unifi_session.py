@@ -0,0 +1,186 @@
+import logging
+import ssl
+import threading
+import time
+
+from requests.adapters import HTTPAdapter
+
+from metrics import track_upstream
+
+logger = logging.getLogger(__name__)
+
+# Metric labels for the API paths the dashboard calls, most specific first
+_OPERATIONS = (
+    ('stat/device/', 'device_command'),
+    ('stat/device', 'devices'),
+    ('stat/event', 'events'),
+    ('snapshots', 'snapshot'),
+)
+
+
+def _operation(path):
+    for prefix, operation in _OPERATIONS:
+        if path.startswith(prefix):
+            return operation
+    return 'other'
+
+
+class ControllerSession:
+    """Long-lived, thread-safe session with a UniFi controller.
+
+    Logs in once (through pyunifi, which knows the controller's URL layout)
+    and then reuses the same HTTP connection pool for every call. A new login
+    only happens when the controller answers 401, and concurrent callers that
+    hit the same expired session share a single re-login.
+    """
+
+    def __init__(self, host, username, password, port, version='UDMP-unifiOS',
+                 ssl_verify=False, timeout=10, pool_size=4, status=None):
+        self.host = host
+        self.username = username
+        self.password = password
+        self.port = port
+        self.version = version
+        self.ssl_verify = ssl_verify
+        self.timeout = timeout
+        self.pool_size = pool_size
+        self.status = status
+
+        self.logins = 0
+        self.requests = 0
+        self.errors = 0
+        self.last_latency = None
+        self.avg_latency = None
+        self.last_error = None
+        self.logged_in_at = None
+
+        self._controller = None
+        self._generation = 0
+        self._lock = threading.Lock()
+
+    def get_devices(self):
+        """List every device adopted by the controller"""
+        return self.get('stat/device')
+
+    def get(self, path, params=None):
+        return self.request('GET', path, params=params)
+
+    def post(self, path, payload=None):
+        return self.request('POST', path, payload=payload)
+
+    def request(self, method, path, params=None, payload=None):
+        """Call a site API path, logging in again once if the session expired"""
+        controller, generation = self._session()
+        attempted_at = time.time()
+        started = time.monotonic()
+        try:
+            with track_upstream('unifi', _operation(path)):
+                response = self._send(controller, method, path, params, payload)
+            if response.status_code == 401:
+                logger.info("UniFi session expired, logging in again")
+                controller, _ = self._session(expired=generation)
+                with track_upstream('unifi', _operation(path)):
+                    response = self._send(controller, method, path, params, payload)
+            response.raise_for_status()
+            result = controller._jsondec(response.text)
+        except Exception as e:
+            self._record(attempted_at, time.monotonic() - started, e)
+            raise
+        self._record(attempted_at, time.monotonic() - started)
+        return result
+
+    def open_websocket(self, path):
+        """Open a websocket under the site's wss/ path, logging in again once on 401"""
+        from websockets.exceptions import InvalidStatus
+        controller, generation = self._session()
+        try:
+            return self._connect_websocket(controller, path)
+        except InvalidStatus as e:
+            if e.response.status_code != 401:
+                raise
+            logger.info("UniFi session expired, logging in again")
+            controller, _ = self._session(expired=generation)
+            return self._connect_websocket(controller, path)
+
+    def stats(self):
+        """Health and latency figures for the readiness endpoint"""
+        return {
+            'logged_in': self._controller is not None,
+            'logged_in_at': self.logged_in_at,
+            'logins': self.logins,
+            'requests': self.requests,
+            'errors': self.errors,
+            'last_latency_ms': round(self.last_latency * 1000, 1) if self.last_latency is not None else None,
+            'avg_latency_ms': round(self.avg_latency * 1000, 1) if self.avg_latency is not None else None,
+            'last_error': self.last_error
+        }
+
+    def _send(self, controller, method, path, params, payload):
+        response = controller.session.request(
+            method,
+            controller._api_url() + path,
+            params=params,
+            json=payload,
+            headers=controller.headers,
+            # Explicit, so REQUESTS_CA_BUNDLE cannot override ssl_verify=False
+            verify=controller.session.verify,
+            timeout=self.timeout
+        )
+        if response.headers.get('X-CSRF-Token'):
+            controller.headers = {'X-CSRF-Token': response.headers['X-CSRF-Token']}
+        return response
+
+    def _connect_websocket(self, controller, path):
+        from websockets.sync.client import connect
+        url = 'wss://' + controller.url.split('://', 1)[1] + 'wss/s/' + controller.site_id + '/' + path
+        headers = dict(controller.headers or {})
+        headers['Cookie'] = '; '.join(f"{c.name}={c.value}" for c in controller.session.cookies)
+        ssl_context = ssl.create_default_context()
+        if not self.ssl_verify:
+            ssl_context.check_hostname = False
+            ssl_context.verify_mode = ssl.CERT_NONE
+        with track_upstream('unifi', 'event_stream'):
+            return connect(url, additional_headers=headers, ssl=ssl_context, open_timeout=self.timeout)
+
+    def _session(self, expired=None):
+        """Return the current controller, logging in if there is none or it expired"""
+        with self._lock:
+            if self._controller is None or self._generation == expired:
+                self._controller = self._login()
+                self._generation += 1
+            return self._controller, self._generation
+
+    def _login(self):
+        from pyunifi.controller import Controller
+        try:
+            with track_upstream('unifi', 'login'):
+                controller = Controller(
+                    host=self.host,
+                    username=self.username,
+                    password=self.password,
+                    version=self.version,
+                    port=self.port,
+                    ssl_verify=self.ssl_verify
+                )
+        except Exception as e:
+            self.errors += 1
+            self.last_error = str(e)
+            if self.status is not None:
+                self.status.record(time.time(), 0, e)
+            raise
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.pool_size)
+        controller.session.mount('https://', adapter)
+        self.logins += 1
+        self.logged_in_at = time.time()
+        logger.info("Logged in to UniFi controller at %s", self.host)
+        return controller
+
+    def _record(self, attempted_at, latency, error=None):
+        self.requests += 1
+        self.last_latency = latency
+        self.avg_latency = latency if self.avg_latency is None else 0.9 * self.avg_latency + 0.1 * latency
+        if error is not None:
+            self.errors += 1
+            self.last_error = str(error)
+        if self.status is not None:
+            self.status.record(attempted_at, latency, error)
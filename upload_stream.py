@@ -0,0 +1,102 @@
+import hashlib
+import logging
+import os
+import tempfile
+
+from werkzeug.sansio.multipart import Data, Epilogue, File, MultipartDecoder, NeedData
+
+logger = logging.getLogger(__name__)
+
+CHUNK_SIZE = 64 * 1024
+MAX_PARTS = 1000
+
+
+class UploadedFile:
+    """One file part of a streamed upload, already on disk under a temporary name"""
+
+    def __init__(self, filename):
+        self.filename = filename
+        self.path = None
+        self.sha256 = None
+        self.size = 0
+        self.error = None
+
+    def discard(self):
+        """Delete the temporary file, if it is still there"""
+        if self.path and os.path.exists(self.path):
+            try:
+                os.remove(self.path)
+            except OSError as e:
+                logger.error("Error removing temporary upload %s: %s", self.path, e)
+        self.path = None
+
+
+def stream_uploads(stream, boundary, field_name, dest_dir, extensions, max_file_size, chunk_size=CHUNK_SIZE):
+    """Write each file in a multipart body to dest_dir as it arrives.
+
+    Yields an UploadedFile per file part of ``field_name`` once that part is
+    complete: written to a temporary file in ``dest_dir`` (so it can be
+    renamed into place atomically) with its SHA-256 computed on the way.
+    Parts with another extension or larger than ``max_file_size`` are read
+    and dropped, and come back with ``error`` set and no file.
+    """
+    # Parsed data is handed over as it arrives, so the decoder's buffer only
+    # ever holds about one chunk; the cap just stops runaway part headers
+    decoder = MultipartDecoder(boundary.encode(), max_form_memory_size=16 * chunk_size, max_parts=MAX_PARTS)
+    current = None
+    handle = None
+    digest = None
+
+    def finish():
+        nonlocal handle
+        if handle is not None:
+            handle.flush()
+            os.fsync(handle.fileno())
+            handle.close()
+            handle = None
+        if current.error is None:
+            current.sha256 = digest.hexdigest()
+        else:
+            current.discard()
+        return current
+
+    try:
+        while True:
+            chunk = stream.read(chunk_size)
+            decoder.receive_data(chunk or None)
+            event = decoder.next_event()
+            while not isinstance(event, (NeedData, Epilogue)):
+                if isinstance(event, File):
+                    current = UploadedFile(event.filename)
+                    if event.name != field_name or not event.filename:
+                        current.error = 'ignored'
+                    elif not event.filename.lower().endswith(extensions):
+                        current.error = 'unsupported file type'
+                    else:
+                        fd, current.path = tempfile.mkstemp(dir=dest_dir, prefix='.upload-', suffix='.tmp')
+                        handle = os.fdopen(fd, 'wb')
+                        digest = hashlib.sha256()
+                elif isinstance(event, Data) and current is not None:
+                    if current.error is None:
+                        current.size += len(event.data)
+                        if current.size > max_file_size:
+                            current.error = 'file too large'
+                            handle.close()
+                            handle = None
+                        else:
+                            handle.write(event.data)
+                            digest.update(event.data)
+                    if not event.more_data:
+                        uploaded = finish()
+                        current = None
+                        if uploaded.error != 'ignored':
+                            yield uploaded
+                event = decoder.next_event()
+            if isinstance(event, Epilogue) or not chunk:
+                break
+    finally:
+        # Client went away or the body was malformed: leave no partial files behind
+        if handle is not None:
+            handle.close()
+        if current is not None:
+            current.discard()
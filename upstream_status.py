@@ -0,0 +1,84 @@
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime
+
+
+def _isoformat(timestamp):
+    return datetime.fromtimestamp(timestamp).isoformat() if timestamp else None
+
+
+class UpstreamStatus:
+    """Outcome of the most recent calls to one upstream service.
+
+    Updated by whatever talks to the upstream (normally a background
+    refresher), so health probes only read it and never do network I/O.
+    """
+
+    def __init__(self, name):
+        self.name = name
+        self.last_attempt = None
+        self.last_success = None
+        self.latency = None
+        self.error = None
+        self.consecutive_failures = 0
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def track(self):
+        """Time a call to the upstream and record whether it succeeded"""
+        attempted_at = time.time()
+        started = time.monotonic()
+        try:
+            yield
+        except Exception as e:
+            self.record(attempted_at, time.monotonic() - started, e)
+            raise
+        self.record(attempted_at, time.monotonic() - started)
+
+    def record(self, attempted_at, latency, error=None):
+        with self._lock:
+            self.last_attempt = attempted_at
+            self.latency = latency
+            if error is None:
+                self.last_success = attempted_at
+                self.error = None
+                self.consecutive_failures = 0
+            else:
+                self.error = str(error)
+                self.consecutive_failures += 1
+
+    def state(self):
+        """The raw figures, for another process to ``load``"""
+        with self._lock:
+            return {
+                'last_attempt': self.last_attempt,
+                'last_success': self.last_success,
+                'latency': self.latency,
+                'error': self.error,
+                'consecutive_failures': self.consecutive_failures
+            }
+
+    def load(self, state):
+        with self._lock:
+            self.last_attempt = state.get('last_attempt')
+            self.last_success = state.get('last_success')
+            self.latency = state.get('latency')
+            self.error = state.get('error')
+            self.consecutive_failures = state.get('consecutive_failures', 0)
+
+    @property
+    def ready(self):
+        """Whether the upstream has answered at least once"""
+        return self.last_success is not None
+
+    def as_dict(self):
+        with self._lock:
+            return {
+                'last_attempt': _isoformat(self.last_attempt),
+                'last_success': _isoformat(self.last_success),
+                'age': round(time.time() - self.last_success, 1) if self.last_success else None,
+                'latency_ms': round(self.latency * 1000, 1) if self.latency is not None else None,
+                'error': self.error,
+                'consecutive_failures': self.consecutive_failures
+            }